@@ -1,22 +1,56 @@
 import argparse
 import os
 
-from jamf_api import JamfSchool
-
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="")
+    parser = argparse.ArgumentParser(description="export the wifi mac (or other fields) of the devices")
     parser.add_argument('--location_id', default=os.environ.get('JAMF_LOCATION_ID'))
     parser.add_argument('--api_key', default=os.environ.get('JAMF_API_KEY'))
     parser.add_argument('--url', default=os.environ.get('JAMF_URL'))
+    parser.add_argument('--no_daemon', action="store_true", help="don't ask a running jamf daemon")
+    parser.add_argument('--format', choices=("text", "csv", "ndjson", "parquet"), default=None,
+                        help="default: from the --output extension, text (serial: mac lines) on stdout")
+    parser.add_argument('--output', default="-", help="output file, - for stdout")
+    parser.add_argument('--fields', default="serialNumber,networkInformation.WiFiMAC",
+                        help="comma separated dotted device fields")
+    parser.add_argument('--locations', default=None,
+                        help="comma separated location ids, one file per location (--output with {locationId}), "
+                             "written in parallel")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--batch_size', type=int, default=5000)
 
     args = parser.parse_args()
+    fields = [field.strip() for field in args.fields.split(",") if field.strip()]
+    format = args.format or ("text" if args.output == "-" else None)
+
+    from jamf_export import export_devices, export_locations
+
+    if not args.no_daemon and args.locations is None:
+        # a running jamf_daemon answers from its warm cache, without the client imports
+        from jamf_daemon import query, DaemonUnavailable, DaemonError
+        # only a daemon of the same tenant, what is not given on the command line comes from its credentials
+        tenant = {name: value for name, value in (("url", args.url), ("network_id", args.location_id))
+                  if value is not None}
+        try:
+            devices = query("devices", **tenant)
+        except (DaemonUnavailable, DaemonError):
+            devices = None
+        if devices is not None:
+            export_devices(devices, args.output, fields=fields, format=format, batch_size=args.batch_size)
+            exit(0)
+
     if not args.url:
         exit(parser.print_usage())
 
-    j = JamfSchool(args.location_id, args.api_key, args.url)
+    # imported after the argument parsing, --help and usage errors don't pay for the client imports
+    from jamf_api import JamfSchool
 
-    devices = j.get_device_list()
+    # only the exported fields get validated
+    j = JamfSchool(args.location_id, args.api_key, args.url, lazy_models=True)
 
-    for device in devices:
-        print(f"{device.serialNumber}: {device.networkInformation.WiFiMAC}")
+    if args.locations is not None:
+        locationIds = [int(location) for location in args.locations.split(",")]
+        export_locations(j, args.output, locationIds, fields=fields, format=format, workers=args.workers,
+                         batch_size=args.batch_size)
+    else:
+        export_devices(j.iter_devices(), args.output, fields=fields, format=format, batch_size=args.batch_size)
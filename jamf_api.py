@@ -2,40 +2,249 @@ import re
 from datetime import datetime
 from functools import reduce
 from random import random
+from time import perf_counter
 
-import keyring as keyring
-import requests as requests
 from pydantic import ValidationError
-from requests.auth import HTTPBasicAuth
 
+from jamf_codec import loads
+from jamf_credentials import resolve_credentials
+from jamf_deadline import DeadlineExceeded, current_deadline, deadlined
+from jamf_index import AppInventoryIndex
+from jamf_lazy import LAZY_MODELS
+from jamf_metrics import RequestMetrics, LoggingHook, MetricsHook, logger
+from jamf_move import LocationMove
 from jamf_objects import User, Device, DeviceGroup, Placeholder, Location, UserGroup, Profile
+from jamf_owners import OwnerAssignment, OwnerIndex, assign_owners
+from jamf_parallel import ParsePool, parse_entries
+from jamf_registry import Registries
+from jamf_schedule import ScheduleIndex
+from jamf_scheduler import RequestScheduler, SchedulerTimeout, current_priority, prioritized
+from jamf_serial import parse_serialnumber
+from jamf_transport import RequestsTransport
 
 DEBUG = True
+# (connect, read) timeout of a request in seconds
+DEFAULT_TIMEOUT = (5.0, 60.0)
+
+
+class _ApiCall(object):
+    """
+    one api call of JamfSchool.
+
+    measures the request phases, json decoding and model validation,
+    sends invalid entries to the validation error sinks
+    and passes the RequestMetrics to the hooks of the client when the call is done.
+
+        with self._api_call("devices", payload) as call:
+            r = call.get(path, params=payload)
+            devices = call.parse(Device, call.json(r).get("devices"))
+    """
+
+    def __init__(self, client, auth, endpoint: str, params: dict = None):
+        self.client = client
+        self.auth = auth
+        self.metrics = RequestMetrics(endpoint, params=params)
+        self.metrics.priority = current_priority()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_value is not None:
+            self.metrics.error = exc_value
+        self.client._emit(self.metrics)
+        return False
+
+    def request(self, method: str, path: str, **kwargs):
+        self.metrics.method = method
+        deadline = current_deadline()
+        if deadline is not None:
+            deadline.check(f"{method} {self.metrics.endpoint}")
+        scheduler = self.client.scheduler
+        if scheduler is not None:
+            try:
+                self.metrics.queue_wait += scheduler.acquire(self.metrics.priority,
+                                                             None if deadline is None else deadline.remaining())
+            except SchedulerTimeout as e:
+                if deadline is not None and deadline.expired:
+                    raise DeadlineExceeded(f"{method} {self.metrics.endpoint}: deadline of {deadline.seconds}s "
+                                           f"exceeded waiting for a request slot") from e
+                raise
+        try:
+            connect, read = self.client.request_timeout
+            if deadline is not None:
+                connect, read = deadline.limit(connect), deadline.limit(read)
+            start = perf_counter()
+            # stream, to split the time until the headers arrive from the download of the body
+            r = self.client.transport.request(method, path, auth=self.auth, stream=True, timeout=(connect, read),
+                                              **kwargs)
+            headers_received = perf_counter()
+            content = r.content
+            if deadline is not None:
+                # the read timeout holds per read only, a body which trickles in can pass the budget
+                deadline.check(f"{method} {self.metrics.endpoint}")
+        except Exception as e:
+            if deadline is not None and deadline.expired and not isinstance(e, DeadlineExceeded):
+                raise DeadlineExceeded(f"{method} {self.metrics.endpoint}: deadline of {deadline.seconds}s "
+                                       f"exceeded") from e
+            raise
+        finally:
+            if scheduler is not None:
+                scheduler.release(self.metrics.priority)
+        self.metrics.time_to_headers += headers_received - start
+        self.metrics.download_time += perf_counter() - headers_received
+        self.metrics.bytes += len(content or b"")
+        self.metrics.status = r.status_code
+        return r
+
+    def get(self, path: str, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path: str, **kwargs):
+        return self.request("PUT", path, **kwargs)
+
+    def json(self, r):
+        start = perf_counter()
+        try:
+            # straight from the bytes, see jamf_codec
+            return loads(r.content)
+        finally:
+            self.metrics.decode_time += perf_counter() - start
+
+    def parse(self, cls, entries: [dict]) -> list:
+        """
+        validate the entries of a listing, invalid entries go to the validation error sinks.
+
+        :return: the valid models, in order
+        """
+        start = perf_counter()
+        r_value = []
+        for entry, (model, error) in zip(entries, self.client._parse_entries(cls, entries)):
+            if error is not None:
+                self.validation_error(error, entry)
+            else:
+                r_value.append(model)
+        self.metrics.validation_time += perf_counter() - start
+        self.metrics.entity_count += len(r_value)
+        return r_value
+
+    def parse_one(self, cls, entry: dict):
+        """
+        validate a single entry
+
+        :return: the model or None if the entry is invalid
+        """
+        start = perf_counter()
+        try:
+            if self.client.lazy_models and cls in LAZY_MODELS:
+                model = LAZY_MODELS[cls](entry)
+            else:
+                model = cls(**entry)
+        except (TypeError, ValidationError) as e:
+            self.validation_error(e, entry)
+            return None
+        finally:
+            self.metrics.validation_time += perf_counter() - start
+        self.metrics.entity_count += 1
+        return model
 
-def parse_serialnumber(serialnumber: str):
-    if serialnumber.startswith("S"):  # remove Serialnumber preix if present.
-        serialnumber = serialnumber[1:]
-    regex = re.compile("[A-Z0-9]{12}")
-    if regex.fullmatch(serialnumber):
-        return serialnumber
-    else:
-        raise ValueError(f"given serialnumber: *{serialnumber}* is not a valid serialnumber.")
+    def index_apps(self, devices: [Device]) -> [Device]:
+        """
+        add the devices to the app_index of the client. devices which fail the validation there
+        (only LazyDevice, validated on access) go to the validation error sinks like in parse.
+
+        :return: the valid devices, in order
+        """
+        invalid = set()
+
+        def on_error(device, error):
+            invalid.add(id(device))
+            self.metrics.entity_count -= 1
+            self.validation_error(error, device.raw)
+
+        start = perf_counter()
+        self.client.app_index.update(devices, on_error=on_error)
+        if self.client.lazy_models:
+            self.metrics.validation_time += perf_counter() - start
+        if not invalid:
+            return devices
+        return [device for device in devices if id(device) not in invalid]
+
+    def validation_error(self, error, entry):
+        self.metrics.validation_errors += 1
+        self.client._validation_error(self.metrics, error, entry)
+
+
+class _StreamedListing(object):
+    """
+    iterator over the entries of a listing, validated one by one (JamfSchool.iter_devices).
+    the metrics of the call are emitted when the iterator is exhausted, closed or garbage collected.
+    """
+
+    def __init__(self, call: _ApiCall, cls, entries: [dict], on_model=None):
+        self._call = call
+        self._cls = cls
+        # reversed, pop() releases every entry after it was validated
+        self._entries = entries
+        self._entries.reverse()
+        self._on_model = on_model
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while self._entries:
+            model = self._call.parse_one(self._cls, self._entries.pop())
+            if model is not None:
+                # on_model returns False for a model which turned out to be invalid
+                if self._on_model is not None and not self._on_model(model):
+                    continue
+                return model
+        self.close()
+        raise StopIteration
+
+    def close(self):
+        if self._call is not None:
+            call, self._call = self._call, None
+            self._entries = []
+            call.__exit__(None, None, None)
+
+    def __del__(self):
+        self.close()
 
 
 class JamfSchool(object):
-    def __init__(self, network_id: str, api_pw: str, url: str):
+    def __init__(self, network_id: str, api_pw: str, url: str, parse_workers: int = None,
+                 hooks: [MetricsHook] = None, transport=None, scheduler: RequestScheduler = None,
+                 request_timeout: (float, float) = DEFAULT_TIMEOUT, lazy_models: bool = False):
         """
-        if network_id or api_pw is None, the value gets extracted from keyring
+        if network_id or api_pw is None, the value gets extracted from the env variables or keyring
+        (see jamf_credentials)
+
+        nothing is requested at initialization, the locations get loaded on first use.
+
         :param network_id:
         :param api_pw:
         :param url:
+        :param parse_workers: validate large device and user listings in this many worker processes
+                              (0 uses the cpu count, None validates in this process), the processes
+                              are started once and stopped by close()
+        :param hooks: MetricsHook objects which get the RequestMetrics of every api call
+                      and the entries which fail the validation (defaults to a LoggingHook)
+        :param transport: sends the http requests, see jamf_transport (defaults to a pooled RequestsTransport)
+        :param scheduler: RequestScheduler which orders the requests by priority (interactive before bulk),
+                          every method takes a priority keyword argument, see jamf_scheduler
+                          (None: no scheduling, the requests run right away like before)
+        :param request_timeout: (connect, read) timeout of every request in seconds, every method takes
+                                a timeout keyword argument as well, the total budget of the call
+                                (see jamf_deadline)
+        :param lazy_models: return LazyDevice / LazyUser objects, which validate a field on first access,
+                            instead of validating every device and user up front (see jamf_lazy)
         """
-        if any(elem is None for elem in (network_id, api_pw)):
-            network_id = keyring.get_password("mz-jamf", "network_id")
-            api_pw = keyring.get_password("mz-jamf", "api_pw")
-
-        if url is None:
-            url = keyring.get_password("mz-jamf", "url")
+        network_id, api_pw, url = resolve_credentials(network_id, api_pw, url)
 
         if any(elem is None for elem in (network_id, api_pw, url)):
             print("please provide an HTTPBasicAuth API key for the jamf api.")
@@ -44,31 +253,107 @@ class JamfSchool(object):
             print("or as keyring objekt from mz-jamf as network_id, api_pw and url")
             raise ValueError("not enough info to initialize. provide a network_id, api_pw and url")
 
-        self.__authObject = HTTPBasicAuth(network_id, api_pw)
+        # requests turns the tuple into HTTPBasicAuth
+        self.__authObject = (network_id, api_pw)
         # https://api.zuludesk.com/, https://apiv6.zuludesk.com/ and https://oursubdomain.jamfcloud.com/api/
         if url.endswith("/"):
             self.url = url[:-1]
         else:
             self.url = url
         self.headers = {"X-Server-Protocol-Version": "3"}
+        self.parse_workers = parse_workers
+        # worker processes of parse_workers, started on the first large listing
+        self._parse_pool = None
+        self.hooks: [MetricsHook] = [LoggingHook()] if hooks is None else list(hooks)
+        self.transport = transport if transport is not None else RequestsTransport()
+        self.scheduler = scheduler
+        self.request_timeout = request_timeout
+        self.lazy_models = lazy_models
         del api_pw
         del network_id
 
-        self.locations = self.__location_list()
+        self._locations = None
         self.users: [User] = None
         self.devices = None
+        # gets fed by every get_device_list(includeApps=True) call
+        self.app_index = AppInventoryIndex()
+        # id / name lookups of locations, groups and profiles, loaded on first use
+        self.registries = Registries(self)
+
+    def serves(self, url: str = None, network_id: str = None) -> bool:
+        """
+        the client talks to this tenant (what is None is not compared), e.g. for the jamf daemon
+        """
+        if url is not None and url.rstrip("/") != self.url:
+            return False
+        return network_id is None or f"{network_id}" == f"{self.__authObject[0]}"
+
+    def _api_call(self, endpoint: str, params: dict = None) -> _ApiCall:
+        """
+        :param endpoint: endpoint template for the metrics, e.g. devices/:udid
+        :param params: query parameters or payload of the call
+        """
+        return _ApiCall(self, self.__authObject, endpoint, params)
 
+    def _emit(self, metrics: RequestMetrics):
+        for hook in self.hooks:
+            try:
+                hook.on_request(metrics)
+            except Exception:
+                logger.exception("metrics hook %r failed", hook)
+
+    def _validation_error(self, metrics: RequestMetrics, error, entry):
+        for hook in self.hooks:
+            try:
+                hook.on_validation_error(metrics, error, entry)
+            except Exception:
+                logger.exception("metrics hook %r failed", hook)
+
+    @property
+    def locations(self) -> [Location]:
+        if self._locations is None:
+            self._locations = self.__location_list()
+        return self._locations
+
+    @locations.setter
+    def locations(self, value: [Location]):
+        self._locations = value
+        self.registries.invalidate("locations")
+
+    @prioritized
+    @deadlined
     def find_location(self, value):
-        try:
-            index = self.locations.index(value)
-        except ValueError:
+        """
+        :param value: location id, or a part of the name (case insensitive, the first location which matches)
+        """
+        location = self.registries.locations.find(value)
+        if location is None:
             print("no location found.")
-            return None
-        return self.locations[index]
+        return location
 
+    @prioritized
+    @deadlined
     def device_get_list(self):
         return self.get_device_list()
 
+    @prioritized
+    @deadlined
+    def build_app_index(self, location: str = None, groups: str = None) -> AppInventoryIndex:
+        """
+        fetch the devices including their apps and return the app inventory index.
+
+        e.g. which devices still run version 5.4 of an app:
+            j.build_app_index().devices("com.agilebits.onepassword-ios", "5.4")
+
+        :param location: Filter by location ID
+        :param groups: Filter by groupId's. Separate multiple entries with a comma
+        :return: the (incrementally updated) app_index of this instance
+        """
+        self.get_device_list(includeApps=True, location=location, groups=groups)
+        return self.app_index
+
+    @prioritized
+    @deadlined
     def get_device_udid(self, serialnumber: str):
         """
         returns first device found - in the list.
@@ -81,6 +366,8 @@ class JamfSchool(object):
         if devices is not None:
             return devices[0].UDID
 
+    @prioritized
+    @deadlined
     def get_device_list(self, includeApps: bool = None,
                         inTrash: bool = None, hasOwner: bool = None,
                         owner: int = None, managed: bool = None, supervised: bool = None,
@@ -109,29 +396,93 @@ class JamfSchool(object):
         """
         api_name = "devices"
         path = "/".join((self.url, api_name))
-        print("")
         payload = {arg_key: arg_value for arg_key, arg_value in locals().items() if arg_value is not None
                    and arg_key != "path" and arg_key != "self"}
-        r = requests.get(path, params=payload, auth=self.__authObject)
-        if r.status_code == 200:
-            # return [Device.from_json(entry) for entry in r.json().get(name)]
-            # return self.Devices.from_dict(r.json())
+        with self._api_call(api_name, payload) as call:
+            r = call.get(path, params=payload)
+            if r.status_code == 200:
+                # return [Device.from_json(entry) for entry in r.json().get(name)]
+                # return self.Devices.from_dict(r.json())
+
+                entries = call.json(r).get(api_name)
+                retrun_list = call.parse(Device, entries)
+                # return [Device.from_dict(entry) for entry in r.json().get(name)]
+                if includeApps:
+                    retrun_list = call.index_apps(retrun_list)
+                    if payload.keys() <= {"api_name", "includeApps"}:
+                        # unfiltered, devices missing here are gone (entries which failed the validation stay)
+                        self.app_index.retain(entry.get("UDID") for entry in entries or [])
+                return retrun_list
+            else:
+                raise ValueError(r.text)
 
-            retrun_list = []
-            for entry in r.json().get(api_name):
-                # print(entry)
-                try:
-                    device = Device(**entry)
-                    retrun_list.append(device)
-                except TypeError as e:
-                    print(f"{e}: {entry}")
-                except ValidationError as e:
-                    print(f"{e}: {entry}")
-            # return [Device.from_dict(entry) for entry in r.json().get(name)]
-            return retrun_list
-        else:
-            raise ValueError(r.text)
+    @prioritized
+    @deadlined
+    def iter_devices(self, **filters):
+        """
+        the device listing as iterator, for exports of large fleets.
+
+        the listing is requested right away (one call, like get_device_list), the entries get validated
+        one by one while iterating and are released after they were handed out,
+        only the models the caller keeps stay in memory.
+        the metrics of the call (with the validation) go to the hooks when the iteration is done.
+
+            for device in j.iter_devices(location=3):
+                ...
 
+        :param filters: filters of get_device_list, e.g. location=3, inTrash=False
+        :return: iterator of Device (LazyDevice with lazy_models)
+        """
+        api_name = "devices"
+        path = "/".join((self.url, api_name))
+        call = self._api_call(api_name, filters)
+        try:
+            r = call.get(path, params=filters)
+            if r.status_code != 200:
+                raise ValueError(r.text)
+            entries = call.json(r).get(api_name) or []
+        except BaseException as e:
+            call.__exit__(type(e), e, e.__traceback__)
+            raise
+        index_apps = bool(filters.get("includeApps"))
+        if index_apps and all(value is None for key, value in filters.items() if key != "includeApps"):
+            # unfiltered, devices missing here are gone
+            self.app_index.retain(entry.get("UDID") for entry in entries)
+        return _StreamedListing(call, Device, entries,
+                                on_model=(lambda device: call.index_apps([device])) if index_apps else None)
+
+    def _parse_entries(self, cls, entries: [dict]) -> [tuple]:
+        """
+        validate the entries of a listing, in worker processes if parse_workers is set.
+
+        :return: (model, None) or (None, error text) per entry, in order
+        """
+        if self.lazy_models and cls in LAZY_MODELS:
+            # validated on access, see jamf_lazy
+            return [(LAZY_MODELS[cls](entry), None) for entry in entries]
+        if self.parse_workers is None:
+            return parse_entries(cls, entries, workers=1)
+        if self._parse_pool is None:
+            self._parse_pool = ParsePool(self.parse_workers or None)
+        return parse_entries(cls, entries, pool=self._parse_pool)
+
+    def close(self):
+        """
+        stop the worker processes of parse_workers
+        """
+        pool, self._parse_pool = self._parse_pool, None
+        if pool is not None:
+            pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    @prioritized
+    @deadlined
     def get_device_details(self, serialNumber: str = None, udid: str = None, includeApps: bool = False) -> Device:
         """
         Devices - Get Details
@@ -151,15 +502,13 @@ class JamfSchool(object):
             api_endpoint_name = "devices"
             path = "/".join((self.url, api_endpoint_name, udid))
             payload = {"includeApps": includeApps}
-            r = requests.get(path, params=payload, auth=self.__authObject)
-            if r.status_code == 200:
-                try:
-                    return Device(**r.json().get("device"))
-                except NameError as e:
-                    print(f"{e} -> {udid} {serialNumber} {r.json()}")
-                except ValidationError as e:
-                    print(f"{e} -> {udid} {serialNumber} {r.json()}")
+            with self._api_call("devices/:udid", payload) as call:
+                r = call.get(path, params=payload)
+                if r.status_code == 200:
+                    return call.parse_one(Device, call.json(r).get("device"))
 
+    @prioritized
+    @deadlined
     def device_assign_new_owner(self, udid: str = None, user: str = None) -> bool:
         """
         Devices - Assign new owner
@@ -184,7 +533,8 @@ class JamfSchool(object):
             payload = {
                 "user": f"{user}"
             }
-            r = requests.put(path, json=payload, auth=self.__authObject)
+            with self._api_call("devices/:udid/owner", payload) as call:
+                r = call.put(path, json=payload)
             if r.status_code != 200:
                 # error occured
                 try:
@@ -199,6 +549,24 @@ class JamfSchool(object):
                     print(f"new owner for device: {user} -> {udid}")
                 return True
 
+    @prioritized
+    @deadlined
+    def bulk_assign_owners(self, rows: [(str, str)], workers: int = 8, index: OwnerIndex = None) -> [OwnerAssignment]:
+        """
+        assign owners by (serial, username) rows, e.g. from a handout list
+
+        devices and users get loaded once (see jamf_owners), devices which already have
+        the owner are skipped, the other assignments run concurrently.
+
+        :param rows: (serial, username) pairs
+        :param workers: assignments which run at the same time
+        :param index: preloaded jamf_owners.OwnerIndex, to reuse it for several lists
+        :return: one OwnerAssignment per row (status: assigned, unchanged, failed, unknown_device, unknown_user)
+        """
+        return assign_owners(self, rows, workers=workers, index=index)
+
+    @prioritized
+    @deadlined
     def device_groups_list(self):
         """
         DeviceGroups - List DeviceGroups
@@ -212,16 +580,18 @@ class JamfSchool(object):
         :return:
         """
         path = "/".join((self.url, "devices", "groups"))
-        r = requests.get(path, auth=self.__authObject)
         r_value: [DeviceGroup] = []
-        if r.status_code != 200:
-            print("error, cant get list of devicegroups.")
-        elif r.status_code == 200:
-            # TODO in APi Doc is DeviceGrpoups returned, but in reality its deviceGroups
-            for res in r.json()["deviceGroups"]:
-                r_value.append(DeviceGroup(**res))
+        with self._api_call("devices/groups") as call:
+            r = call.get(path)
+            if r.status_code != 200:
+                print("error, cant get list of devicegroups.")
+            elif r.status_code == 200:
+                # TODO in APi Doc is DeviceGrpoups returned, but in reality its deviceGroups
+                r_value = call.parse(DeviceGroup, call.json(r)["deviceGroups"])
         return r_value
 
+    @prioritized
+    @deadlined
     def device_add_to_group(self, groupId: int = None, udids: [str] = None):
         """
         DeviceGroups - Add devices to DeviceGroup (static only)
@@ -234,15 +604,20 @@ class JamfSchool(object):
 
         :param groupId: The DeviceGroup ID
         :param udids: Array of udids of devices to add to the device group.
-        :return:
+        :return: bool
         """
         path = "/".join((self.url, "devices", "groups", "add"))
         payload = {arg_key: arg_value for arg_key, arg_value in locals().items() if arg_value is not None
                    and arg_key != "name" and arg_key != "path" and arg_key != "self"}
-        r = requests.post(path, json=payload, auth=self.__authObject)
+        with self._api_call("devices/groups/add", payload) as call:
+            r = call.post(path, json=payload)
         if r.status_code != 200:
             print("error, cant add device to group.")
+            return False
+        return True
 
+    @prioritized
+    @deadlined
     def device_remove_from_group(self, groupId: int = None, udids: [str] = None):
         """
         DeviceGroups - Remove devices from DeviceGroup (static only)
@@ -254,16 +629,21 @@ class JamfSchool(object):
         POST https://api.zuludesk.com/devices/groups/remove
 
         :param groupId: The DeviceGroup ID
-        :param udids: Array of udids of devices to add to the device group.
-        :return:
+        :param udids: Array of udids of devices to remove from the device group.
+        :return: bool
         """
         path = "/".join((self.url, "devices", "groups", "remove"))
         payload = {arg_key: arg_value for arg_key, arg_value in locals().items() if arg_value is not None
                    and arg_key != "name" and arg_key != "path" and arg_key != "self"}
-        r = requests.post(path, json=payload, auth=self.__authObject)
+        with self._api_call("devices/groups/remove", payload) as call:
+            r = call.post(path, json=payload)
         if r.status_code != 200:
-            print("error, cant add device to group.")
+            print("error, cant remove device from group.")
+            return False
+        return True
 
+    @prioritized
+    @deadlined
     def device_create_group(self, name: str = None, locationId: int = 0, description: str = "",
                             information: str = "", collectionType: str = "none", shared: bool = False):
         """
@@ -289,29 +669,31 @@ class JamfSchool(object):
         if collectionType not in allowed_collectionTypes:
             print(f"given collection type is not in allowed range of ")
             return None
-        r = requests.post(path, json=payload, auth=self.__authObject)
+        with self._api_call("devices/groups", payload) as call:
+            r = call.post(path, json=payload)
         if r.status_code == 200:
             return r.json().get("id")
 
+    @prioritized
+    @deadlined
     def device_update_details(self, udid: str, assetTag: str = None, notes: str = None):
         if udid is not None:
             path = "/".join((self.url, "devices", udid, "details"))
             payload = {}
-            try:
+            if assetTag is not None:
                 payload.update({"assetTag": assetTag})
-            except ValueError:
-                pass
-            try:
-                payload.update({"notes", notes})
-            except ValueError:
-                pass
+            if notes is not None:
+                payload.update({"notes": notes})
             if payload:
-                r = requests.post(path, json=payload, auth=self.__authObject)
+                with self._api_call("devices/:udid/details", payload) as call:
+                    r = call.post(path, json=payload)
                 return r
             raise Exception(ValueError, "no payload set")
         else:
             raise Exception(ValueError, "no udid provided")
 
+    @prioritized
+    @deadlined
     def dep_device_list(self):
         """
         Automated_Device_Enrollment - Find a Automated Device Enrollment device
@@ -343,20 +725,22 @@ class JamfSchool(object):
 
         path = "/".join((self.url, "dep",))  # ":DMPF24PDQ1GC"))
         payload = {}
-        r = requests.get(path, headers=self.headers, auth=self.__authObject)
         r_value: [Placeholder] = []
-        if r.status_code == 200:
-            for entry in r.json().get("placeholders"):
-                r_value.append(Placeholder(**entry))
+        with self._api_call("dep") as call:
+            r = call.get(path, headers=self.headers)
+            if r.status_code == 200:
+                r_value = call.parse(Placeholder, call.json(r).get("placeholders"))
         # every time i get a 404 Error. "Not Found" -> solution is easy - add the v.3 X-Server-Proto Header
         # https://community.jamf.com/t5/jamf-school/jamf-school-zuludesk-api-endpoint-for-dep-returns-404/td-p/259810
-        elif r.status_code == 404:
+        if r.status_code == 404:
             print("error, cant communicate with the endpoint")
             print(f"{r.reason}")
         return r_value
 
+    @prioritized
+    @deadlined
     def update_dep(self, serialNumber: str, deviceName: str = None, userID: str = None, groupIds: [int] = None,
-                   profilId: int = None):
+                   profileId: int = None, profilId: int = None):
         """
         Automated_Device_Enrollment - Update Automated Device Enrollment device
 
@@ -370,18 +754,25 @@ class JamfSchool(object):
         :param deviceName: Optional Device name to set upon enrollment
         :param userID: Optional ID of the user to make the owner upon enrollment
         :param groupIds: Optional Array of group IDs to apply upon enrollment
-        :param profilId: Optional ID of the Automated Device Enrollment profile to assign to the device.
+        :param profileId: Optional ID of the Automated Device Enrollment profile to assign to the device.
                          If profileId is 0, then the placeholder will be unassigned from a profile.
-        :return:
+        :param profilId: old (misspelled) name of profileId, still accepted, sent as profileId
+        :return: bool
         """
+        if profileId is None:
+            profileId = profilId
         path = "/".join((self.url, "dep", serialNumber))  # ":DMPF24PDQ1GC"))
         payload = {arg_key: arg_value for arg_key, arg_value in locals().items() if arg_value is not None
-                   and arg_key != "name" and arg_key != "path" and arg_key != "self" and arg_key != "serialNumber"}
-        r = requests.post(path, json=payload, headers=self.headers, auth=self.__authObject)
+                   and arg_key != "name" and arg_key != "path" and arg_key != "self" and arg_key != "serialNumber"
+                   and arg_key != "profilId"}
+        with self._api_call("dep/:serial", payload) as call:
+            r = call.post(path, json=payload, headers=self.headers)
         if r.status_code == 200:
             print(f"{r.json().get('message')} for {serialNumber}")
+            return True
         elif r.status_code == 404:
             print(f"error, cant communicate with the endpoint")
+        return False
 
         # TODO Asset Tag is missing in update - and in get methodes for placeholders, but present in the UI
         # TODO location for DEP cannot be changed via API
@@ -390,6 +781,8 @@ class JamfSchool(object):
         # TODO profileName - inconsistent, everything else is done via ids and this is done via name...
         # https://ideas.jamf.com/ideas/JN-I-25819
 
+    @prioritized
+    @deadlined
     def get_dep(self, serialNumber: str) -> Placeholder:
         """
         Automated_Device_Enrollment - Find a Automated Device Enrollment device
@@ -416,14 +809,17 @@ class JamfSchool(object):
         :return:
         """
         path = "/".join((self.url, "dep", serialNumber))
-        r = requests.get(path, headers=self.headers, auth=self.__authObject)
-        if r.status_code == 200:
-            return Placeholder(**r.json()["placeholder"])
-        elif r.status_code == 404:
+        with self._api_call("dep/:serial") as call:
+            r = call.get(path, headers=self.headers)
+            if r.status_code == 200:
+                return call.parse_one(Placeholder, call.json(r)["placeholder"])
+        if r.status_code == 404:
             print(f"{r.json().get('message')} for {serialNumber}")
         else:
             print("cnat get dep placeholder, endpoint communication error.")
 
+    @prioritized
+    @deadlined
     def location_list(self):
         """
             Locations - Get a list of locations
@@ -452,16 +848,21 @@ class JamfSchool(object):
     def __location_list(self):
         path = "/".join((self.url, "locations"))
 
-        r = requests.get(path, auth=self.__authObject)
-        if r.status_code == 200:
-            try:
-                return [Location(**loc) for loc in r.json().get("locations")]
-            except:
-                print("Cant parse json to a locations list")
-                return [None]
-        else:
-            print("cannot connect to api")
+        with self._api_call("locations") as call:
+            r = call.get(path)
+            if r.status_code == 200:
+                try:
+                    locations = [Location(**loc) for loc in call.json(r).get("locations")]
+                    call.metrics.entity_count = len(locations)
+                    return locations
+                except:
+                    print("Cant parse json to a locations list")
+                    return [None]
+            else:
+                print("cannot connect to api")
 
+    @prioritized
+    @deadlined
     def user_list(self, inTrash: bool = None, hasDevice: bool = None, memberOf: str = None, locationId: str = None) -> [
         User]:
         """:arg
@@ -529,15 +930,11 @@ class JamfSchool(object):
             "locationId": f"{locationId}",
             "hasDevice": True
         }
-        r = requests.get(path, json=payload, auth=self.__authObject)
-        if r.status_code == 200:
-
-            for u in r.json().get("users"):
-                try:
-                    r_value.append(User(**u))
-                except ValidationError as e:
-                    print(f"cant convert json to user object in {u} with error {e}")
-        else:
+        with self._api_call("users", payload) as call:
+            r = call.get(path, json=payload)
+            if r.status_code == 200:
+                r_value = call.parse(User, call.json(r).get("users"))
+        if r.status_code != 200:
             print(f"ERROR: user list {r.status_code}")
             return [None]
         befor_cleanup = len(r_value)
@@ -550,6 +947,8 @@ class JamfSchool(object):
             print(f"{befor_cleanup:6} != {after_cleanup:6}")
         return r_value
 
+    @prioritized
+    @deadlined
     def get_user_group_list(self) -> [UserGroup]:
         """
         Groups - List groups
@@ -562,18 +961,17 @@ class JamfSchool(object):
         """
         path = "/".join((self.url, "users", "groups"))
         r_value: [UserGroup] = []
-        r = requests.get(path, auth=self.__authObject)
-        if r.status_code == 200:
-            for g in r.json()["groups"]:
-                try:
-                    r_value.append(UserGroup(**g))
-                except ValidationError as e:
-                    print(f"cant convert json to User Group object in {g} with error {e}")
-        else:
+        with self._api_call("users/groups") as call:
+            r = call.get(path)
+            if r.status_code == 200:
+                r_value = call.parse(UserGroup, call.json(r)["groups"])
+        if r.status_code != 200:
             print(f"ERROR: user list {r.status_code}")
             return [None]
         return r_value
 
+    @prioritized
+    @deadlined
     def create_user_group(self, name: str = None, description: str = None, locationId: int = None,
                           acl: UserGroup = None):
         """
@@ -597,7 +995,8 @@ class JamfSchool(object):
         path = "/".join((self.url, "users", "groups"))
         payload = {arg_key: arg_value for arg_key, arg_value in locals().items() if arg_value is not None
                    and arg_key != "self" and arg_key != "path"}
-        r = requests.get(path, json=payload, auth=self.__authObject)
+        with self._api_call("users/groups", payload) as call:
+            r = call.get(path, json=payload)
         if r.status_code != 200:
             e = ""
             if r.status_code in (400, 404):
@@ -640,6 +1039,8 @@ class JamfSchool(object):
 
         return f"{location_prefix}-{firstName}{lastName}".translate(spcial_char_map)
 
+    @prioritized
+    @deadlined
     def create_user(self, username: str = None,
                     password: str = None,
                     storePassword: bool = None,
@@ -740,7 +1141,9 @@ class JamfSchool(object):
                    and arg_key != "name" and arg_key != "self" and arg_key != "path"
                    and arg_key != "required_variable"}
 
-        r = requests.post(path, json=payload, auth=self.__authObject)
+        # no params for the metrics, the payload contains the password
+        with self._api_call("users") as call:
+            r = call.post(path, json=payload)
         if r.status_code == 200:
             try:
                 return username, password
@@ -753,6 +1156,8 @@ class JamfSchool(object):
             print(f'Error: {r.json().get("message")} for {username}')
             return None, None
 
+    @prioritized
+    @deadlined
     def find_similar_users(self, firstName: str = None, lastName: str = None,
                            match_any: bool = False, locationId: str = None,
                            inTrash: bool = None, hasDevice: bool = None, memberOf: str = None) -> [User]:
@@ -770,6 +1175,8 @@ class JamfSchool(object):
             # print("hallo")
             return [u for u in users if all(x in u.name for x in [firstName, lastName])]
 
+    @prioritized
+    @deadlined
     def get_profiles(self) -> [Profile]:
         """
         Profiles - Get a list of profiles
@@ -799,14 +1206,55 @@ class JamfSchool(object):
         """
         path = "/".join((self.url, "profiles"))
 
-        r = requests.get(url=path, auth=self.__authObject)
-        if r.status_code == 200:
-            try:
-                return [Profile(**entry) for entry in r.json().get("profiles")]
-            except KeyError:
-                print("profiles not found in response")
+        with self._api_call("profiles") as call:
+            r = call.get(path)
+            if r.status_code == 200:
+                try:
+                    return call.parse(Profile, call.json(r).get("profiles"))
+                except KeyError:
+                    print("profiles not found in response")
 
-    def move_device_location(self, uuid: str = None):
+    @prioritized
+    @deadlined
+    def profile_schedule(self, holidays=None) -> ScheduleIndex:
+        """
+        the time windows of all profiles as index, which profiles are active when
+
+        e.g. the profiles which are active now and when the first one changes:
+            schedule = j.profile_schedule(holidays=[(date(2024, 12, 23), date(2025, 1, 3))])
+            active = schedule.active_at(datetime.now())
+
+        :param holidays: dates or (first, last) date ranges, for the profiles with useHolidays
+        :return: jamf_schedule.ScheduleIndex
+        """
+        return ScheduleIndex(self.get_profiles() or [], holidays or [])
+
+    @prioritized
+    @deadlined
+    def device_migrate(self, udid: str, locationId: int) -> bool:
+        """
+        Devices - Move a device to another location
+
+        PUT https://api.zuludesk.com/devices/:udid/migrate
+
+        the device loses the device groups of the old location.
+
+        :param udid: device udid
+        :param locationId: id of the new location
+        :return: bool
+        """
+        path = "/".join((self.url, "devices", udid, "migrate"))
+        payload = {"location": locationId}
+        with self._api_call("devices/:udid/migrate", payload) as call:
+            r = call.put(path, json=payload)
+        if r.status_code != 200:
+            print(f"error, cant move device {udid} to location {locationId}.")
+            return False
+        return True
+
+    @prioritized
+    @deadlined
+    def move_device_location(self, uuid: str = None, locationId: int = None, group_map: dict = None):
         """
         first - move device to different mdm server via asm.
          -> because it is not possible to move them by dep profil stuff.
@@ -822,8 +1270,27 @@ class JamfSchool(object):
 
         move device to different mdm server
 
+        (moving to a different mdm server via asm is not part of the jamf api, do this before)
 
+        :param uuid: device udid
+        :param locationId: id of the new location
+        :param group_map: {old group id: new group id}, see jamf_move.LocationMove
+        :return: jamf_move.DeviceMove with the state of every step
+        """
+        return self.move_devices_location([uuid], locationId, group_map=group_map)[uuid]
 
-        :return:
+    @prioritized
+    @deadlined
+    def move_devices_location(self, udids: [str], locationId: int, group_map: dict = None, workers: int = 4,
+                              previous: dict = None) -> dict:
+        """
+        move many devices to another location (pipeline, see jamf_move)
+
+        :param udids: device udids
+        :param locationId: id of the new location
+        :param group_map: {old group id: new group id}, by default groups with the same name in the new location
+        :param workers: devices which get moved at the same time
+        :param previous: result of an earlier (partially failed) call, finished steps are skipped
+        :return: {udid: jamf_move.DeviceMove}
         """
-        pass
+        return LocationMove(self, locationId, group_map=group_map, workers=workers).run(udids, previous=previous)
@@ -0,0 +1,171 @@
+import threading
+import time
+from concurrent.futures import Future
+
+from jamf_metrics import logger
+from jamf_scheduler import priority
+
+"""
+
+micro-batching of device group membership changes
+
+automations which react to events call device_add_to_group(groupId, [udid]) one device at a time.
+the GroupMembershipBatcher collects these changes per group for a short window (or until
+max_batch changes of a group are pending) and sends one add and one remove call per group:
+
+    batcher = GroupMembershipBatcher(j, window=0.5)
+    future = batcher.add(groupId, udid)
+    batcher.remove(other_group, udid)
+    future.result()  # True once the add call of the batch succeeded
+
+an add and a remove of the same device in the same group cancel out (in either order the
+membership is the same as before), both futures get True without any api call.
+
+the futures are concurrent.futures.Future, in asyncio code use asyncio.wrap_future(future).
+close() flushes what is pending and stops the background thread.
+
+"""
+
+ADD = "add"
+REMOVE = "remove"
+
+
+class _PendingGroup(object):
+    def __init__(self):
+        self.changes = {}  # udid -> (ADD | REMOVE, [futures])
+        self.since = time.monotonic()
+
+
+class GroupMembershipBatcher(object):
+    """
+    :param client: JamfSchool instance
+    :param window: seconds a change may wait for more changes of its group
+    :param max_batch: a group gets flushed right away when this many changes are pending,
+                      also the maximum number of udids per api call
+    :param priority: priority of the flush calls (jamf_scheduler), defaults to the priority of the client calls
+    """
+
+    def __init__(self, client, window: float = 0.5, max_batch: int = 500, priority: str = None):
+        self.client = client
+        self.window = window
+        self.max_batch = max_batch
+        self.priority = priority
+        self.counters = {"changes": 0, "cancelled": 0, "calls": 0, "failed_calls": 0}
+        self._pending: {int: _PendingGroup} = {}
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="jamf-group-batcher", daemon=True)
+        self._thread.start()
+
+    def add(self, groupId: int, udid: str) -> Future:
+        return self._change(groupId, udid, ADD)
+
+    def remove(self, groupId: int, udid: str) -> Future:
+        return self._change(groupId, udid, REMOVE)
+
+    def _change(self, groupId: int, udid: str, operation: str) -> Future:
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("batcher is closed")
+            self.counters["changes"] += 1
+            group = self._pending.get(groupId)
+            if group is None:
+                group = self._pending[groupId] = _PendingGroup()
+            pending = group.changes.get(udid)
+            if pending is None:
+                group.changes[udid] = (operation, [future])
+            elif pending[0] == operation:
+                pending[1].append(future)
+            else:
+                # add + remove (or remove + add) leaves the membership as it is
+                del group.changes[udid]
+                self.counters["cancelled"] += len(pending[1]) + 1
+                for cancelled in pending[1] + [future]:
+                    cancelled.set_result(True)
+                if not group.changes:
+                    del self._pending[groupId]
+            if groupId in self._pending and len(group.changes) >= self.max_batch:
+                group.since = 0.0
+            self._condition.notify()
+        return future
+
+    def _due(self, now: float) -> [int]:
+        return [groupId for groupId, group in self._pending.items() if now - group.since >= self.window]
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    now = time.monotonic()
+                    due = self._due(now) if not self._closed else list(self._pending)
+                    if due or (self._closed and not self._pending):
+                        break
+                    if self._pending:
+                        timeout = min(group.since for group in self._pending.values()) + self.window - now
+                    else:
+                        timeout = None
+                    self._condition.wait(timeout)
+                batches = [(groupId, self._pending.pop(groupId)) for groupId in due]
+                closed = self._closed and not self._pending
+            for groupId, group in batches:
+                self._send(groupId, group)
+            if closed:
+                return
+
+    def _send(self, groupId: int, group: _PendingGroup):
+        for operation, method in ((ADD, self.client.device_add_to_group),
+                                  (REMOVE, self.client.device_remove_from_group)):
+            changes = [(udid, futures) for udid, (op, futures) in group.changes.items() if op == operation]
+            for start in range(0, len(changes), self.max_batch):
+                chunk = changes[start:start + self.max_batch]
+                try:
+                    if self.priority is not None:
+                        with priority(self.priority):
+                            result = method(groupId, [udid for udid, _ in chunk])
+                    else:
+                        result = method(groupId, [udid for udid, _ in chunk])
+                except Exception as e:
+                    logger.warning("group %s: %s of %d devices failed: %s", groupId, operation, len(chunk), e)
+                    result, error = False, e
+                else:
+                    error = None
+                self.counters["calls"] += 1
+                if not result:
+                    self.counters["failed_calls"] += 1
+                for _, futures in chunk:
+                    for future in futures:
+                        if error is not None:
+                            future.set_exception(error)
+                        else:
+                            future.set_result(bool(result))
+
+    def flush(self):
+        """
+        send everything which is pending now (doesn't wait for the calls)
+        """
+        with self._condition:
+            for group in self._pending.values():
+                group.since = 0.0
+            self._condition.notify()
+
+    def pending(self) -> int:
+        with self._condition:
+            return sum(len(group.changes) for group in self._pending.values())
+
+    def close(self, wait: bool = True):
+        """
+        flush the pending changes and stop the background thread
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if wait:
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
@@ -0,0 +1,317 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+from jamf_api import JamfSchool
+from jamf_mockserver import Fleet, MockJamfServer
+
+"""
+
+benchmark suite for JamfSchool, runs against the local MockJamfServer
+
+for every public method of JamfSchool and for the bulk paths it measures
+    throughput      calls per second and entities (returned models) per second
+    latency         p50, p99, min, max in seconds
+    peak memory     tracemalloc peak of one extra (traced) call
+
+the results are written as json, to track regressions between versions:
+
+    python jamf_bench.py --devices 5000 --repeat 5 --output bench.json
+
+the startup of the cli (python -X importtime) is measured as well, --max_import_ms
+turns it into a check which fails if importing jamf_api gets slower than the limit:
+
+    python jamf_bench.py --startup --max_import_ms 150
+
+the json decode and encode throughput (jamf_codec) is measured separately:
+
+    python jamf_bench.py --codec --devices 5000
+
+"""
+
+
+def percentile(values: [float], q: float) -> float:
+    """
+    percentile with linear interpolation, q in 0 .. 100
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def _entities(result) -> int:
+    if isinstance(result, (list, tuple, set, dict)):
+        return len(result)
+    return 0 if result is None else 1
+
+
+class Case(object):
+    def __init__(self, name: str, func, bulk: bool = False, reset=None):
+        """
+        :param name: name in the results
+        :param func: func(j, fleet, i) runs one call, i is the iteration (for unique names etc.)
+        :param bulk: bulk paths get the device count of the fleet in the results
+        :param reset: reset(j) runs before every call (not timed), e.g. clears a cache of the client
+                      which would answer the call without a request
+        """
+        self.name = name
+        self.func = func
+        self.bulk = bulk
+        self.reset = reset
+
+    def __call__(self, j: JamfSchool, fleet: Fleet, i: int):
+        if self.reset is not None:
+            self.reset(j)
+        return self.func(j, fleet, i)
+
+
+def _clear_locations(j: JamfSchool):
+    j.locations = None
+
+
+def _clear_users(j: JamfSchool):
+    j.users = None
+
+
+def _device(fleet: Fleet, i: int) -> dict:
+    return fleet.devices[i % len(fleet.devices)]
+
+
+def _group(fleet: Fleet, i: int) -> dict:
+    return fleet.device_groups[i % len(fleet.device_groups)]
+
+
+CASES = [
+    Case("get_device_list", lambda j, f, i: j.get_device_list(), bulk=True),
+    Case("get_device_list[includeApps]", lambda j, f, i: j.get_device_list(includeApps=True), bulk=True),
+    Case("get_device_list[serialnumber]", lambda j, f, i: j.get_device_list(serialnumber=_device(f, i)["serialNumber"])),
+    Case("get_device_udid", lambda j, f, i: j.get_device_udid(_device(f, i)["serialNumber"])),
+    Case("get_device_details[udid]", lambda j, f, i: j.get_device_details(udid=_device(f, i)["UDID"])),
+    Case("get_device_details[serialNumber]",
+         lambda j, f, i: j.get_device_details(serialNumber=_device(f, i)["serialNumber"])),
+    Case("build_app_index", lambda j, f, i: j.build_app_index(), bulk=True),
+    Case("device_assign_new_owner",
+         lambda j, f, i: j.device_assign_new_owner(udid=_device(f, i)["UDID"], user=f.users[i % len(f.users)]["id"])),
+    Case("device_groups_list", lambda j, f, i: j.device_groups_list()),
+    Case("device_add_to_group", lambda j, f, i: j.device_add_to_group(_group(f, i)["id"], [_device(f, i)["UDID"]])),
+    Case("device_remove_from_group",
+         lambda j, f, i: j.device_remove_from_group(_group(f, i)["id"], [_device(f, i)["UDID"]])),
+    Case("device_create_group", lambda j, f, i: j.device_create_group(name=f"bench group {time.time_ns()}")),
+    Case("device_update_details",
+         lambda j, f, i: j.device_update_details(_device(f, i)["UDID"], assetTag=f"BENCH-{i:06}")),
+    Case("dep_device_list", lambda j, f, i: j.dep_device_list(), bulk=True),
+    Case("get_dep", lambda j, f, i: j.get_dep(f.placeholders[i % len(f.placeholders)]["serialNumber"])),
+    Case("update_dep",
+         lambda j, f, i: j.update_dep(f.placeholders[i % len(f.placeholders)]["serialNumber"], deviceName=f"B{i}")),
+    Case("location_list", lambda j, f, i: j.location_list(), reset=_clear_locations),
+    Case("user_list", lambda j, f, i: j.user_list(), bulk=True),
+    Case("get_user_group_list", lambda j, f, i: j.get_user_group_list()),
+    Case("create_user_group", lambda j, f, i: j.create_user_group(name=f"bench group {time.time_ns()}", locationId=0)),
+    Case("create_user", lambda j, f, i: j.create_user(username=f"bench-{time.time_ns()}", password="123456",
+                                                      firstName="Bench", lastName="Mark", locationId="0")),
+    Case("find_similar_users", lambda j, f, i: j.find_similar_users(firstName="Anna", lastName="Koch"),
+         reset=_clear_users),
+    Case("get_profiles", lambda j, f, i: j.get_profiles()),
+]
+
+
+def run_case(j: JamfSchool, fleet: Fleet, case: Case, repeat: int = 5, warmup: int = 1) -> dict:
+    for i in range(warmup):
+        case(j, fleet, i)
+
+    latencies = []
+    entities = 0
+    wall = 0.0
+    for i in range(warmup, warmup + repeat):
+        if case.reset is not None:
+            case.reset(j)
+        call_start = time.perf_counter()
+        result = case.func(j, fleet, i)
+        latencies.append(time.perf_counter() - call_start)
+        wall += latencies[-1]
+        entities += _entities(result)
+
+    # separate traced call, tracemalloc slows the timed calls down too much
+    if case.reset is not None:
+        case.reset(j)
+    tracemalloc.start()
+    try:
+        case.func(j, fleet, warmup + repeat)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    result = {"calls": repeat,
+              "calls_per_second": repeat / wall if wall else None,
+              "entities_per_second": entities / wall if wall else None,
+              "p50": percentile(latencies, 50),
+              "p99": percentile(latencies, 99),
+              "min": min(latencies),
+              "max": max(latencies),
+              "peak_memory_bytes": peak}
+    if case.bulk:
+        result["fleet_devices"] = len(fleet.devices)
+    return result
+
+
+def measure_startup(module: str = "jamf_api", runs: int = 5, top: int = 10) -> dict:
+    """
+    import time of a module in a fresh interpreter (python -X importtime), median of the runs
+
+    :return: import_ms (cumulative import time of the module), wall_ms (whole interpreter run),
+             slowest (the top imports by cumulative time of the last run)
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    import_times, wall_times = [], []
+    imports = {}
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=here,
+                                capture_output=True, text=True, check=True)
+        wall_times.append(time.perf_counter() - start)
+        imports = {}
+        for line in result.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit():
+                imports[name.strip()] = int(cumulative)
+        import_times.append(imports.get(module, 0) / 1000)
+    slowest = sorted(((name, us / 1000) for name, us in imports.items() if name != module),
+                     key=lambda item: item[1], reverse=True)[:top]
+    return {"module": module, "runs": runs,
+            "import_ms": statistics.median(import_times),
+            "wall_ms": statistics.median(wall_times) * 1000,
+            "slowest": [{"module": name, "ms": ms} for name, ms in slowest]}
+
+
+def _best(func, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_codec_bench(devices: int = 1000, repeat: int = 3, seed: int = 0) -> dict:
+    """
+    decode throughput (MB/s) of a device listing with apps and encode throughput (devices/s) of the
+    validated devices, for every available codec of jamf_codec against the old paths
+    (Response.json() decodes a str, export built a dict per model)
+    """
+    import jamf_codec
+    from jamf_objects import Device, model_to_dict
+
+    fleet = Fleet(devices=devices, seed=seed)
+    with MockJamfServer(fleet) as server:
+        j = JamfSchool("network_id", "api_pw", server.url, hooks=[])
+        body = j.transport.request("GET", f"{server.url}/devices", auth=("network_id", "api_pw"),
+                                   params={"includeApps": True}).content
+    models = [Device(**entry) for entry in json.loads(body)["devices"]]
+    megabytes = len(body) / 1e6
+
+    decode = {"Response.json (str)": megabytes / _best(lambda: json.loads(body.decode("utf-8")), repeat)}
+    encode = {"json.dumps(model_to_dict)": len(models) / _best(
+        lambda: json.dumps([model_to_dict(model, by_alias=True) for model in models]), repeat)}
+    previous = jamf_codec.get_codec()
+    try:
+        for name in jamf_codec.available():
+            codec = jamf_codec.set_codec(name)
+            decode[name] = megabytes / _best(lambda: codec.loads(body), repeat)
+            encode[f"{name}(model_to_dict)"] = len(models) / _best(
+                lambda: codec.dumps([model_to_dict(model, by_alias=True) for model in models]), repeat)
+        encode["jamf_codec.dumps"] = len(models) / _best(lambda: jamf_codec.dumps(models), repeat)
+    finally:
+        jamf_codec.set_codec(previous)
+
+    for name, value in decode.items():
+        print(f"decode {name: <32} {value:9.1f} MB/s")
+    for name, value in encode.items():
+        print(f"encode {name: <32} {value:9.0f} devices/s")
+    return {"payload_bytes": len(body), "devices": len(models), "decode_mb_per_second": decode,
+            "encode_devices_per_second": encode}
+
+
+def run_suite(devices: int = 1000, repeat: int = 5, latency: float = 0.0, only: [str] = None,
+              parse_workers: int = None, seed: int = 0) -> dict:
+    """
+    run the benchmark cases against a fresh mock server
+
+    :param devices: fleet size
+    :param repeat: timed calls per case
+    :param latency: latency of the mock server per response
+    :param only: names of the cases to run (default all)
+    :param parse_workers: passed to JamfSchool
+    :return: results as dict (json serializable)
+    """
+    fleet = Fleet(devices=devices, seed=seed)
+    results = {}
+    with MockJamfServer(fleet, latency=latency) as server:
+        j = JamfSchool("network_id", "api_pw", server.url, parse_workers=parse_workers, hooks=[])
+        for case in CASES:
+            if only and case.name not in only:
+                continue
+            # the client prints progress messages, keep the benchmark output readable
+            with contextlib.redirect_stdout(io.StringIO()):
+                results[case.name] = run_case(j, fleet, case, repeat=repeat)
+            print(f"{case.name: <36} p50 {results[case.name]['p50'] * 1000:9.2f} ms "
+                  f"p99 {results[case.name]['p99'] * 1000:9.2f} ms "
+                  f"peak {results[case.name]['peak_memory_bytes'] / 2 ** 20:8.1f} MiB")
+
+    return {"meta": {"date": datetime.now().isoformat(timespec="seconds"), "devices": devices, "repeat": repeat,
+                     "latency": latency, "parse_workers": parse_workers, "python": platform.python_version(),
+                     "platform": platform.platform()},
+            "startup": measure_startup(),
+            "results": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark JamfSchool against a local mock server")
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--parse_workers', type=int, default=None)
+    parser.add_argument('--only', nargs="*", default=None, help="names of the cases to run")
+    parser.add_argument('--output', default="bench_output.json")
+    parser.add_argument('--startup', action="store_true", help="measure only the import time of jamf_api")
+    parser.add_argument('--codec', action="store_true", help="measure only the json decode and encode throughput")
+    parser.add_argument('--max_import_ms', type=float, default=None,
+                        help="exit with an error if importing jamf_api takes longer")
+    args = parser.parse_args()
+
+    if args.startup:
+        startup = measure_startup()
+        print(f"import jamf_api: {startup['import_ms']:.1f} ms, interpreter run {startup['wall_ms']:.1f} ms")
+        for entry in startup["slowest"]:
+            print(f"    {entry['module']: <40} {entry['ms']:8.1f} ms")
+        if args.max_import_ms is not None and startup["import_ms"] > args.max_import_ms:
+            sys.exit(f"import of jamf_api takes {startup['import_ms']:.1f} ms, limit {args.max_import_ms} ms")
+        sys.exit(0)
+
+    if args.codec:
+        codec_results = run_codec_bench(devices=args.devices, repeat=args.repeat)
+        with open(args.output, "w") as f:
+            json.dump(codec_results, f, indent=2)
+        sys.exit(0)
+
+    suite = run_suite(devices=args.devices, repeat=args.repeat, latency=args.latency, only=args.only,
+                      parse_workers=args.parse_workers)
+    with open(args.output, "w") as f:
+        json.dump(suite, f, indent=2)
+    print(f"results written to {args.output}")
@@ -0,0 +1,326 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from jamf_metrics import StatusRecorder, logger
+from jamf_scheduler import BULK, priority
+from jamf_transport import SCRUBBED_FIELDS
+
+"""
+
+checkpointed, resumable bulk jobs
+
+a bulk job is a list of Steps (one client call each, e.g. update_dep or device_assign_new_owner).
+the BulkExecutor writes every step to an append-only journal (ndjson) before it runs
+and the outcome after it ran:
+
+    {"event": "planned", "key": "...", "method": "update_dep", "args": {...}, "time": ...}
+    {"event": "done", "key": "...", "time": ...}
+    {"event": "failed", "key": "...", "error": "...", "time": ...}
+
+running the same job with the same journal again skips every step which is done,
+so a crashed or killed job continues where it stopped:
+
+    steps = [Step("update_dep", serialNumber=serial, deviceName=name) for serial, name in rows]
+    report = BulkExecutor(j, "rename.journal", workers=4, rate=5).run(steps)
+
+the steps run concurrently (workers) under a rate limit (calls per second) with the bulk priority.
+while the job runs the progress (done, failed, throughput, eta) gets logged every report_interval
+seconds and passed to on_progress.
+
+a step counts as failed if the call raises, an http call of it returns an error status,
+or the call returns False / None / (None, None). check= replaces that rule.
+
+passwords (create_user) are not written to the journal.
+
+    python jamf_bulk.py rename.journal   # status of a journal
+
+"""
+
+PLANNED = "planned"
+DONE = "done"
+FAILED = "failed"
+
+
+def _scrub(value):
+    if isinstance(value, dict):
+        return {key: "***" if key in SCRUBBED_FIELDS else _scrub(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_scrub(item) for item in value]
+    return value
+
+
+class Step(object):
+    """
+    one call of the client
+
+    :param method: name of the JamfSchool method
+    :param key: unique key of the step in the job, defaults to a hash of method and arguments
+    :param kwargs: arguments of the call
+    """
+    __slots__ = ("method", "key", "kwargs")
+
+    def __init__(self, method: str, key: str = None, **kwargs):
+        self.method = method
+        self.kwargs = kwargs
+        if key is None:
+            canonical = json.dumps([method, kwargs], sort_keys=True, default=str)
+            key = f"{method}:{hashlib.sha1(canonical.encode()).hexdigest()[:16]}"
+        self.key = key
+
+    def __repr__(self):
+        return f"Step({self.key})"
+
+
+def default_check(result, statuses: [int]) -> bool:
+    if any(status is None or status >= 400 for status in statuses):
+        return False
+    if result is None or result is False:
+        return False
+    if isinstance(result, tuple) and all(value is None for value in result):
+        return False
+    status_code = getattr(result, "status_code", None)
+    if status_code is not None and status_code >= 400:
+        return False
+    return True
+
+
+def read_journal(path: str) -> {str: dict}:
+    """
+    last state of every step in the journal
+
+    :return: {key: last record}
+    """
+    state = {}
+    if not os.path.exists(path):
+        return state
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # the last line of a killed job may be incomplete
+                continue
+            key = record.get("key")
+            if key is None:
+                continue
+            if record.get("event") == PLANNED and key in state:
+                continue
+            state[key] = record
+    return state
+
+
+class RateLimiter(object):
+    """
+    token bucket, rate calls per second, bursts up to burst calls
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+
+
+class BulkReport(object):
+    def __init__(self, total: int):
+        self.total = total
+        self.skipped = 0
+        self.done = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self.finished = None
+        self.errors = {}  # key -> error text
+        self.results = {}  # key -> return value of the call
+
+    @property
+    def processed(self) -> int:
+        return self.done + self.failed
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def throughput(self) -> float:
+        """
+        steps per second of this run (skipped steps don't count)
+        """
+        return self.processed / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def eta(self) -> float:
+        """
+        seconds until the remaining steps are done at the current throughput, None if unknown
+        """
+        remaining = self.total - self.skipped - self.processed
+        if not remaining:
+            return 0.0
+        return remaining / self.throughput if self.throughput else None
+
+    def as_dict(self) -> dict:
+        return {"total": self.total, "skipped": self.skipped, "done": self.done, "failed": self.failed,
+                "elapsed": self.elapsed, "throughput": self.throughput, "eta": self.eta}
+
+    def __repr__(self):
+        eta = "?" if self.eta is None else f"{self.eta:.0f}s"
+        return (f"{self.processed + self.skipped}/{self.total} done={self.done} failed={self.failed} "
+                f"skipped={self.skipped} {self.throughput:.1f}/s eta {eta}")
+
+
+class BulkExecutor(object):
+    """
+    :param client: JamfSchool instance
+    :param journal: path of the journal file
+    :param workers: steps which run at the same time
+    :param rate: maximum calls per second (0: no limit)
+    :param retry_failed: run steps again which failed in an earlier run of the job
+    :param check: check(result, statuses) -> bool, decides if a step succeeded
+    :param on_progress: on_progress(report) every report_interval seconds and at the end
+    :param report_interval: seconds between two progress reports
+    """
+
+    def __init__(self, client, journal: str, workers: int = 4, rate: float = 5.0, retry_failed: bool = True,
+                 check=None, on_progress=None, report_interval: float = 10.0):
+        self.client = client
+        self.journal = journal
+        self.workers = workers
+        self.limiter = RateLimiter(rate, burst=max(1, workers))
+        self.retry_failed = retry_failed
+        self.check = check or default_check
+        self.on_progress = on_progress
+        self.report_interval = report_interval
+        self._statuses = StatusRecorder()
+        self._lock = threading.Lock()
+        self._file = None
+
+    def _write(self, record: dict):
+        record["time"] = time.time()
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+            # one line per write, a killed job loses at most the step which was running
+            self._file.flush()
+
+    def _run_step(self, step: Step, report: BulkReport):
+        self.limiter.wait()
+        self._statuses.begin()
+        try:
+            with priority(BULK):
+                result = getattr(self.client, step.method)(**step.kwargs)
+            error = None
+        except Exception as e:
+            result, error = None, f"{type(e).__name__}: {e}"
+        statuses = self._statuses.end()
+        if error is None and not self.check(result, statuses):
+            error = f"call failed (http status {statuses}, result {_scrub(result)!r})"
+        with self._lock:
+            if error is None:
+                report.done += 1
+                report.results[step.key] = result
+            else:
+                report.failed += 1
+                report.errors[step.key] = error
+        if error is None:
+            self._write({"event": DONE, "key": step.key})
+        else:
+            self._write({"event": FAILED, "key": step.key, "error": error})
+
+    def _report(self, report: BulkReport):
+        logger.info("bulk job %s: %r", self.journal, report)
+        if self.on_progress is not None:
+            try:
+                self.on_progress(report)
+            except Exception:
+                logger.exception("progress callback failed")
+
+    def run(self, steps: [Step]) -> BulkReport:
+        """
+        run the steps which are not done yet according to the journal
+
+        :return: BulkReport with the counts, the errors and the results of this run
+        """
+        keys = [step.key for step in steps]
+        if len(set(keys)) != len(keys):
+            raise ValueError("the keys of the steps must be unique")
+        state = read_journal(self.journal)
+        report = BulkReport(len(steps))
+        todo = []
+        for step in steps:
+            event = state.get(step.key, {}).get("event")
+            if event == DONE or (event == FAILED and not self.retry_failed):
+                report.skipped += 1
+            else:
+                todo.append(step)
+
+        self._file = open(self.journal, "a", encoding="utf-8")
+        self.client.hooks.append(self._statuses)
+        try:
+            for step in todo:
+                if step.key not in state:
+                    self._write({"event": PLANNED, "key": step.key, "method": step.method,
+                                 "args": _scrub(step.kwargs)})
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="jamf-bulk") as executor:
+                futures = [executor.submit(self._run_step, step, report) for step in todo]
+                last_report = time.monotonic()
+                for future in futures:
+                    while True:
+                        timeout = max(0.0, last_report + self.report_interval - time.monotonic())
+                        try:
+                            future.result(timeout=timeout)
+                            break
+                        except FutureTimeout:
+                            self._report(report)
+                            last_report = time.monotonic()
+        finally:
+            self.client.hooks.remove(self._statuses)
+            self._file.close()
+            self._file = None
+        report.finished = time.monotonic()
+        self._report(report)
+        return report
+
+
+def journal_status(path: str) -> dict:
+    """
+    number of steps per state and the errors of the failed steps
+    """
+    state = read_journal(path)
+    counts = {PLANNED: 0, DONE: 0, FAILED: 0}
+    errors = {}
+    for key, record in state.items():
+        counts[record["event"]] = counts.get(record["event"], 0) + 1
+        if record["event"] == FAILED:
+            errors[key] = record.get("error")
+    return {"steps": len(state), "counts": counts, "errors": errors}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="status of a bulk job journal")
+    parser.add_argument('journal')
+    args = parser.parse_args()
+
+    status = journal_status(args.journal)
+    print(f"{status['steps']} steps: {status['counts'][DONE]} done, {status['counts'][FAILED]} failed, "
+          f"{status['counts'][PLANNED]} not run")
+    for key, error in status["errors"].items():
+        print(f"    {key}: {error}")
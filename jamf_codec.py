@@ -0,0 +1,223 @@
+import json
+from json.encoder import encode_basestring
+
+from pydantic import BaseModel
+
+from jamf_lazy import LazyModel
+from jamf_objects import Location
+
+"""
+
+json codec of the client
+
+decoding
+    loads() decodes the response bytes directly (no str in between like Response.json()),
+    with orjson if it is installed, with the json module of the standard library otherwise.
+
+encoding
+    dumps() serializes jamf_objects models (nested models, lists, the class_ -> class alias, Location,
+    LazyDevice / LazyUser) straight into the output, without a dict per object like
+    model_to_dict() / the __dict__ based LocationEncoder and UserEncoder. plain data (dicts, lists, ...)
+    goes to the codec.
+    the output is the same with every codec: non-finite floats become null (like orjson), non-str dict keys
+    are written like json.dumps does (true, false, null, numbers as text).
+
+    from jamf_codec import dumps, loads
+    with open("devices.json", "wb") as f:
+        f.write(dumps(j.get_device_list()))
+
+    set_codec("json")       # force the standard library, e.g. to compare the output
+
+python jamf_bench.py --codec compares the decode and encode throughput of the codecs.
+
+"""
+
+
+class StdlibCodec(object):
+    name = "json"
+
+    @staticmethod
+    def loads(data):
+        return json.loads(data)
+
+    @staticmethod
+    def dumps(value) -> bytes:
+        # NaN / Infinity raise ValueError, dumps() writes them as null like orjson
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"), allow_nan=False).encode("utf-8")
+
+
+class OrjsonCodec(object):
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+        self.loads = orjson.loads
+        self.dumps = orjson.dumps
+
+
+CODECS = {"orjson": OrjsonCodec, "json": StdlibCodec}
+
+_codec = None
+
+
+def available() -> [str]:
+    """
+    names of the codecs which can be used here, fastest first
+    """
+    names = []
+    for name, cls in CODECS.items():
+        try:
+            cls()
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def get_codec():
+    global _codec
+    if _codec is None:
+        try:
+            _codec = OrjsonCodec()
+        except ImportError:
+            _codec = StdlibCodec()
+    return _codec
+
+
+def set_codec(codec):
+    """
+    :param codec: name of a codec ("orjson", "json") or an object with loads(bytes) and dumps(value) -> bytes
+    """
+    global _codec
+    _codec = CODECS[codec]() if isinstance(codec, str) else codec
+    return _codec
+
+
+def loads(data):
+    """
+    :param data: json as bytes (or str)
+    """
+    return get_codec().loads(data)
+
+
+# model class -> [(attribute, '"json key":')]
+_plans = {}
+
+
+def _plan(cls) -> [(str, str)]:
+    plan = _plans.get(cls)
+    if plan is None:
+        fields = getattr(cls, "model_fields", None) or cls.__fields__
+        plan = _plans[cls] = [(name, encode_basestring(field.alias or name) + ":") for name, field in fields.items()]
+    return plan
+
+
+def _is_model(value) -> bool:
+    return isinstance(value, (BaseModel, LazyModel, Location))
+
+
+def _key(key) -> str:
+    """
+    dict key as json string, like json.dumps
+    """
+    if isinstance(key, str):
+        return encode_basestring(key)
+    if key is True:
+        return '"true"'
+    if key is False:
+        return '"false"'
+    if key is None:
+        return '"null"'
+    if isinstance(key, int):
+        return f'"{int.__repr__(key)}"'
+    if isinstance(key, float):
+        if key - key == 0:
+            return f'"{float.__repr__(key)}"'
+        return '"NaN"' if key != key else ('"Infinity"' if key > 0 else '"-Infinity"')
+    raise TypeError(f"keys must be str, int, float, bool or None, not {type(key).__name__}")
+
+
+def _write(value, out):
+    if value is None:
+        out("null")
+    elif value is True:
+        out("true")
+    elif value is False:
+        out("false")
+    else:
+        kind = type(value)
+        if kind is str:
+            out(encode_basestring(value))
+        elif kind is int:
+            out(int.__repr__(value))
+        elif kind is float:
+            # NaN and Infinity are no json
+            out(float.__repr__(value) if value - value == 0 else "null")
+        elif kind is list or kind is tuple:
+            if not value:
+                out("[]")
+                return
+            out("[")
+            first = True
+            for item in value:
+                if not first:
+                    out(",")
+                first = False
+                _write(item, out)
+            out("]")
+        elif kind is dict:
+            out("{")
+            first = True
+            for key, item in value.items():
+                if not first:
+                    out(",")
+                first = False
+                out(_key(key))
+                out(":")
+                _write(item, out)
+            out("}")
+        elif isinstance(value, BaseModel):
+            out("{")
+            first = True
+            for name, key in _plan(kind):
+                if not first:
+                    out(",")
+                first = False
+                out(key)
+                _write(getattr(value, name), out)
+            out("}")
+        elif isinstance(value, LazyModel):
+            _write(value.validate(), out)
+        elif isinstance(value, Location):
+            # like the LocationEncoder
+            _write(vars(value), out)
+        elif isinstance(value, str):
+            out(encode_basestring(value))
+        elif isinstance(value, int):
+            out(int.__repr__(value))
+        elif isinstance(value, float):
+            _write(float(value), out)
+        else:
+            raise TypeError(f"Object of type {kind.__name__} is not JSON serializable")
+
+
+def encode(value) -> bytes:
+    """
+    serialize with the model writer, handles models at any depth
+    """
+    pieces = []
+    _write(value, pieces.append)
+    return "".join(pieces).encode("utf-8")
+
+
+def dumps(value) -> bytes:
+    """
+    json bytes of models, lists of models or plain data
+    """
+    if _is_model(value) or (isinstance(value, (list, tuple)) and value and _is_model(value[0])):
+        return encode(value)
+    try:
+        return get_codec().dumps(value)
+    except (TypeError, ValueError):
+        # models deeper inside plain data, non-str keys (orjson), non-finite floats (json)
+        return encode(value)
@@ -0,0 +1,177 @@
+import json
+import os
+import stat
+import time
+
+"""
+
+credential resolution for JamfSchool
+
+order:
+    1. the given values
+    2. the env variables JAMF_LOCATION_ID, JAMF_API_KEY and JAMF_URL
+    3. the local credential cache (only if JAMF_CREDENTIAL_CACHE_TTL is set)
+    4. keyring (service mz-jamf: network_id, api_pw and url)
+
+keyring gets imported and asked only if something is still missing,
+its backend discovery (SecretService/DBus) is the slowest part of the startup.
+
+the credential cache is opt-in: JAMF_CREDENTIAL_CACHE_TTL=300 keeps the keyring values
+for 5 minutes in a file only readable by the user, so scripts which start the cli many times
+in a row ask the keyring only once.
+the file is in a private directory (XDG_RUNTIME_DIR, otherwise ~/.cache/jamf_api with mode 0700),
+never in the shared tmp directory. a cache file which is not owned by the user or readable by
+others is ignored, symlinks are not followed (posix only, elsewhere there is no cache).
+
+"""
+
+KEYRING_SERVICE = "mz-jamf"
+ENV_VARIABLES = {"network_id": "JAMF_LOCATION_ID", "api_pw": "JAMF_API_KEY", "url": "JAMF_URL"}
+CACHE_TTL_VARIABLE = "JAMF_CREDENTIAL_CACHE_TTL"
+
+
+def _private_directory(path: str) -> bool:
+    """
+    the directory is owned by the user and not accessible by others
+    """
+    try:
+        info = os.lstat(path)
+    except OSError:
+        return False
+    return stat.S_ISDIR(info.st_mode) and info.st_uid == os.getuid() and not info.st_mode & 0o077
+
+
+def private_directory() -> str:
+    """
+    directory for files of the user which others must not read or replace
+    (XDG_RUNTIME_DIR, otherwise ~/.cache/jamf_api with mode 0700), used by the daemon socket as well
+
+    :return: the directory, None if there is no private one (or not on posix)
+    """
+    if not hasattr(os, "getuid") or not hasattr(os, "O_NOFOLLOW"):
+        return None
+    directory = os.environ.get("XDG_RUNTIME_DIR")
+    if not directory or not _private_directory(directory):
+        directory = os.path.join(os.path.expanduser("~"), ".cache", "jamf_api")
+        try:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        except OSError:
+            return None
+        if not _private_directory(directory):
+            return None
+    return directory
+
+
+def _cache_path() -> str:
+    """
+    :return: path of the cache file, None if there is no private directory for it
+    """
+    directory = private_directory()
+    if directory is None:
+        return None
+    return os.path.join(directory, "jamf_api-credentials.json")
+
+
+def _cache_ttl() -> float:
+    try:
+        return float(os.environ.get(CACHE_TTL_VARIABLE) or 0)
+    except ValueError:
+        return 0.0
+
+
+def _read_cache() -> dict:
+    if _cache_ttl() <= 0:
+        return {}
+    path = _cache_path()
+    if path is None:
+        return {}
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_NOFOLLOW)
+    except OSError:
+        return {}
+    try:
+        with os.fdopen(fd, encoding="utf-8") as f:
+            info = os.fstat(f.fileno())
+            # a planted file could redirect the credentials to another url
+            if not stat.S_ISREG(info.st_mode) or info.st_uid != os.getuid() or stat.S_IMODE(info.st_mode) != 0o600:
+                return {}
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(cache, dict) or cache.get("expires", 0) < time.time():
+        return {}
+    return cache.get("credentials") or {}
+
+
+def _write_cache(credentials: dict):
+    ttl = _cache_ttl()
+    if ttl <= 0:
+        return
+    path = _cache_path()
+    if path is None:
+        return
+    temporary = f"{path}.{os.getpid()}.tmp"
+    try:
+        # new file with 0600 (the file holds the api key), renamed into place
+        fd = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW, 0o600)
+        # independent of the umask, _read_cache accepts 0600 only
+        os.fchmod(fd, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"expires": time.time() + ttl, "credentials": credentials}, f)
+        os.replace(temporary, path)
+    except OSError:
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
+
+
+def clear_cache():
+    path = _cache_path()
+    if path is None:
+        return
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _from_keyring(names: [str]) -> dict:
+    import keyring  # slow backend discovery, only when it is really needed
+    return {name: keyring.get_password(KEYRING_SERVICE, name) for name in names}
+
+
+def resolve_credentials(network_id: str = None, api_pw: str = None, url: str = None) -> (str, str, str):
+    """
+    fill the missing credentials from the env variables, the credential cache and keyring.
+
+    network_id and api_pw belong together, if one of them is missing both are taken
+    from the same source.
+
+    :return: (network_id, api_pw, url), missing values stay None
+    """
+    given = {"network_id": network_id, "api_pw": api_pw, "url": url}
+    if given["network_id"] is None or given["api_pw"] is None:
+        from_env = {name: os.environ.get(ENV_VARIABLES[name]) for name in ("network_id", "api_pw")}
+        if all(from_env.values()):
+            given.update(from_env)
+    if given["url"] is None:
+        given["url"] = os.environ.get(ENV_VARIABLES["url"]) or None
+
+    missing = [name for name in ("url",) if given[name] is None]
+    if given["network_id"] is None or given["api_pw"] is None:
+        missing = ["network_id", "api_pw"] + missing
+    if not missing:
+        return given["network_id"], given["api_pw"], given["url"]
+
+    cache = _read_cache()
+    given.update({name: cache[name] for name in missing if cache.get(name) is not None})
+    missing = [name for name in missing if given[name] is None]
+    if not missing:
+        return given["network_id"], given["api_pw"], given["url"]
+
+    from_keyring = _from_keyring(missing)
+    given.update(from_keyring)
+    if all(value is not None for value in from_keyring.values()):
+        _write_cache(dict(cache, **from_keyring))
+    return given["network_id"], given["api_pw"], given["url"]
@@ -0,0 +1,377 @@
+import argparse
+import json
+import os
+import socket
+import stat
+import sys
+import threading
+import time
+
+from jamf_credentials import private_directory
+from jamf_scheduler import BULK, priority
+
+"""
+
+resident jamf daemon
+
+holds one authenticated JamfSchool client and warm caches of the devices, users,
+device and user groups, dep placeholders and locations. the caches get refreshed
+in the background, queries are answered from memory over a unix domain socket.
+
+protocol: one json object per line, answer is one json object per line
+    {"op": "device", "serialnumber": "DMPLXXXXXXX"}
+    -> {"ok": true, "data": {...}}
+
+a request with "url" and / or "network_id" is answered only if the daemon serves this tenant,
+otherwise with an error (the cli then asks the api itself). a listing which could not be loaded
+(e.g. the api was down at the start) is an error too, never an empty list.
+
+cli tools talk to the daemon when it is running and to the api otherwise:
+
+    try:
+        devices = query("devices")
+    except DaemonUnavailable:
+        devices = ...  # JamfSchool directly
+
+the socket is in the private directory of jamf_credentials (XDG_RUNTIME_DIR or ~/.cache/jamf_api,
+never the shared tmp directory), query talks only to a socket owned by the user.
+
+the client part (query, DaemonUnavailable) only needs the standard library,
+the client imports (requests, pydantic) happen in the daemon process only.
+
+    python jamf_daemon.py serve
+    python jamf_daemon.py query device --serialnumber DMPLXXXXXXX
+
+"""
+
+SOCKET_VARIABLE = "JAMF_DAEMON_SOCKET"
+
+# seconds between the refreshes of the datasets
+REFRESH_INTERVALS = {"devices": 300, "users": 600, "device_groups": 3600, "user_groups": 3600, "dep": 900,
+                     "locations": 3600}
+
+
+class DaemonUnavailable(ConnectionError):
+    pass
+
+
+class DaemonError(Exception):
+    pass
+
+
+def socket_path() -> str:
+    """
+    :return: path of the daemon socket, None if there is no private directory for it
+    """
+    path = os.environ.get(SOCKET_VARIABLE)
+    if path:
+        return path
+    directory = private_directory()
+    if directory is None:
+        return None
+    return os.path.join(directory, f"jamf_api-{os.getuid()}.sock")
+
+
+def _owned(path: str) -> bool:
+    """
+    the path (not the target of a symlink) belongs to the user
+    """
+    try:
+        return os.lstat(path).st_uid == os.getuid()
+    except OSError:
+        return False
+
+
+def query(op: str, path: str = None, timeout: float = 30.0, **args):
+    """
+    ask the running daemon
+
+    :param op: ping, devices, device, users, user, device_groups, user_groups, dep, locations, refresh, stats
+    :param path: socket path (defaults to socket_path())
+    :param timeout: seconds for connect and answer
+    :param args: filters of the op, e.g. serialnumber, udid, location
+    :return: the data of the answer (api shaped dicts)
+    :raises DaemonUnavailable: no daemon listens on the socket
+    :raises DaemonError: the daemon answered with an error
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        raise DaemonUnavailable("unix domain sockets are not supported on this platform")
+    path = path or socket_path()
+    if path is None:
+        raise DaemonUnavailable("no private directory for the jamf daemon socket")
+    try:
+        info = os.stat(path)
+    except OSError as e:
+        raise DaemonUnavailable(f"no jamf daemon at {path}: {e}")
+    # the tenant url and network_id go to the daemon, only to a socket of the user
+    if not stat.S_ISSOCK(info.st_mode) or info.st_uid != os.getuid():
+        raise DaemonUnavailable(f"{path} is not a socket of this user, not used")
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        try:
+            sock.connect(path)
+        except OSError as e:
+            raise DaemonUnavailable(f"no jamf daemon at {path}: {e}")
+        sock.sendall(json.dumps(dict(args, op=op)).encode() + b"\n")
+        chunks = []
+        while True:
+            chunk = sock.recv(1 << 20)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            if chunk.endswith(b"\n"):
+                break
+    finally:
+        sock.close()
+    answer = json.loads(b"".join(chunks) or b"{}")
+    if not answer.get("ok"):
+        raise DaemonError(answer.get("error", "no answer"))
+    return answer.get("data")
+
+
+def _jsonable(obj):
+    if hasattr(obj, "__fields__") or hasattr(obj, "model_fields"):
+        from jamf_objects import model_to_dict
+        return model_to_dict(obj, by_alias=True)
+    if obj is None:
+        return None
+    return dict(vars(obj))
+
+
+class Dataset(object):
+    """
+    one cached listing: the entries as api shaped dicts, lookup indexes and the refresh state
+    """
+
+    def __init__(self, name: str, loader, interval: float, keys: (str,) = ()):
+        self.name = name
+        self.loader = loader
+        self.interval = interval
+        self.keys = keys
+        self.entries: [dict] = None
+        self.index = {}  # key -> {value: entry}
+        self.loaded = 0.0
+        self.error = None
+        self.lock = threading.Lock()
+
+    @property
+    def stale(self) -> bool:
+        return self.entries is None or time.time() - self.loaded >= self.interval
+
+    def refresh(self):
+        with self.lock:
+            try:
+                loaded = self.loader()
+                # the client signals some errors with None or [None]
+                if loaded is None or (loaded and all(entry is None for entry in loaded)):
+                    raise DaemonError(f"{self.name} could not be loaded")
+                entries = [_jsonable(entry) for entry in loaded if entry is not None]
+            except Exception as e:
+                # keep serving the last good data
+                self.error = f"{e}"
+                return False
+            self.index = {key: {f"{entry.get(key)}": entry for entry in entries if entry.get(key) is not None}
+                          for key in self.keys}
+            self.entries = entries
+            self.loaded = time.time()
+            self.error = None
+            return True
+
+    def get(self, key: str, value) -> dict:
+        return self.index.get(key, {}).get(f"{value}")
+
+
+class JamfDaemon(object):
+    """
+    :param client: JamfSchool instance
+    :param path: socket path
+    :param intervals: refresh interval per dataset (seconds), defaults to REFRESH_INTERVALS
+    """
+
+    def __init__(self, client, path: str = None, intervals: dict = None):
+        self.client = client
+        self.path = path or socket_path()
+        intervals = dict(REFRESH_INTERVALS, **(intervals or {}))
+        self.datasets = {
+            "devices": Dataset("devices", client.get_device_list, intervals["devices"], ("serialNumber", "UDID")),
+            "users": Dataset("users", client.user_list, intervals["users"], ("id", "username")),
+            "device_groups": Dataset("device_groups", client.device_groups_list, intervals["device_groups"],
+                                     ("id", "name")),
+            "user_groups": Dataset("user_groups", client.get_user_group_list, intervals["user_groups"],
+                                   ("id", "name")),
+            "dep": Dataset("dep", client.dep_device_list, intervals["dep"], ("serialNumber",)),
+            "locations": Dataset("locations", self._locations, intervals["locations"], ("id",)),
+        }
+        self.started = time.time()
+        self.queries = 0
+        self._stop = threading.Event()
+        self._server = None
+
+    def _locations(self):
+        self.client.locations = None
+        return self.client.locations
+
+    def dataset(self, name: str) -> Dataset:
+        """
+        :raises DaemonError: the listing could not be loaded
+        """
+        dataset = self.datasets[name]
+        if dataset.entries is None:
+            dataset.refresh()
+        if dataset.entries is None:
+            raise DaemonError(f"{name} could not be loaded: {dataset.error}")
+        return dataset
+
+    def refresh_loop(self, tick: float = 5.0):
+        while not self._stop.is_set():
+            for dataset in self.datasets.values():
+                if self._stop.is_set():
+                    break
+                if dataset.stale:
+                    with priority(BULK):
+                        dataset.refresh()
+            self._stop.wait(tick)
+
+    def handle(self, request: dict):
+        op = request.get("op")
+        self.queries += 1
+        if not self.client.serves(url=request.get("url"), network_id=request.get("network_id")):
+            raise DaemonError("the daemon serves another tenant")
+        if op == "ping":
+            return "pong"
+        if op == "stats":
+            return {"started": self.started, "queries": self.queries,
+                    "datasets": {name: {"entries": None if d.entries is None else len(d.entries),
+                                        "loaded": d.loaded, "error": d.error}
+                                 for name, d in self.datasets.items()}}
+        if op == "refresh":
+            names = [request["name"]] if request.get("name") else list(self.datasets)
+            return {name: self.datasets[name].refresh() for name in names}
+        if op == "device":
+            devices = self.dataset("devices")
+            if request.get("udid"):
+                return devices.get("UDID", request["udid"])
+            return devices.get("serialNumber", request.get("serialnumber"))
+        if op == "devices":
+            devices = self.dataset("devices").entries
+            filters = {"serialnumber": "serialNumber", "udid": "UDID", "location": "locationId",
+                       "inTrash": "inTrash"}
+            active = [(field, f"{request[name]}".lower()) for name, field in filters.items()
+                      if request.get(name) is not None]
+            return [d for d in devices if all(f"{d.get(field)}".lower() == value for field, value in active)]
+        if op == "user":
+            users = self.dataset("users")
+            if request.get("id") is not None:
+                return users.get("id", request["id"])
+            return users.get("username", request.get("username"))
+        if op == "users":
+            users = self.dataset("users").entries
+            if request.get("locationId") is not None:
+                users = [u for u in users if f"{u.get('locationId')}" == f"{request['locationId']}"]
+            return users
+        if op == "dep":
+            dep = self.dataset("dep")
+            if request.get("serialnumber"):
+                return dep.get("serialNumber", request["serialnumber"])
+            return dep.entries
+        if op in ("device_groups", "user_groups", "locations"):
+            return self.dataset(op).entries
+        raise DaemonError(f"unknown op {op}")
+
+    def serve(self, refresh: bool = True):
+        """
+        listen on the unix socket until stop() is called, blocks
+        """
+        import socketserver
+
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    if not line.strip():
+                        continue
+                    try:
+                        answer = {"ok": True, "data": daemon.handle(json.loads(line))}
+                    except Exception as e:
+                        answer = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+                    self.wfile.write(json.dumps(answer).encode() + b"\n")
+                    self.wfile.flush()
+
+        if self.path is None:
+            raise RuntimeError("no private directory for the jamf daemon socket, set JAMF_DAEMON_SOCKET")
+        if os.path.lexists(self.path):
+            if not _owned(self.path):
+                raise RuntimeError(f"{self.path} belongs to another user")
+            try:
+                query("ping", path=self.path, timeout=1.0)
+                raise RuntimeError(f"a jamf daemon is already running on {self.path}")
+            except (DaemonUnavailable, DaemonError):
+                os.remove(self.path)
+
+        self._server = socketserver.ThreadingUnixStreamServer(self.path, Handler)
+        self._server.daemon_threads = True
+        # the socket serves tenant data, only for the user
+        os.chmod(self.path, 0o600)
+        if refresh:
+            threading.Thread(target=self.refresh_loop, daemon=True).start()
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def start(self, refresh: bool = True) -> threading.Thread:
+        """
+        serve in a background thread
+        """
+        thread = threading.Thread(target=self.serve, kwargs={"refresh": refresh}, daemon=True)
+        thread.start()
+        for _ in range(100):
+            if os.path.exists(self.path):
+                break
+            time.sleep(0.01)
+        return thread
+
+    def stop(self):
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="resident jamf daemon with warm caches")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve_parser = sub.add_parser("serve")
+    serve_parser.add_argument('--location_id', default=os.environ.get('JAMF_LOCATION_ID'))
+    serve_parser.add_argument('--api_key', default=os.environ.get('JAMF_API_KEY'))
+    serve_parser.add_argument('--url', default=os.environ.get('JAMF_URL'))
+    serve_parser.add_argument('--socket', default=None)
+    query_parser = sub.add_parser("query")
+    query_parser.add_argument('op')
+    query_parser.add_argument('--socket', default=None)
+    query_parser.add_argument('--serialnumber', default=None)
+    query_parser.add_argument('--udid', default=None)
+    query_parser.add_argument('--username', default=None)
+    query_parser.add_argument('--location', default=None)
+    query_parser.add_argument('--name', default=None)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        from jamf_api import JamfSchool
+
+        jamf_daemon = JamfDaemon(JamfSchool(args.location_id, args.api_key, args.url), path=args.socket)
+        print(f"jamf daemon listening on {jamf_daemon.path}")
+        try:
+            jamf_daemon.serve()
+        except KeyboardInterrupt:
+            pass
+    else:
+        filters = {key: getattr(args, key) for key in ("serialnumber", "udid", "username", "location", "name")
+                   if getattr(args, key) is not None}
+        try:
+            print(json.dumps(query(args.op, path=args.socket, **filters), indent=2))
+        except (DaemonUnavailable, DaemonError) as e:
+            sys.exit(f"{e}")
@@ -0,0 +1,116 @@
+import contextvars
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+"""
+
+deadlines for the api calls
+
+every JamfSchool method takes a timeout keyword argument, the total time budget of the call in seconds.
+the budget holds for all requests the method makes (get_device_details(serialNumber=...) makes a
+listing and a detail request, both have to finish within the timeout):
+
+    j.get_device_details(serialNumber="DMPLXXXXXXXX", timeout=5)
+
+or for a whole block:
+
+    with deadline(30):
+        device = j.get_device_details(udid=udid)
+        j.device_update_details(udid, assetTag=...)
+
+every request of the client
+    - waits for a scheduler slot at most the remaining budget
+    - gets min(remaining budget, default) as connect and read timeout
+      (the default request_timeout of JamfSchool applies without a deadline as well)
+    - is not sent at all if the budget is used up
+an expired budget raises DeadlineExceeded. a nested deadline never extends the outer one.
+
+"""
+
+_deadline = contextvars.ContextVar("jamf_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class Deadline(object):
+    """
+    :param seconds: time budget from now
+    """
+    __slots__ = ("seconds", "expires")
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires
+
+    def check(self, what: str = "call"):
+        """
+        :raises DeadlineExceeded: the budget is used up
+        """
+        if self.expired:
+            raise DeadlineExceeded(f"{what}: deadline of {self.seconds}s exceeded")
+
+    def limit(self, seconds: float = None) -> float:
+        """
+        seconds capped to the remaining budget
+        """
+        remaining = self.remaining()
+        return remaining if seconds is None else min(seconds, remaining)
+
+    def __repr__(self):
+        return f"Deadline({self.remaining():.3f}s of {self.seconds}s left)"
+
+
+def current_deadline() -> Deadline:
+    """
+    the deadline of the running call, None without a deadline
+    """
+    return _deadline.get()
+
+
+@contextmanager
+def use(value: Deadline):
+    """
+    run the block under an existing deadline, e.g. in a worker thread
+    (threads don't inherit the deadline of the caller), None runs it without a deadline
+    """
+    token = _deadline.set(value)
+    try:
+        yield value
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def deadline(seconds: float):
+    """
+    every api call in the block has to finish within seconds
+    """
+    value = Deadline(seconds)
+    outer = _deadline.get()
+    if outer is not None and outer.expires < value.expires:
+        value = outer
+    with use(value):
+        yield value
+
+
+def deadlined(method):
+    """
+    adds the timeout keyword argument (seconds, total budget of the call) to a JamfSchool method
+    """
+    @wraps(method)
+    def wrapper(self, *args, timeout: float = None, **kwargs):
+        if timeout is None:
+            return method(self, *args, **kwargs)
+        with deadline(timeout):
+            return method(self, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,302 @@
+import hashlib
+import json
+import time
+
+from jamf_objects import model_to_dict
+
+"""
+
+snapshot diff engine
+
+a Snapshot keeps the entities of one listing (devices, users, dep placeholders,
+device or user groups) by key together with a content hash. volatile fields
+(batteryLevel, lastCheckin, ...) are not part of the hash, so a device which only
+checked in again is unchanged.
+
+diff(old, new) compares two snapshots in linear time (dict lookups by key, the
+hash decides if an entity needs a closer look) and returns typed ChangeEvents:
+
+    added, removed, changed             every kind
+    owner_changed                       Device.owner
+    groups_changed                      Device.groups, User.groupIds / groups
+    os_updated                          Device.os.version
+    location_changed                    locationId
+    moved_to_trash, restored_from_trash Device.inTrash
+    enrolled_from_dep                   a device shows up with the serial of a dep placeholder
+                                        (FleetSnapshot diff only)
+
+Device.__eq__ only compares the serialNumber, so comparing the pydantic objects
+with == doesn't show any of these changes.
+
+"""
+
+
+class ChangeType(object):
+    ADDED = "added"
+    REMOVED = "removed"
+    CHANGED = "changed"
+    OWNER_CHANGED = "owner_changed"
+    GROUPS_CHANGED = "groups_changed"
+    OS_UPDATED = "os_updated"
+    LOCATION_CHANGED = "location_changed"
+    MOVED_TO_TRASH = "moved_to_trash"
+    RESTORED_FROM_TRASH = "restored_from_trash"
+    ENROLLED_FROM_DEP = "enrolled_from_dep"
+
+
+class Kind(object):
+    """
+    the listings a snapshot can hold: key field and volatile fields (dotted for nested fields)
+    """
+    DEVICE = "device"
+    USER = "user"
+    PLACEHOLDER = "placeholder"
+    DEVICE_GROUP = "device_group"
+    USER_GROUP = "user_group"
+
+    KEYS = {DEVICE: ("UDID", "serialNumber"), USER: ("id",), PLACEHOLDER: ("serialNumber",),
+            DEVICE_GROUP: ("id",), USER_GROUP: ("id",)}
+
+    VOLATILE = {
+        DEVICE: ("batteryLevel", "availableCapacity", "lastCheckin", "modified", "IPAddress", "iCloudBackupLatest",
+                 "region", "networkInformation.IPAddress", "owner.modified", "owner.deviceCount"),
+        USER: ("modified", "deviceCount"),
+        PLACEHOLDER: ("datePushed",),
+        DEVICE_GROUP: ("members",),
+        USER_GROUP: ("userCount", "modified"),
+    }
+
+
+def as_dict(entity) -> dict:
+    if isinstance(entity, dict):
+        return entity
+    if hasattr(entity, "__fields__") or hasattr(entity, "model_fields"):
+        return model_to_dict(entity)
+    return dict(vars(entity))
+
+
+def _strip(data: dict, volatile: [tuple]) -> dict:
+    """
+    copy of data without the volatile (dotted) fields, nested dicts are only copied if needed
+    """
+    data = dict(data)
+    for path in volatile:
+        if len(path) == 1:
+            data.pop(path[0], None)
+            continue
+        nested = data.get(path[0])
+        if isinstance(nested, dict):
+            data[path[0]] = _strip(nested, [path[1:]])
+    return data
+
+
+def content_hash(data: dict, volatile: [tuple] = ()) -> str:
+    """
+    stable hash of the entity without the volatile fields
+    """
+    canonical = json.dumps(_strip(data, volatile), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(canonical.encode(), digest_size=16).hexdigest()
+
+
+class ChangeEvent(object):
+    __slots__ = ("type", "kind", "key", "old", "new", "details")
+
+    def __init__(self, type: str, kind: str, key, old: dict = None, new: dict = None, details: dict = None):
+        self.type = type
+        self.kind = kind
+        self.key = key
+        self.old = old
+        self.new = new
+        self.details = details or {}
+
+    def __repr__(self):
+        return f"{self.type} {self.kind} {self.key} {self.details}"
+
+
+class Snapshot(object):
+    """
+    :param kind: Kind.DEVICE, Kind.USER, ...
+    :param entities: models or api shaped dicts
+    :param taken: timestamp, defaults to now
+    """
+
+    def __init__(self, kind: str, entities: list, taken: float = None):
+        self.kind = kind
+        self.taken = time.time() if taken is None else taken
+        self.entities = {}  # key -> dict
+        self.hashes = {}  # key -> content hash
+        self._add(entities)
+
+    def _add(self, entities: list):
+        volatile = [tuple(field.split(".")) for field in Kind.VOLATILE.get(self.kind, ())]
+        for entity in entities or []:
+            if entity is None:
+                continue
+            data = as_dict(entity)
+            key = self._key(data)
+            if key is None:
+                continue
+            self.entities[key] = data
+            self.hashes[key] = content_hash(data, volatile)
+
+    def patched(self, upserts: list = (), removals: list = ()) -> "Snapshot":
+        """
+        copy of the snapshot with single entities replaced or removed, only those get hashed again
+        """
+        snapshot = Snapshot(self.kind, None, taken=time.time())
+        snapshot.entities = dict(self.entities)
+        snapshot.hashes = dict(self.hashes)
+        for key in removals:
+            snapshot.entities.pop(key, None)
+            snapshot.hashes.pop(key, None)
+        snapshot._add(upserts)
+        return snapshot
+
+    def key_of(self, entity):
+        """
+        key of a model or api entry in this snapshot
+        """
+        return self._key(as_dict(entity))
+
+    def _key(self, data: dict):
+        for field in Kind.KEYS[self.kind]:
+            if data.get(field) is not None:
+                return data[field]
+        return None
+
+    def __len__(self):
+        return len(self.entities)
+
+    def __contains__(self, key):
+        return key in self.entities
+
+
+def _get(data: dict, path: str):
+    for part in path.split("."):
+        if not isinstance(data, dict):
+            return None
+        data = data.get(part)
+    return data
+
+
+def _changed_fields(old: dict, new: dict, volatile: [str]) -> [str]:
+    ignored = {field for field in volatile if "." not in field}
+    return sorted(key for key in set(old) | set(new) if key not in ignored and old.get(key) != new.get(key))
+
+
+def _typed_events(kind: str, key, old: dict, new: dict) -> [ChangeEvent]:
+    events = []
+    if kind == Kind.DEVICE:
+        old_owner, new_owner = _get(old, "owner.id"), _get(new, "owner.id")
+        if old_owner != new_owner:
+            events.append(ChangeEvent(ChangeType.OWNER_CHANGED, kind, key, old, new,
+                                      {"old": old_owner, "new": new_owner,
+                                       "old_username": _get(old, "owner.username"),
+                                       "new_username": _get(new, "owner.username")}))
+        old_os, new_os = _get(old, "os.version"), _get(new, "os.version")
+        if old_os != new_os:
+            events.append(ChangeEvent(ChangeType.OS_UPDATED, kind, key, old, new, {"old": old_os, "new": new_os}))
+        if not old.get("inTrash") and new.get("inTrash"):
+            events.append(ChangeEvent(ChangeType.MOVED_TO_TRASH, kind, key, old, new))
+        elif old.get("inTrash") and not new.get("inTrash"):
+            events.append(ChangeEvent(ChangeType.RESTORED_FROM_TRASH, kind, key, old, new))
+        group_fields = ("groups",)
+    elif kind == Kind.USER:
+        group_fields = ("groupIds", "groups")
+    else:
+        group_fields = ()
+
+    for field in group_fields:
+        old_groups, new_groups = set(old.get(field) or ()), set(new.get(field) or ())
+        if old_groups != new_groups:
+            events.append(ChangeEvent(ChangeType.GROUPS_CHANGED, kind, key, old, new,
+                                      {"field": field, "added": sorted(new_groups - old_groups, key=str),
+                                       "removed": sorted(old_groups - new_groups, key=str)}))
+            break
+
+    if "locationId" in old and old.get("locationId") != new.get("locationId"):
+        events.append(ChangeEvent(ChangeType.LOCATION_CHANGED, kind, key, old, new,
+                                  {"old": old.get("locationId"), "new": new.get("locationId")}))
+    return events
+
+
+def diff(old: Snapshot, new: Snapshot, keys: list = None) -> [ChangeEvent]:
+    """
+    changes from old to new, linear in the size of both snapshots
+
+    every entity with a different content hash gets a CHANGED event (details: the changed fields)
+    followed by the typed events which apply.
+
+    :param keys: compare only these entities (e.g. the patched ones), linear in their number
+    """
+    if old.kind != new.kind:
+        raise ValueError(f"can't diff a {old.kind} snapshot with a {new.kind} snapshot")
+    kind = new.kind
+    volatile = Kind.VOLATILE.get(kind, ())
+    events = []
+    if keys is not None:
+        keys = list(dict.fromkeys(keys))
+        changed = [(key, new.hashes[key]) for key in keys if key in new.hashes]
+        removed = [key for key in keys if key in old.hashes and key not in new.hashes]
+    else:
+        changed = new.hashes.items()
+        removed = old.hashes.keys() - new.hashes.keys()
+    for key, new_hash in changed:
+        old_hash = old.hashes.get(key)
+        if old_hash is None:
+            events.append(ChangeEvent(ChangeType.ADDED, kind, key, new=new.entities[key]))
+        elif old_hash != new_hash:
+            old_entity, new_entity = old.entities[key], new.entities[key]
+            events.append(ChangeEvent(ChangeType.CHANGED, kind, key, old_entity, new_entity,
+                                      {"fields": _changed_fields(old_entity, new_entity, volatile)}))
+            events.extend(_typed_events(kind, key, old_entity, new_entity))
+    for key in removed:
+        events.append(ChangeEvent(ChangeType.REMOVED, kind, key, old=old.entities[key]))
+    return events
+
+
+class FleetSnapshot(object):
+    """
+    snapshots of all listings of a tenant, taken together
+
+    diff_fleet() additionally detects devices which were enrolled from a dep placeholder.
+    """
+    LISTINGS = {Kind.DEVICE: "get_device_list", Kind.USER: "user_list", Kind.PLACEHOLDER: "dep_device_list",
+                Kind.DEVICE_GROUP: "device_groups_list", Kind.USER_GROUP: "get_user_group_list"}
+
+    def __init__(self, snapshots: {str: Snapshot}):
+        self.snapshots = snapshots
+
+    @classmethod
+    def capture(cls, client, kinds: [str] = None) -> "FleetSnapshot":
+        """
+        take the snapshots with one listing call per kind
+
+        :param client: JamfSchool
+        :param kinds: Kind values, defaults to all
+        """
+        snapshots = {}
+        for kind in kinds or cls.LISTINGS:
+            snapshots[kind] = Snapshot(kind, getattr(client, cls.LISTINGS[kind])())
+        return cls(snapshots)
+
+    def __getitem__(self, kind: str) -> Snapshot:
+        return self.snapshots[kind]
+
+
+def diff_fleet(old: FleetSnapshot, new: FleetSnapshot) -> [ChangeEvent]:
+    events = []
+    for kind, snapshot in new.snapshots.items():
+        if kind in old.snapshots:
+            events.extend(diff(old.snapshots[kind], snapshot))
+
+    placeholders = old.snapshots.get(Kind.PLACEHOLDER)
+    if placeholders is not None:
+        for event in list(events):
+            if event.kind == Kind.DEVICE and event.type == ChangeType.ADDED:
+                serial = event.new.get("serialNumber")
+                if serial in placeholders:
+                    events.append(ChangeEvent(ChangeType.ENROLLED_FROM_DEP, Kind.DEVICE, event.key,
+                                              placeholders.entities[serial], event.new,
+                                              {"serialNumber": serial}))
+    return events
@@ -0,0 +1,233 @@
+import csv
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import get_type_hints
+
+from pydantic import BaseModel
+
+from jamf_codec import dumps
+from jamf_deadline import current_deadline, use
+from jamf_lazy import LazyModel
+from jamf_objects import Device
+from jamf_scheduler import current_priority, priority
+
+"""
+
+streaming export of device fields as csv, ndjson or parquet (for nac and inventory imports)
+
+the rows are written in batches while the devices come from the listing (j.iter_devices), the output
+is buffered. fields are dotted paths, a missing part (e.g. a device without networkInformation) gives
+an empty value instead of an AttributeError:
+
+    export_devices(j.iter_devices(), "wifi.csv", fields=("serialNumber", "networkInformation.WiFiMAC"))
+    export_devices(j.iter_devices(), "devices.ndjson", fields=("serialNumber", "owner.username", "os.version"))
+    export_devices(j.iter_devices(), "devices.parquet")         # needs pyarrow, one row group per batch
+
+    # one file per location, the locations are requested and written in parallel
+    export_locations(j, "wifi-{locationId}.csv", [1, 2, 3], workers=3)
+
+with JamfSchool(..., lazy_models=True) only the exported fields of a device get validated.
+nested values (lists, models) are written as json, parquet columns are typed by the Device annotations.
+
+"""
+
+DEFAULT_FIELDS = ("serialNumber", "networkInformation.WiFiMAC")
+BATCH_SIZE = 5000
+BUFFER_SIZE = 1 << 20
+
+FORMATS = ("text", "csv", "ndjson", "parquet")
+_EXTENSIONS = {"csv": "csv", "ndjson": "ndjson", "jsonl": "ndjson", "json": "ndjson", "parquet": "parquet",
+               "txt": "text"}
+
+
+def field_value(entity, path: str):
+    """
+    value of a dotted field of a model, lazy model or json entry, None if a part is missing
+
+        field_value(device, "networkInformation.WiFiMAC")
+    """
+    value = entity
+    for name in path.split("."):
+        if value is None:
+            return None
+        if isinstance(value, dict):
+            value = value.get(name)
+        elif isinstance(value, (BaseModel, LazyModel)):
+            # json names like class work as well as the attribute names
+            value = getattr(value, name if name != "class" else "class_", None)
+        else:
+            value = getattr(value, name, None)
+    return value
+
+
+def _cell(value):
+    """
+    scalar values stay, nested values become json (csv, text and parquet)
+    """
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return dumps(value).decode("utf-8")
+
+
+def _format(path: str, format: str = None) -> str:
+    if format is not None:
+        if format not in FORMATS:
+            raise ValueError(f"unknown format {format}, one of {', '.join(FORMATS)}")
+        return format
+    extension = path.rsplit(".", 1)[-1].lower() if "." in path else ""
+    return _EXTENSIONS.get(extension, "csv")
+
+
+def _batches(rows, size: int):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _open_text(path: str):
+    if path == "-":
+        return sys.stdout, False
+    return open(path, "w", encoding="utf-8", newline="", buffering=BUFFER_SIZE), True
+
+
+class _TextWriter(object):
+    """
+    "serial: mac" lines, the old get_wifimac.py output
+    """
+
+    def __init__(self, path: str, fields: [str]):
+        self.f, self.close_file = _open_text(path)
+
+    def write(self, rows: [list]):
+        self.f.write("".join(": ".join("" if value is None else f"{_cell(value)}" for value in row) + "\n"
+                             for row in rows))
+
+    def close(self):
+        self.f.flush()
+        if self.close_file:
+            self.f.close()
+
+
+class _CsvWriter(_TextWriter):
+    def __init__(self, path: str, fields: [str]):
+        super().__init__(path, fields)
+        self.writer = csv.writer(self.f)
+        self.writer.writerow(fields)
+
+    def write(self, rows: [list]):
+        self.writer.writerows([[_cell(value) for value in row] for row in rows])
+
+
+class _NdjsonWriter(object):
+    def __init__(self, path: str, fields: [str]):
+        self.fields = list(fields)
+        if path == "-":
+            self.f, self.close_file = sys.stdout.buffer, False
+        else:
+            self.f, self.close_file = open(path, "wb", buffering=BUFFER_SIZE), True
+
+    def write(self, rows: [list]):
+        self.f.write(b"".join(dumps(dict(zip(self.fields, row))) + b"\n" for row in rows))
+
+    def close(self):
+        self.f.flush()
+        if self.close_file:
+            self.f.close()
+
+
+def _arrow_type(path: str):
+    """
+    parquet column type of a dotted Device field, string (json) for nested and mixed values
+    """
+    import pyarrow
+    cls = Device
+    annotation = None
+    for name in path.split("."):
+        if cls is None:
+            return pyarrow.string()
+        annotation = get_type_hints(cls).get(name if name != "class" else "class_")
+        cls = annotation if isinstance(annotation, type) and issubclass(annotation, BaseModel) else None
+    return {bool: pyarrow.bool_(), int: pyarrow.int64(), float: pyarrow.float64()}.get(annotation, pyarrow.string())
+
+
+class _ParquetWriter(object):
+    def __init__(self, path: str, fields: [str]):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("the parquet export needs pyarrow (pip install pyarrow)")
+        if path == "-":
+            raise ValueError("parquet can't be written to stdout")
+        self.pyarrow = pyarrow
+        self.fields = list(fields)
+        self.schema = pyarrow.schema([(field, _arrow_type(field)) for field in self.fields])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write(self, rows: [list]):
+        columns = []
+        for index, field in enumerate(self.schema):
+            values = [row[index] for row in rows]
+            if field.type == self.pyarrow.string():
+                values = [value if value is None or isinstance(value, str) else f"{_cell(value)}" for value in values]
+            columns.append(self.pyarrow.array(values, type=field.type))
+        self.writer.write_table(self.pyarrow.Table.from_arrays(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+WRITERS = {"text": _TextWriter, "csv": _CsvWriter, "ndjson": _NdjsonWriter, "parquet": _ParquetWriter}
+
+
+def export_devices(devices, path: str, fields: [str] = DEFAULT_FIELDS, format: str = None,
+                   batch_size: int = BATCH_SIZE) -> int:
+    """
+    :param devices: iterable of Device / LazyDevice objects or json entries, e.g. j.iter_devices()
+    :param path: output file, "-" for stdout (not for parquet)
+    :param fields: dotted fields, one column each
+    :param format: text, csv, ndjson or parquet, by default from the file extension (csv otherwise)
+    :param batch_size: rows which are converted and written together (the parquet row group size)
+    :return: number of written rows
+    """
+    fields = list(fields)
+    writer = WRITERS[_format(path, format)](path, fields)
+    count = 0
+    try:
+        for batch in _batches(devices, batch_size):
+            writer.write([[field_value(device, field) for field in fields] for device in batch])
+            count += len(batch)
+    finally:
+        writer.close()
+    return count
+
+
+def export_locations(client, path: str, locationIds: [int], fields: [str] = DEFAULT_FIELDS, format: str = None,
+                     workers: int = 4, batch_size: int = BATCH_SIZE, **filters) -> {int: int}:
+    """
+    one file per location, written in parallel
+
+    :param client: JamfSchool instance
+    :param path: file name with a {locationId} placeholder, e.g. "wifi-{locationId}.csv"
+    :param locationIds: locations to export
+    :param filters: further filters of the device listing, e.g. inTrash=False
+    :return: {locationId: number of written rows}
+    """
+    if "{locationId}" not in path:
+        raise ValueError("path needs a {locationId} placeholder, e.g. wifi-{locationId}.csv")
+    # the worker threads don't inherit the priority and deadline of the caller
+    caller_priority = current_priority()
+    caller_deadline = current_deadline()
+
+    def export(locationId: int) -> int:
+        with priority(caller_priority), use(caller_deadline):
+            devices = client.iter_devices(location=locationId, **filters)
+        return export_devices(devices, path.format(locationId=locationId), fields=fields, format=format,
+                              batch_size=batch_size)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="jamf-export") as executor:
+        return dict(zip(locationIds, executor.map(export, locationIds)))
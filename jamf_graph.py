@@ -0,0 +1,192 @@
+from jamf_objects import Device, DeviceGroup, User, UserGroup
+
+"""
+
+membership graph over users, user groups, devices and device groups
+
+the relations are spread over the listings:
+    User.groupIds           user -> user groups (member)
+    User.teacherGroups      user -> user groups (teacher, by name)
+    User.children           parent -> children (ids or usernames)
+    Device.owner            device -> user
+    Device.groupIds         device -> device groups (Device.groups by name as fallback)
+
+the MembershipGraph loads the four listings once and keeps every relation as adjacency sets
+in both directions. the queries return plain sets of ids (users, user groups, device groups)
+or udids (devices), so they combine with & | -:
+
+    graph = MembershipGraph.load(j)
+    graph.devices_of_user_group(1234)                     # devices owned by members of group 1234
+    graph.devices_of_user_group(1234) & graph.trashed_devices()
+    graph.teachers_with_devices_in_trash()                # teachers whose classes contain devices in trash
+
+"""
+
+
+def _add(index: dict, key, value):
+    index.setdefault(key, set()).add(value)
+
+
+class MembershipGraph(object):
+    def __init__(self):
+        self.users: {int: User} = {}
+        self.devices: {str: Device} = {}
+        self.user_groups: {int: UserGroup} = {}
+        self.device_groups: {int: DeviceGroup} = {}
+
+        self._groups_of_user = {}  # user id -> {user group id}
+        self._members_of_group = {}  # user group id -> {user id}
+        self._taught_by = {}  # user id -> {user group id}
+        self._teachers_of_group = {}  # user group id -> {user id}
+        self._children_of = {}  # user id -> {user id}
+        self._parents_of = {}  # user id -> {user id}
+        self._devices_of_user = {}  # user id -> {udid}
+        self._owner_of = {}  # udid -> user id
+        self._groups_of_device = {}  # udid -> {device group id}
+        self._devices_of_group = {}  # device group id -> {udid}
+
+    @classmethod
+    def load(cls, client) -> "MembershipGraph":
+        """
+        build the graph with four listing calls
+        """
+        return cls.build(users=client.user_list(), devices=client.get_device_list(),
+                         user_groups=client.get_user_group_list(), device_groups=client.device_groups_list())
+
+    @classmethod
+    def build(cls, users: [User] = (), devices: [Device] = (), user_groups: [UserGroup] = (),
+              device_groups: [DeviceGroup] = ()) -> "MembershipGraph":
+        graph = cls()
+        graph.user_groups = {group.id: group for group in user_groups or [] if group is not None}
+        graph.device_groups = {group.id: group for group in device_groups or [] if group is not None}
+        graph.users = {user.id: user for user in users or [] if user is not None}
+        graph.devices = {device.UDID: device for device in devices or [] if device is not None and device.UDID}
+
+        user_group_ids = graph._name_index(graph.user_groups.values())
+        device_group_ids = graph._name_index(graph.device_groups.values())
+        usernames = {user.username: user.id for user in graph.users.values() if user.username}
+
+        for user in graph.users.values():
+            for group_id in user.groupIds or []:
+                _add(graph._groups_of_user, user.id, group_id)
+                _add(graph._members_of_group, group_id, user.id)
+            for name in user.teacherGroups or []:
+                group_id = graph._resolve(user_group_ids, name, user.locationId)
+                if group_id is not None:
+                    _add(graph._taught_by, user.id, group_id)
+                    _add(graph._teachers_of_group, group_id, user.id)
+            for child in user.children or []:
+                child_id = usernames.get(child)
+                if child_id is None and f"{child}".isdigit() and int(child) in graph.users:
+                    child_id = int(child)
+                if child_id is not None:
+                    _add(graph._children_of, user.id, child_id)
+                    _add(graph._parents_of, child_id, user.id)
+
+        for udid, device in graph.devices.items():
+            if device.owner is not None and device.owner.id:
+                graph._owner_of[udid] = device.owner.id
+                _add(graph._devices_of_user, device.owner.id, udid)
+            if device.groupIds is not None:
+                group_ids = device.groupIds
+            else:
+                group_ids = [graph._resolve(device_group_ids, name, device.locationId) for name in device.groups or []]
+            for group_id in group_ids:
+                if group_id is not None:
+                    _add(graph._groups_of_device, udid, group_id)
+                    _add(graph._devices_of_group, group_id, udid)
+        return graph
+
+    @staticmethod
+    def _name_index(groups) -> dict:
+        index = {}
+        for group in groups:
+            index[(group.locationId, group.name)] = group.id
+            index.setdefault((None, group.name), group.id)
+        return index
+
+    @staticmethod
+    def _resolve(index: dict, name: str, locationId: int):
+        group_id = index.get((locationId, name))
+        return group_id if group_id is not None else index.get((None, name))
+
+    # user groups
+
+    def members(self, *user_group_ids: int) -> {int}:
+        """
+        users which are members of any of the user groups
+        """
+        return set().union(*(self._members_of_group.get(group_id, ()) for group_id in user_group_ids))
+
+    def teachers(self, *user_group_ids: int) -> {int}:
+        return set().union(*(self._teachers_of_group.get(group_id, ()) for group_id in user_group_ids))
+
+    def groups_of_user(self, *user_ids: int) -> {int}:
+        return set().union(*(self._groups_of_user.get(user_id, ()) for user_id in user_ids))
+
+    def groups_taught_by(self, *user_ids: int) -> {int}:
+        return set().union(*(self._taught_by.get(user_id, ()) for user_id in user_ids))
+
+    def students_of(self, *teacher_ids: int) -> {int}:
+        """
+        members of the groups the teachers teach
+        """
+        return self.members(*self.groups_taught_by(*teacher_ids))
+
+    def children(self, *parent_ids: int) -> {int}:
+        return set().union(*(self._children_of.get(user_id, ()) for user_id in parent_ids))
+
+    def parents(self, *child_ids: int) -> {int}:
+        return set().union(*(self._parents_of.get(user_id, ()) for user_id in child_ids))
+
+    # devices
+
+    def devices_of(self, *user_ids: int) -> {str}:
+        """
+        udids of the devices owned by the users
+        """
+        return set().union(*(self._devices_of_user.get(user_id, ()) for user_id in user_ids))
+
+    def owner(self, udid: str) -> int:
+        return self._owner_of.get(udid)
+
+    def owners(self, udids) -> {int}:
+        return {self._owner_of[udid] for udid in udids if udid in self._owner_of}
+
+    def devices_of_user_group(self, *user_group_ids: int) -> {str}:
+        return self.devices_of(*self.members(*user_group_ids))
+
+    def devices_in_group(self, *device_group_ids: int) -> {str}:
+        return set().union(*(self._devices_of_group.get(group_id, ()) for group_id in device_group_ids))
+
+    def groups_of_device(self, *udids: str) -> {int}:
+        return set().union(*(self._groups_of_device.get(udid, ()) for udid in udids))
+
+    def user_groups_of_device(self, *udids: str) -> {int}:
+        """
+        user groups of the owners of the devices
+        """
+        return self.groups_of_user(*self.owners(udids))
+
+    # filters, e.g. graph.devices_where(lambda d: d.inTrash) & graph.devices_of_user_group(1234)
+
+    def devices_where(self, predicate) -> {str}:
+        return {udid for udid, device in self.devices.items() if predicate(device)}
+
+    def users_where(self, predicate) -> {int}:
+        return {user_id for user_id, user in self.users.items() if predicate(user)}
+
+    def trashed_devices(self) -> {str}:
+        return self.devices_where(lambda device: bool(device.inTrash))
+
+    def teachers_with_devices_in_trash(self) -> {int}:
+        """
+        teachers with at least one class (taught user group) whose members own a device in trash
+        """
+        trashed_owners = self.owners(self.trashed_devices())
+        groups = self.groups_of_user(*trashed_owners)
+        return self.teachers(*groups)
+
+    def __repr__(self):
+        return (f"MembershipGraph(users={len(self.users)}, user_groups={len(self.user_groups)}, "
+                f"devices={len(self.devices)}, device_groups={len(self.device_groups)})")
@@ -0,0 +1,369 @@
+import json
+import os
+import struct
+import time
+import zlib
+from datetime import datetime
+
+from jamf_lazy import LazyModel, lazy
+from jamf_objects import model_to_dict
+
+"""
+
+compressed history of the inventory (device listing) for audits and trend reports
+
+every append() stores only what changed since the previous snapshot: per field the devices with a new
+value, the removed devices and the fields which are gone. every keyframe_interval-th snapshot is stored
+completely (a keyframe), a point in time is rebuilt from the last keyframe before it and the deltas after
+the keyframe.
+
+the entries are flattened to dotted fields ("networkInformation.WiFiMAC", "owner.username", lists stay
+one value). each field of a frame is compressed on its own, a time series of one field decompresses
+only this field of every frame.
+
+    history = HistoryStore("inventory.history")
+    history.append(j.get_device_list())                 # daily, e.g. from cron
+    history.capture(j)                                  # the same
+
+    history.at(datetime(2024, 3, 1))                    # {udid: entry (json names)}
+    history.at(datetime(2024, 3, 1), model=Device)      # {udid: LazyDevice}
+    history.series("os.version")                        # {udid: [(timestamp, value), ...]} at the changes
+    history.series("batteryLevel", key=udid, start=..., end=...)
+    history.stats()
+
+layout (append only, a cut off last frame from a crash is dropped on the next append):
+    per frame   header   b"JHF1", kind (0 keyframe, 1 delta), timestamp (f64), meta length, body length
+                meta     zlib(json) keyframes: {"keys": [key], "missing": {field: [index of the key]}, "columns": ...}
+                                    deltas: {"removed": [key], "unset": {key: [field]}, "columns": ...}
+                                    "columns": {field: [offset, length]}
+                body     per field zlib(json) keyframes: [value per key], deltas: {key: value}
+
+"""
+
+MAGIC = b"JHF1"
+KEYFRAME = 0
+DELTA = 1
+_HEADER = struct.Struct("<4sBdII")
+
+
+class _Removed(object):
+    def __repr__(self):
+        return "REMOVED"
+
+
+# value in a time series when the entry or the field is gone
+REMOVED = _Removed()
+
+
+def flatten(entry: dict, prefix: str = "") -> dict:
+    """
+    {"os": {"version": "17.1"}} -> {"os.version": "17.1"}, lists and empty dicts stay one value
+    """
+    flat = {}
+    for name, value in entry.items():
+        if isinstance(value, dict) and value:
+            flat.update(flatten(value, f"{prefix}{name}."))
+        else:
+            flat[f"{prefix}{name}"] = value
+    return flat
+
+
+def unflatten(flat: dict) -> dict:
+    entry = {}
+    for name, value in flat.items():
+        target = entry
+        *parents, leaf = name.split(".")
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[leaf] = value
+    return entry
+
+
+def _timestamp(value) -> float:
+    if value is None:
+        return time.time()
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return float(value)
+
+
+def _entry(entity) -> dict:
+    if isinstance(entity, dict):
+        return entity
+    if isinstance(entity, LazyModel):
+        entity = entity.validate()
+    return model_to_dict(entity, by_alias=True)
+
+
+def _pack(value) -> bytes:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+class _Frame(object):
+    __slots__ = ("offset", "kind", "timestamp", "meta_length", "body_length")
+
+    def __init__(self, offset: int, kind: int, timestamp: float, meta_length: int, body_length: int):
+        self.offset = offset
+        self.kind = kind
+        self.timestamp = timestamp
+        self.meta_length = meta_length
+        self.body_length = body_length
+
+    @property
+    def size(self) -> int:
+        return _HEADER.size + self.meta_length + self.body_length
+
+
+class HistoryStore(object):
+    """
+    :param path: history file, created on the first append
+    :param key: field which identifies an entry
+    :param keyframe_interval: every n-th snapshot is stored completely, None: only the first one
+    :param level: zlib compression level
+    """
+
+    def __init__(self, path: str, key: str = "UDID", keyframe_interval: int = 50, level: int = 6):
+        self.path = path
+        self.key = key
+        self.keyframe_interval = keyframe_interval
+        self.level = level
+        self._frames: [_Frame] = []
+        self._end = 0  # end of the last complete frame
+        self._state = None  # flattened entries of the last frame, kept after append()
+        self._scan()
+
+    def _scan(self):
+        """
+        read the frame headers only
+        """
+        self._frames, self._end = [], 0
+        if not os.path.exists(self.path):
+            return
+        size = os.path.getsize(self.path)
+        with open(self.path, "rb") as f:
+            while self._end + _HEADER.size <= size:
+                f.seek(self._end)
+                magic, kind, timestamp, meta_length, body_length = _HEADER.unpack(f.read(_HEADER.size))
+                if magic != MAGIC:
+                    raise ValueError(f"{self.path} is not a history file (offset {self._end})")
+                frame = _Frame(self._end, kind, timestamp, meta_length, body_length)
+                if self._end + frame.size > size:
+                    break
+                self._frames.append(frame)
+                self._end += frame.size
+
+    def __len__(self):
+        return len(self._frames)
+
+    @property
+    def timestamps(self) -> [float]:
+        return [frame.timestamp for frame in self._frames]
+
+    def _meta(self, f, frame: _Frame) -> dict:
+        f.seek(frame.offset + _HEADER.size)
+        return json.loads(zlib.decompress(f.read(frame.meta_length)))
+
+    def _column(self, f, frame: _Frame, meta: dict, field: str) -> dict:
+        position = meta["columns"].get(field)
+        if position is None:
+            return {}
+        f.seek(frame.offset + _HEADER.size + frame.meta_length + position[0])
+        values = json.loads(zlib.decompress(f.read(position[1])))
+        if frame.kind == DELTA:
+            return values
+        # keyframes store the values in the order of the keys, without the entries which don't have the field
+        missing = set(meta["missing"].get(field, ()))
+        return {key: value for index, (key, value) in enumerate(zip(meta["keys"], values)) if index not in missing}
+
+    def _apply(self, f, frame: _Frame, state: {str: dict}) -> {str: dict}:
+        meta = self._meta(f, frame)
+        if frame.kind == KEYFRAME:
+            state = {key: {} for key in meta["keys"]}
+        else:
+            for key in meta["removed"]:
+                state.pop(key, None)
+            for key, fields in meta["unset"].items():
+                for field in fields:
+                    state[key].pop(field, None)
+        for field in meta["columns"]:
+            for key, value in self._column(f, frame, meta, field).items():
+                state.setdefault(key, {})[field] = value
+        return state
+
+    def _index(self, timestamp) -> int:
+        """
+        index of the last frame at or before the timestamp, -1 if there is none
+        """
+        timestamp = _timestamp(timestamp)
+        low, high = 0, len(self._frames)
+        while low < high:
+            middle = (low + high) // 2
+            if self._frames[middle].timestamp <= timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low - 1
+
+    def _state_at(self, index: int) -> {str: dict}:
+        start = index
+        while self._frames[start].kind != KEYFRAME:
+            start -= 1
+        state = {}
+        with open(self.path, "rb") as f:
+            for frame in self._frames[start:index + 1]:
+                state = self._apply(f, frame, state)
+        return state
+
+    def at(self, timestamp=None, model=None) -> {str: dict}:
+        """
+        :param timestamp: datetime or unix time, None: the last snapshot
+        :param model: e.g. Device, returns LazyDevice objects instead of dicts
+        :return: {key: entry} of the last snapshot at or before the timestamp, {} before the first one
+        """
+        index = len(self._frames) - 1 if timestamp is None else self._index(timestamp)
+        if index < 0:
+            return {}
+        entries = {key: unflatten(flat) for key, flat in self._state_at(index).items()}
+        if model is not None:
+            return {key: lazy(model, entry) for key, entry in entries.items()}
+        return entries
+
+    def series(self, field: str, key: str = None, start=None, end=None) -> {str: [(float, object)]}:
+        """
+        values of a field at the snapshots where they changed, REMOVED when the entry is gone or the
+        field is not set anymore
+
+        :param field: dotted field, e.g. "os.version", "networkInformation.WiFiMAC"
+        :param key: only this entry
+        :param start: first timestamp (datetime or unix time), the values at start are the first points
+        :param end: last timestamp
+        :return: {key: [(timestamp, value), ...]}
+        """
+        start = None if start is None else _timestamp(start)
+        end = None if end is None else _timestamp(end)
+        current = {}  # key -> value
+        series = {}
+        seeded = start is None
+
+        def change(timestamp: float, name: str, value):
+            old = current.get(name, REMOVED)
+            if value is REMOVED:
+                current.pop(name, None)
+            else:
+                current[name] = value
+            if old is not value and old != value and (key is None or name == key) and seeded:
+                series.setdefault(name, []).append((timestamp, value))
+
+        with open(self.path, "rb") as f:
+            for frame in self._frames:
+                if end is not None and frame.timestamp > end:
+                    break
+                if not seeded and frame.timestamp >= start:
+                    series = {name: [(start, value)] for name, value in current.items()}
+                    seeded = True
+                meta = self._meta(f, frame)
+                column = self._column(f, frame, meta, field)
+                if frame.kind == KEYFRAME:
+                    for name in list(current):
+                        if name not in column:
+                            change(frame.timestamp, name, REMOVED)
+                else:
+                    for name in meta["removed"]:
+                        change(frame.timestamp, name, REMOVED)
+                    for name, fields in meta["unset"].items():
+                        if field in fields:
+                            change(frame.timestamp, name, REMOVED)
+                for name, value in column.items():
+                    change(frame.timestamp, name, value)
+        if not seeded:
+            series = {name: [(start, value)] for name, value in current.items()}
+        if key is not None:
+            return {key: series.get(key, [])}
+        return series
+
+    def append(self, entities, timestamp=None) -> dict:
+        """
+        :param entities: models, lazy models or json entries of one snapshot
+        :param timestamp: datetime or unix time of the snapshot, default: now
+        :return: stats of the frame
+        """
+        timestamp = _timestamp(timestamp)
+        if self._frames and timestamp < self._frames[-1].timestamp:
+            raise ValueError(f"snapshot at {timestamp} is older than the last one ({self._frames[-1].timestamp})")
+        state = {}
+        for entity in entities:
+            if entity is None:
+                continue
+            flat = flatten(_entry(entity))
+            state[f"{flat[self.key]}"] = flat
+
+        keyframe = not self._frames or (self.keyframe_interval is not None and
+                                         len(self._frames) - self._last_keyframe() >= self.keyframe_interval)
+        columns = {}
+        if keyframe:
+            meta = {"keys": list(state), "missing": {}}
+            fields = {}
+            for flat in state.values():
+                fields.update(dict.fromkeys(flat))
+            for field in fields:
+                columns[field] = [flat.get(field) for flat in state.values()]
+                missing = [index for index, flat in enumerate(state.values()) if field not in flat]
+                if missing:
+                    meta["missing"][field] = missing
+        else:
+            previous = self._state if self._state is not None else self._state_at(len(self._frames) - 1)
+            meta = {"removed": [name for name in previous if name not in state], "unset": {}}
+            for name, flat in state.items():
+                old = previous.get(name, {})
+                for field, value in flat.items():
+                    if field not in old or old[field] != value or type(old[field]) is not type(value):
+                        columns.setdefault(field, {})[name] = value
+                unset = [field for field in old if field not in flat]
+                if unset:
+                    meta["unset"][name] = unset
+
+        body, positions = [], {}
+        offset = 0
+        for field, values in columns.items():
+            data = zlib.compress(_pack(values), self.level)
+            positions[field] = [offset, len(data)]
+            body.append(data)
+            offset += len(data)
+        meta["columns"] = positions
+        meta_data = zlib.compress(_pack(meta), self.level)
+        frame = _Frame(self._end, KEYFRAME if keyframe else DELTA, timestamp, len(meta_data), offset)
+
+        with open(self.path, "ab") as f:
+            # drop a frame which was cut off
+            f.truncate(self._end)
+            f.write(_HEADER.pack(MAGIC, frame.kind, timestamp, frame.meta_length, frame.body_length) + meta_data +
+                    b"".join(body))
+            f.flush()
+            os.fsync(f.fileno())
+        self._frames.append(frame)
+        self._end += frame.size
+        self._state = state
+        return {"timestamp": timestamp, "keyframe": keyframe, "entries": len(state), "fields": len(columns),
+                "changes": sum(map(len, columns.values())), "bytes": frame.size}
+
+    def capture(self, client, timestamp=None) -> dict:
+        """
+        append the current device listing of the client
+        """
+        return self.append(client.get_device_list() or [], timestamp=timestamp)
+
+    def _last_keyframe(self) -> int:
+        for index in range(len(self._frames) - 1, -1, -1):
+            if self._frames[index].kind == KEYFRAME:
+                return index
+        return -1
+
+    def stats(self) -> dict:
+        return {"frames": len(self._frames),
+                "keyframes": sum(frame.kind == KEYFRAME for frame in self._frames),
+                "bytes": self._end,
+                "first": self._frames[0].timestamp if self._frames else None,
+                "last": self._frames[-1].timestamp if self._frames else None}
+
+    def __repr__(self):
+        return f"HistoryStore({self.path}, {len(self._frames)} snapshots)"
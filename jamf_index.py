@@ -0,0 +1,255 @@
+from collections import Counter
+
+from pydantic import ValidationError
+
+from jamf_objects import Device
+
+"""
+
+App inventory index
+
+inverted index over the installed apps of the devices,
+keyed by App.identifier and (App.identifier, App.version).
+every key points to a posting list (set of device UDIDs),
+so questions like "which devices still run version 5.4 of app X"
+are a dict lookup instead of a scan over every Device.apps.
+
+the posting lists are plain python sets, so they can be combined with
+& (intersection), | (union) and - (difference).
+
+the index gets updated incrementally, feed every device listing
+(get_device_list(includeApps=True)) into update().
+a device that shows up again replaces its old postings.
+an unfiltered listing is complete, retain() drops the devices which are no longer in it
+(deleted or moved out of the tenant), get_device_list / iter_devices do that on their own.
+
+"""
+
+
+class AppInventoryIndex(object):
+    def __init__(self, devices: [Device] = None):
+        self._by_app: {str: set} = {}  # identifier -> {udid}
+        self._by_version: {str: {str: set}} = {}  # identifier -> version -> {udid}
+        self._apps_of: {str: set} = {}  # udid -> {(identifier, version)}
+        self._location_of: {str: int} = {}  # udid -> locationId
+        self._by_location: {int: set} = {}  # locationId -> {udid}
+        self._by_group: {str: set} = {}  # group name -> {udid}
+        self._groups_of: {str: set} = {}  # udid -> {group name}
+        if devices is not None:
+            self.update(devices)
+
+    def __len__(self):
+        return len(self._apps_of)
+
+    def __contains__(self, udid: str):
+        return udid in self._apps_of
+
+    def update(self, devices: [Device], on_error=None):
+        """
+        add the devices of a listing to the index.
+        devices without an app list (includeApps not set) are skipped,
+        otherwise a device without apps would look like all apps got removed.
+
+        LazyDevice objects get their fields validated here, a device which fails is skipped
+        and handed to on_error (raised without on_error).
+
+        :param devices: list of Device (or LazyDevice) objects
+        :param on_error: called with (device, ValidationError) for every invalid device
+        :return: number of indexed devices
+        """
+        count = 0
+        for device in devices:
+            try:
+                if device is None or device.UDID is None or device.apps is None:
+                    continue
+                self.add_device(device)
+            except ValidationError as e:
+                if on_error is None:
+                    raise
+                on_error(device, e)
+                continue
+            count += 1
+        return count
+
+    def retain(self, udids: {str}) -> int:
+        """
+        drop every indexed device which is not in udids (the UDIDs of a complete listing)
+
+        :param udids: UDIDs of all devices of the tenant
+        :return: number of dropped devices
+        """
+        udids = set(udids)
+        gone = [udid for udid in self._apps_of if udid not in udids]
+        for udid in gone:
+            self.remove_device(udid)
+        return len(gone)
+
+    def add_device(self, device: Device):
+        """
+        (re)index a single device, old postings of the device get replaced.
+
+        :param device:
+        :return:
+        """
+        # read every field first, an invalid LazyDevice must not leave half of its postings
+        udid = device.UDID
+        apps = {(app.identifier, app.version) for app in device.apps or [] if app.identifier is not None}
+        locationId = device.locationId
+        groups = set(device.groups or [])
+        self.remove_device(udid)
+
+        self._apps_of[udid] = apps
+        for identifier, version in apps:
+            self._by_app.setdefault(identifier, set()).add(udid)
+            self._by_version.setdefault(identifier, {}).setdefault(version, set()).add(udid)
+
+        self._location_of[udid] = locationId
+        self._by_location.setdefault(locationId, set()).add(udid)
+
+        self._groups_of[udid] = groups
+        for group in groups:
+            self._by_group.setdefault(group, set()).add(udid)
+
+    def remove_device(self, udid: str):
+        """
+        drop every posting of the given device
+
+        :param udid:
+        :return: True if the device was indexed
+        """
+        apps = self._apps_of.pop(udid, None)
+        if apps is None:
+            return False
+        for identifier, version in apps:
+            self._discard(self._by_app, identifier, udid)
+            versions = self._by_version.get(identifier)
+            if versions is not None:
+                self._discard(versions, version, udid)
+                if not versions:
+                    del self._by_version[identifier]
+        self._discard(self._by_location, self._location_of.pop(udid, None), udid)
+        for group in self._groups_of.pop(udid, ()):
+            self._discard(self._by_group, group, udid)
+        return True
+
+    def update_device(self, udid: str, locationId: int = None, groups: [str] = None, apps: list = None):
+        """
+        partial update of an indexed device (e.g. from a webhook event), what is None stays as it is
+
+        :param apps: App objects
+        :return: True if the device is indexed
+        """
+        if udid not in self._apps_of:
+            return False
+        if apps is not None:
+            for identifier, version in self._apps_of[udid]:
+                self._discard(self._by_app, identifier, udid)
+                versions = self._by_version.get(identifier)
+                if versions is not None:
+                    self._discard(versions, version, udid)
+                    if not versions:
+                        del self._by_version[identifier]
+            self._apps_of[udid] = {(app.identifier, app.version) for app in apps if app.identifier is not None}
+            for identifier, version in self._apps_of[udid]:
+                self._by_app.setdefault(identifier, set()).add(udid)
+                self._by_version.setdefault(identifier, {}).setdefault(version, set()).add(udid)
+        if locationId is not None:
+            self._discard(self._by_location, self._location_of.get(udid), udid)
+            self._location_of[udid] = locationId
+            self._by_location.setdefault(locationId, set()).add(udid)
+        if groups is not None:
+            for group in self._groups_of.get(udid, ()):
+                self._discard(self._by_group, group, udid)
+            self._groups_of[udid] = set(groups)
+            for group in groups:
+                self._by_group.setdefault(group, set()).add(udid)
+        return True
+
+    @staticmethod
+    def _discard(index: dict, key, udid: str):
+        postings = index.get(key)
+        if postings is not None:
+            postings.discard(udid)
+            if not postings:
+                del index[key]
+
+    def devices(self, identifier: str, version: str = None) -> {str}:
+        """
+        posting list of an app, or of an app in a specific version.
+
+        the returned set is a copy, it is safe to combine it with & | -
+
+        :param identifier: App.identifier e.g. com.agilebits.onepassword-ios
+        :param version: optional App.version e.g. 5.4
+        :return: set of UDIDs
+        """
+        if version is None:
+            return set(self._by_app.get(identifier, ()))
+        return set(self._by_version.get(identifier, {}).get(version, ()))
+
+    def devices_without(self, identifier: str, version: str = None) -> {str}:
+        """
+        all indexed devices which don't have the app (in the given version) installed.
+        """
+        return set(self._apps_of) - self.devices(identifier, version)
+
+    def devices_with_all(self, *identifiers: str) -> {str}:
+        """
+        devices which have every given app installed (intersection of the posting lists)
+        """
+        if not identifiers:
+            return set()
+        postings = sorted((self._by_app.get(identifier, set()) for identifier in identifiers), key=len)
+        return set(postings[0]).intersection(*postings[1:])
+
+    def devices_with_any(self, *identifiers: str) -> {str}:
+        return set().union(*(self._by_app.get(identifier, ()) for identifier in identifiers))
+
+    def versions(self, identifier: str) -> [str]:
+        return sorted(version for version in self._by_version.get(identifier, {}) if version is not None)
+
+    def apps(self, udid: str) -> {(str, str)}:
+        """
+        (identifier, version) pairs of the given device
+        """
+        return set(self._apps_of.get(udid, ()))
+
+    def scope(self, locationId: int = None, group: str = None) -> {str}:
+        """
+        the indexed devices of a location and/or device group (by name).
+        without any filter all indexed devices are returned.
+        """
+        udids = set(self._apps_of)
+        if locationId is not None:
+            udids &= self._by_location.get(locationId, set())
+        if group is not None:
+            udids &= self._by_group.get(group, set())
+        return udids
+
+    def version_distribution(self, identifier: str, locationId: int = None, group: str = None) -> {str: int}:
+        """
+        number of devices per installed version of an app.
+
+        :param identifier: App.identifier
+        :param locationId: only count devices of this location
+        :param group: only count devices of this device group (name)
+        :return: {version: device count}, most common version first
+        """
+        scope = self.scope(locationId=locationId, group=group)
+        distribution = Counter()
+        for version, udids in self._by_version.get(identifier, {}).items():
+            count = len(udids & scope)
+            if count:
+                distribution[version] = count
+        return dict(distribution.most_common())
+
+    def coverage(self, identifier: str, version: str = None, locationId: int = None, group: str = None) -> float:
+        """
+        share of the devices (in scope) which have the app (in the given version) installed.
+
+        :return: 0.0 .. 1.0, 0.0 for an empty scope
+        """
+        scope = self.scope(locationId=locationId, group=group)
+        if not scope:
+            return 0.0
+        return len(self.devices(identifier, version) & scope) / len(scope)
@@ -0,0 +1,146 @@
+from pydantic import BaseModel, ValidationError
+
+from jamf_objects import Device, User, model_to_dict
+
+"""
+
+lazy Device and User models
+
+validating a Device walks every nested field (owner, apps, networkInformation, ...) even if the
+caller reads only the serial number. a lazy model keeps the decoded json entry and validates a field
+when it gets read the first time, the result is stored on the object (the next access is a plain
+attribute lookup):
+
+    device = LazyDevice(entry)
+    device.serialNumber         # validates serialNumber only
+    device.owner.username       # validates owner
+    device == "DMPLXXXXXXXX"    # same comparison as Device (by serial), User by username / id
+    device.validate()           # the complete Device, raises ValidationError like Device(**entry)
+
+a field which does not validate raises the ValidationError on access instead of at parse time.
+fields can be set like on the models, validate() includes the set values.
+
+    j = JamfSchool(network_id, api_pw, url, lazy_models=True)   # listings return LazyDevice / LazyUser
+
+"""
+
+_converters = {}
+
+
+def _fields(cls) -> dict:
+    return getattr(cls, "model_fields", None) or cls.__fields__
+
+
+def _converter(cls, name: str):
+    """
+    (json key, convert(value), default()) of a field, works with pydantic 1 and 2
+    """
+    key = (cls, name)
+    converter = _converters.get(key)
+    if converter is not None:
+        return converter
+    field = _fields(cls)[name]
+    alias = field.alias or name
+    if hasattr(field, "validate"):
+        # pydantic 1
+        def convert(value):
+            result, error = field.validate(value, {}, loc=alias, cls=cls)
+            if error is not None:
+                raise ValidationError([error] if not isinstance(error, list) else error, cls)
+            return result
+
+        default = field.get_default
+    else:
+        from pydantic import TypeAdapter
+        convert = TypeAdapter(field.annotation).validate_python
+
+        def default():
+            return field.get_default(call_default_factory=True)
+    converter = _converters[key] = (alias, convert, default)
+    return converter
+
+
+class LazyModel(object):
+    """
+    :param raw: decoded json entry of the model
+    """
+    _model = BaseModel
+
+    def __init__(self, raw: dict):
+        self._raw = raw
+
+    def __getattr__(self, name: str):
+        # only called for names which are not set on the object yet
+        if name.startswith("_") and name != "__fields__":
+            raise AttributeError(name)
+        fields = _fields(self._model)
+        if name not in fields:
+            attribute = getattr(self._model, name)
+            if isinstance(attribute, property):
+                return attribute.fget(self)
+            return attribute
+        alias, convert, default = _converter(self._model, name)
+        value = convert(self._raw[alias]) if alias in self._raw else default()
+        setattr(self, name, value)
+        return value
+
+    @property
+    def raw(self) -> dict:
+        return self._raw
+
+    @property
+    def validated_fields(self) -> [str]:
+        """
+        fields which were read or set so far
+        """
+        fields = _fields(self._model)
+        return [name for name in self.__dict__ if name in fields]
+
+    def validate(self):
+        """
+        the complete model, validated like the eager model
+
+        :raises ValidationError:
+        """
+        data = dict(self._raw)
+        fields = _fields(self._model)
+        for name in self.validated_fields:
+            data[fields[name].alias or name] = getattr(self, name)
+        return self._model(**data)
+
+    def dict(self, by_alias: bool = False, **kwargs) -> dict:
+        return model_to_dict(self.validate(), by_alias=by_alias)
+
+    model_dump = dict
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.validated_fields})"
+
+
+class LazyDevice(LazyModel):
+    _model = Device
+    __eq__ = Device.__eq__
+    __hash__ = None
+
+
+class LazyUser(LazyModel):
+    _model = User
+    __eq__ = User.__eq__
+    __hash__ = None
+
+    def __str__(self):
+        return f"{self.username}"
+
+    def __repr__(self):
+        return self.username
+
+
+LAZY_MODELS = {Device: LazyDevice, User: LazyUser}
+
+
+def lazy(cls, entry: dict):
+    """
+    the lazy variant of the model, the validated model if there is no lazy variant
+    """
+    lazy_cls = LAZY_MODELS.get(cls)
+    return lazy_cls(entry) if lazy_cls is not None else cls(**entry)
@@ -0,0 +1,252 @@
+import logging
+import threading
+
+"""
+
+instrumentation for the jamf api client
+
+every api call of JamfSchool creates a RequestMetrics object,
+after the call is done it gets passed to every registered hook (on_request).
+entries which can't be validated into a model go to on_validation_error
+of the hooks instead of stdout.
+
+hooks:
+    MetricsHook         base class, implement the methods you need
+    LoggingHook         logs every request (debug) and every validation error (warning)
+    StatusRecorder      http status codes of the calls of the current thread
+    PrometheusExporter  counters and histograms in the prometheus text format
+
+    j = JamfSchool(..., hooks=[LoggingHook(), PrometheusExporter()])
+
+"""
+
+logger = logging.getLogger("jamf_api")
+
+
+class RequestMetrics(object):
+    """
+    measurements of one api call
+
+    endpoint            endpoint template e.g. devices/:udid
+    method              http method
+    params              query parameters or json payload of the call
+    status              http status code, None if no response arrived
+    time_to_headers     seconds until the response headers arrived
+    download_time       seconds to read the response body
+    bytes               size of the response body
+    decode_time         seconds spent in json decoding
+    validation_time     seconds spent building the models
+    entity_count        number of valid models
+    validation_errors   number of entries which failed the validation
+    error               exception of the call, if any
+    priority            priority class of the call (jamf_scheduler)
+    queue_wait          seconds the call waited for a slot of the request scheduler
+    """
+    __slots__ = ("endpoint", "method", "params", "status", "time_to_headers", "download_time", "bytes",
+                 "decode_time", "validation_time", "entity_count", "validation_errors", "error", "priority",
+                 "queue_wait")
+
+    def __init__(self, endpoint: str, method: str = "GET", params: dict = None):
+        self.endpoint = endpoint
+        self.method = method
+        self.params = params
+        self.status = None
+        self.time_to_headers = 0.0
+        self.download_time = 0.0
+        self.bytes = 0
+        self.decode_time = 0.0
+        self.validation_time = 0.0
+        self.entity_count = 0
+        self.validation_errors = 0
+        self.error = None
+        self.priority = None
+        self.queue_wait = 0.0
+
+    @property
+    def total_time(self):
+        return self.time_to_headers + self.download_time + self.decode_time + self.validation_time
+
+    def as_dict(self):
+        return {key: getattr(self, key) for key in self.__slots__ if key != "error"}
+
+    def __repr__(self):
+        return (f"{self.method} {self.endpoint} {self.status} {self.bytes}B "
+                f"priority={self.priority} queued={self.queue_wait:.3f}s headers={self.time_to_headers:.3f}s download={self.download_time:.3f}s "
+                f"decode={self.decode_time:.3f}s validation={self.validation_time:.3f}s "
+                f"entities={self.entity_count} errors={self.validation_errors}")
+
+
+def entry_label(entry) -> str:
+    """
+    short identification of a json entry, for error messages instead of the whole entry
+    """
+    if not isinstance(entry, dict):
+        return f"{type(entry).__name__}"
+    for key in ("serialNumber", "UDID", "username", "id", "name"):
+        if entry.get(key) is not None:
+            return f"{key}={entry.get(key)}"
+    return f"{len(entry)} fields"
+
+
+class MetricsHook(object):
+    def on_request(self, metrics: RequestMetrics):
+        pass
+
+    def on_validation_error(self, metrics: RequestMetrics, error, entry):
+        pass
+
+
+class LoggingHook(MetricsHook):
+    def __init__(self, log: logging.Logger = None, level: int = logging.DEBUG):
+        self.log = log or logger
+        self.level = level
+
+    def on_request(self, metrics: RequestMetrics):
+        self.log.log(self.level, "%r", metrics)
+
+    def on_validation_error(self, metrics: RequestMetrics, error, entry):
+        # only the first line of the error, the full pydantic message repeats the input
+        message = f"{error}".splitlines()
+        self.log.warning("%s: invalid entry %s: %s", metrics.endpoint, entry_label(entry),
+                         " ".join(message[:3]))
+
+
+class StatusRecorder(MetricsHook):
+    """
+    collects the http status codes of the calls between begin() and end(), per thread.
+    used to find out if a client method which hides its errors (prints, returns None) failed.
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def begin(self):
+        self.local.statuses = []
+
+    def end(self) -> [int]:
+        statuses = getattr(self.local, "statuses", None) or []
+        self.local.statuses = None
+        return statuses
+
+    def on_request(self, metrics: RequestMetrics):
+        statuses = getattr(self.local, "statuses", None)
+        if statuses is not None:
+            statuses.append(metrics.status)
+
+
+class PrometheusExporter(MetricsHook):
+    """
+    collects the metrics in memory and renders them in the prometheus text exposition format.
+
+    render() returns the text, serve(port) starts a small http server with /metrics
+    """
+    BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+    PHASES = ("time_to_headers", "download_time", "decode_time", "validation_time")
+
+    def __init__(self, namespace: str = "jamf_api"):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._counters = {}  # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+        self._collectors = []
+        self._server = None
+
+    def add_collector(self, collector):
+        """
+        collector() -> [(name, labels, value)], gauges which are read at every render(),
+        e.g. RequestScheduler.gauges
+        """
+        self._collectors.append(collector)
+
+    def inc(self, name: str, labels: tuple, value: float = 1):
+        with self._lock:
+            key = (name, labels)
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, labels: tuple, value: float):
+        with self._lock:
+            key = (name, labels)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(self.BUCKETS) + 2)
+            for i, bound in enumerate(self.BUCKETS):
+                if value <= bound:
+                    histogram[i] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def on_request(self, metrics: RequestMetrics):
+        labels = (("endpoint", metrics.endpoint), ("method", metrics.method))
+        self.inc("requests_total", labels + (("status", f"{metrics.status}"),))
+        self.inc("response_bytes_total", labels, metrics.bytes)
+        self.inc("entities_total", labels, metrics.entity_count)
+        self.inc("validation_errors_total", labels, metrics.validation_errors)
+        for phase in self.PHASES:
+            self.observe(f"{phase}_seconds", labels, getattr(metrics, phase))
+        self.observe("queue_wait_seconds", (("priority", f"{metrics.priority}"),), metrics.queue_wait)
+
+    @staticmethod
+    def _labels(labels: tuple, extra: tuple = ()) -> str:
+        labels = labels + extra
+        if not labels:
+            return ""
+        return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, list(value)) for key, value in self._histograms.items())
+        seen = set()
+        for (name, labels), value in counters:
+            full_name = f"{self.namespace}_{name}"
+            if full_name not in seen:
+                seen.add(full_name)
+                lines.append(f"# TYPE {full_name} counter")
+            lines.append(f"{full_name}{self._labels(labels)} {value}")
+        for (name, labels), histogram in histograms:
+            full_name = f"{self.namespace}_{name}"
+            if full_name not in seen:
+                seen.add(full_name)
+                lines.append(f"# TYPE {full_name} histogram")
+            for bound, count in zip(self.BUCKETS, histogram):
+                lines.append(f"{full_name}_bucket{self._labels(labels, (('le', f'{bound}'),))} {count}")
+            lines.append(f"{full_name}_bucket{self._labels(labels, (('le', '+Inf'),))} {histogram[-1]}")
+            lines.append(f"{full_name}_sum{self._labels(labels)} {histogram[-2]}")
+            lines.append(f"{full_name}_count{self._labels(labels)} {histogram[-1]}")
+        gauges = sorted(gauge for collector in self._collectors for gauge in collector())
+        for name, labels, value in gauges:
+            full_name = f"{self.namespace}_{name}"
+            if full_name not in seen:
+                seen.add(full_name)
+                lines.append(f"# TYPE {full_name} gauge")
+            lines.append(f"{full_name}{self._labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int = 9464, host: str = "127.0.0.1"):
+        """
+        serve /metrics in a background thread
+
+        :return: the http server, call shutdown() to stop it
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = exporter.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", f"{len(body)}")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server
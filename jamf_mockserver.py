@@ -0,0 +1,566 @@
+import argparse
+import base64
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+"""
+
+local stand-in for the Jamf School API
+
+generates a synthetic fleet (locations, users, user groups, devices with apps
+and ServiceSubscription, device groups, dep placeholders, profiles)
+and serves it with the endpoints used by JamfSchool.
+
+latency, throttling (429) and error injection (5xx) are configurable,
+so the client can be load tested without touching a production tenant.
+
+    with MockJamfServer(Fleet(devices=5000)) as server:
+        j = JamfSchool("network_id", "api_pw", server.url)
+
+or from the shell:
+
+    python jamf_mockserver.py --devices 5000 --port 8080 --latency 0.05
+
+"""
+
+APPS = [("Pages", "Apple", "com.apple.iwork.pages"), ("Numbers", "Apple", "com.apple.iwork.numbers"),
+        ("Keynote", "Apple", "com.apple.iwork.keynote"), ("GarageBand", "Apple", "com.apple.mobilegarageband"),
+        ("iMovie", "Apple", "com.apple.iMovie"), ("Clips", "Apple", "com.apple.clips"),
+        ("Classroom", "Apple", "com.apple.classroom"), ("Schoolwork", "Apple", "com.apple.schoolwork"),
+        ("1Password", "AgileBits Inc.", "com.agilebits.onepassword-ios"),
+        ("Jamf Student", "Jamf", "com.jamf.student"), ("Jamf Teacher", "Jamf", "com.jamf.teacher"),
+        ("Microsoft Word", "Microsoft Corporation", "com.microsoft.Office.Word"),
+        ("Microsoft Excel", "Microsoft Corporation", "com.microsoft.Office.Excel"),
+        ("Microsoft PowerPoint", "Microsoft Corporation", "com.microsoft.Office.Powerpoint"),
+        ("Microsoft Teams", "Microsoft Corporation", "com.microsoft.skype.teams"),
+        ("OneNote", "Microsoft Corporation", "com.microsoft.onenote"),
+        ("GoodNotes 5", "Time Base Technology Limited", "com.goodnotesapp.x"),
+        ("Book Creator", "Red Jumper Limited", "com.redjumper.bookcreator"),
+        ("Explain Everything", "Explain Everything", "com.morriscooke.explaineverything"),
+        ("GeoGebra", "International GeoGebra Institute", "org.geogebra.classic"),
+        ("Scratch Jr", "Scratch Foundation", "edu.mit.scratchjr"), ("Swift Playgrounds", "Apple", "com.apple.Playgrounds"),
+        ("Anton", "solocode GmbH", "de.solocode.anton"), ("Duden", "Cornelsen", "de.duden.mobile"),
+        ("LearningApps", "LearningApps", "org.learningapps.app"), ("Padlet", "Wallwisher Inc", "com.wallwisher.Padlet"),
+        ("Kahoot!", "Kahoot! AS", "no.mobitroll.kahoot.android"), ("Quizlet", "Quizlet Inc", "com.quizlet.quizletapp"),
+        ("Duolingo", "Duolingo", "com.duolingo.DuolingoMobile"), ("Stop Motion Studio", "Cateater", "com.cateater.stopmotion")]
+
+MODELS = [("iPad (9th generation)", "iPad12,1", "iPad", False), ("iPad (9th generation)", "iPad12,2", "iPad", True),
+          ("iPad Air (5th generation)", "iPad13,16", "iPad", False), ("iPad Air (5th generation)", "iPad13,17", "iPad", True),
+          ("iPad (10th generation)", "iPad13,18", "iPad", False), ("MacBook Air (M1, 2020)", "MacBookAir10,1", "Mac", False),
+          ("Apple TV 4K", "AppleTV11,1", "AppleTV", False)]
+
+OS_VERSIONS = {"iPad": ("iOS", ["15.7.2", "16.6.1", "16.7.2", "17.1.2", "17.2.1"]),
+               "Mac": ("macOS", ["13.6.1", "14.1.2", "14.2.1"]),
+               "AppleTV": ("tvOS", ["16.6", "17.1", "17.2"])}
+
+FIRST_NAMES = ["Anna", "Ben", "Clara", "David", "Emma", "Felix", "Greta", "Hannes", "Ida", "Jonas", "Karla", "Leon",
+               "Mia", "Noah", "Olivia", "Paul", "Rosa", "Simon", "Tilda", "Valentin"]
+LAST_NAMES = ["Müller", "Schmidt", "Schneider", "Fischer", "Weber", "Meyer", "Wagner", "Becker", "Schulz", "Hoffmann",
+              "Koch", "Richter", "Klein", "Wolf", "Schröder", "Neumann"]
+
+
+def _mac(rnd: random.Random) -> str:
+    return ":".join(f"{rnd.randrange(256):02x}" for _ in range(6))
+
+
+def _serial(rnd: random.Random) -> str:
+    return "".join(rnd.choice("ABCDEFGHJKLMNPQRSTUVWXYZ0123456789") for _ in range(12))
+
+
+def _udid(rnd: random.Random) -> str:
+    return f"{rnd.getrandbits(160):040x}"
+
+
+class Fleet(object):
+    """
+    synthetic tenant data, in the json shape of the api responses.
+
+    the data is generated deterministic from the seed.
+    """
+
+    def __init__(self, devices: int = 1000, users: int = None, locations: int = 3, placeholders: int = None,
+                 apps_per_device: (int, int) = (10, 30), seed: int = 0):
+        rnd = random.Random(seed)
+        self.lock = threading.Lock()
+        self.apps_per_device = apps_per_device
+        if users is None:
+            users = devices
+        if placeholders is None:
+            placeholders = max(1, devices // 10)
+
+        self.locations = [{"id": i, "name": "District Location" if i == 0 else f"School {i:02}",
+                           "isDistrict": i == 0, "street": None, "streetNumber": None, "postalCode": None,
+                           "city": None, "source": "default", "asmIdentifier": None, "schoolNumber": f"{i:02}AB"}
+                          for i in range(locations)]
+
+        self.user_groups = []
+        self.device_groups = []
+        group_id = 1000
+        for location in self.locations:
+            for name in ("Teachers", "Students", "5a", "5b", "6a", "6b", "7a", "7b"):
+                group_id += 1
+                self.user_groups.append({"id": group_id, "locationId": location["id"], "name": name,
+                                         "description": "", "userCount": 0,
+                                         "acl": {"teacher": "allow" if name == "Teachers" else "inherit",
+                                                 "parent": "inherit"},
+                                         "modified": "2023-08-01 08:00:00"})
+            for name in ("Cart 1", "Cart 2", "Library", "Staff iPads", "Exams"):
+                group_id += 1
+                self.device_groups.append({"description": "", "information": "", "id": group_id,
+                                           "isSmartGroup": False, "locationId": location["id"], "members": 0,
+                                           "name": f"{name} {location['schoolNumber']}", "shared": False,
+                                           "imageUrl": None, "type": "normal"})
+
+        self.users = []
+        for i in range(users):
+            location = rnd.choice(self.locations)
+            groups = [g for g in self.user_groups if g["locationId"] == location["id"]]
+            member_of = rnd.sample(groups, k=min(len(groups), rnd.randint(1, 2)))
+            teacher = member_of[0]["name"] == "Teachers"
+            first, last = rnd.choice(FIRST_NAMES), rnd.choice(LAST_NAMES)
+            self.users.append({"id": 100 + i, "locationId": location["id"], "status": "Active", "deviceCount": 0,
+                               "email": f"{first.lower()}.{last.lower()}{i}@school.example",
+                               "username": f"{location['schoolNumber']}-{first}{last}{i}", "domain": "",
+                               "firstName": first, "lastName": last, "name": f"{first} {last}",
+                               "groupIds": [g["id"] for g in member_of], "groups": [g["name"] for g in member_of],
+                               "vpp": [{"status": "Associated"}],
+                               "teacherGroups": [g["name"] for g in groups[2:4]] if teacher else [],
+                               "children": [], "notes": "", "modified": "2023-08-01 08:00:00", "exclude": ""})
+        for group in self.user_groups:
+            group["userCount"] = sum(group["id"] in u["groupIds"] for u in self.users)
+
+        self.app_versions = {identifier: [f"{major}.{minor}" for major in range(rnd.randint(1, 9), 12)
+                                          for minor in range(0, 3)][-4:]
+                             for _, _, identifier in APPS}
+
+        self.devices = []
+        for i in range(devices):
+            self.devices.append(self._device(rnd, i))
+        for group in self.device_groups:
+            group["members"] = sum(group["name"] in d["groups"] for d in self.devices)
+
+        self.placeholders = []
+        for i in range(placeholders):
+            model_name, _, _, _ = rnd.choice(MODELS)
+            self.placeholders.append({"id": 5000 + i, "userId": rnd.choice(self.users)["id"] if self.users else None,
+                                      "locationId": rnd.choice(self.locations)["id"], "model": model_name,
+                                      "color": rnd.choice(["Space Gray", "Silver", "Blue"]),
+                                      "serialNumber": _serial(rnd), "status": rnd.choice(["empty", "assigned"]),
+                                      "dateAssigned": "", "dateAdded": f"{1690000000 + i}", "datePushed": "",
+                                      "profileName": "Default DEP", "placeholderName": "",
+                                      "placeholderDeviceName": "", "deviceName": ""})
+
+        self.profiles = []
+        for location in self.locations:
+            for name, days, start, end in (("Restrictions", [], None, None),
+                                           ("School hours", ["1", "2", "3", "4", "5"], "07:30", "16:00"),
+                                           ("Exam mode", ["2", "4"], "08:00", "09:30"),
+                                           ("Night time", ["1", "2", "3", "4", "5", "6", "7"], "21:00", "06:00")):
+                profile_id = 2000 + len(self.profiles)
+                self.profiles.append({"id": profile_id, "locationId": location["id"],
+                                      "identifier": f"com.zuludesk.MDM.iOS.{rnd.getrandbits(128):032x}",
+                                      "name": f"{name} {location['schoolNumber']}", "description": "",
+                                      "platform": "iOS", "type": {"value": "default"}, "status": {"value": "Active"},
+                                      "daysOfTheWeek": days, "isTemplate": False, "startTime": start,
+                                      "endTime": end, "useHolidays": bool(days), "restrictedWeekendUse": False})
+
+    def _device(self, rnd: random.Random, i: int) -> dict:
+        model_name, identifier, model_type, cellular = rnd.choice(MODELS)
+        prefix, versions = OS_VERSIONS[model_type]
+        location = rnd.choice(self.locations)
+        groups = [g for g in self.device_groups if g["locationId"] == location["id"]]
+        device_groups = rnd.sample(groups, k=min(len(groups), rnd.randint(0, 2)))
+        owner = rnd.choice(self.users) if self.users and rnd.random() < 0.8 else None
+        if owner is not None:
+            owner["deviceCount"] += 1
+        apps = []
+        if model_type != "AppleTV":
+            for name, vendor, app_identifier in rnd.sample(APPS, k=min(len(APPS), rnd.randint(*self.apps_per_device))):
+                apps.append({"name": name, "vendor": vendor, "identifier": app_identifier,
+                             "version": rnd.choice(self.app_versions[app_identifier]),
+                             "icon": f"https://is1-ssl.mzstatic.com/image/thumb/{app_identifier}/60x60bb.png"})
+        wifi_mac = _mac(rnd)
+        network_information = {"IPAddress": f"10.{location['id']}.{i // 250 % 250}.{i % 250 + 2}",
+                               "isNetworkTethered": "0", "BluetoothMAC": _mac(rnd), "WiFiMAC": wifi_mac,
+                               "VoiceRoamingEnabled": "0", "DataRoamingEnabled": "0", "PersonalHotspotEnabled": "0"}
+        if cellular:
+            network_information["ServiceSubscription"] = [{
+                "CarrierSettingsVersion": "49.0", "CurrentCarrierNetwork": "", "CurrentMCC": "262",
+                "CurrentMNC": "01", "EID": f"{rnd.getrandbits(100):032d}"[:32],
+                "ICCID": " ".join(f"{rnd.randrange(10000):04}" for _ in range(5)),
+                "IMEI": f"35 {rnd.randrange(1000000):06} {rnd.randrange(1000000):06} {rnd.randrange(10)}",
+                "IsDataPreferred": True, "IsRoaming": False, "IsVoicePreferred": False,
+                "Label": "USER_LABEL_PRIMARY", "LabelID": f"{rnd.getrandbits(128):032X}", "PhoneNumber": "",
+                "Slot": "CTSubscriptionSlotOne"}]
+        checkin = f"2023-{rnd.randint(9, 12):02}-{rnd.randint(1, 28):02} {rnd.randint(6, 18):02}:{rnd.randint(0, 59):02}:00"
+        return {"UDID": _udid(rnd), "locationId": location["id"], "serialNumber": _serial(rnd),
+                "assetTag": f"ASSET-{i:06}", "inTrash": rnd.random() < 0.02,
+                "class": model_type.lower(), "model": {"name": model_name, "identifier": identifier,
+                                                      "type": model_type},
+                "os": {"prefix": prefix, "version": rnd.choice(versions)},
+                "name": f"{model_type}-{i:05}", "owner": owner and self._owner(owner),
+                "isManaged": True, "isSupervised": True, "isBootstrapStored": model_type == "Mac",
+                "enrollType": rnd.choice(["dep", "dep", "dep", "manual"]), "depProfile": "Default DEP",
+                "batteryLevel": round(rnd.random(), 3), "totalCapacity": rnd.choice([64, 128, 256]) * 0.93,
+                "availableCapacity": f"{rnd.random() * 50:.4f}", "hasPasscode": True, "passcodeCompliant": True,
+                "hardwareEncryptionEnabled": True, "iTunesStoreLoggedIn": False, "iCloudBackupEnabled": False,
+                "iCloudBackupLatest": "", "groupIds": [g["id"] for g in device_groups],
+                "groups": [g["name"] for g in device_groups], "WiFiMAC": wifi_mac,
+                "bluetoothMAC": network_information["BluetoothMAC"], "IPAddress": network_information["IPAddress"],
+                "region": {"string": "Germany", "coordinates": "52.52,13.40"}, "apps": apps, "notes": "",
+                "lastCheckin": checkin, "modified": checkin, "networkInformation": network_information}
+
+    @staticmethod
+    def _owner(user: dict) -> dict:
+        keys = ("id", "locationId", "deviceCount", "username", "email", "firstName", "lastName", "groupIds",
+                "groups", "teacherGroups", "children", "vpp", "notes", "modified")
+        owner = {key: user[key] for key in keys}
+        owner["inTrash"] = False
+        return owner
+
+    def device(self, udid: str) -> dict:
+        for device in self.devices:
+            if device["UDID"] == udid:
+                return device
+
+    def user(self, user_id: int) -> dict:
+        for user in self.users:
+            if user["id"] == user_id:
+                return user
+
+    def placeholder(self, serial: str) -> dict:
+        for placeholder in self.placeholders:
+            if placeholder["serialNumber"] == serial:
+                return placeholder
+
+
+class MockJamfServer(object):
+    """
+    http server for a Fleet, runs in a background thread
+
+    :param fleet: the data to serve
+    :param latency: seconds added to every response
+    :param latency_jitter: up to this many seconds get added randomly on top
+    :param rate_limit: requests per second, above this 429 is returned (None: unlimited)
+    :param throttle_rate: share of requests which get a 429 regardless of the rate (0.0 .. 1.0)
+    :param error_rate: share of requests which fail with a 500 (0.0 .. 1.0)
+    """
+
+    def __init__(self, fleet: Fleet = None, network_id: str = "network_id", api_pw: str = "api_pw",
+                 host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, latency_jitter: float = 0.0,
+                 rate_limit: float = None, throttle_rate: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.fleet = fleet if fleet is not None else Fleet()
+        self.auth = "Basic " + base64.b64encode(f"{network_id}:{api_pw}".encode()).decode()
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.rate_limit = rate_limit
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.rnd = random.Random(seed)
+        self.requests = 0
+        self.requests_by_endpoint = {}
+        self._lock = threading.Lock()
+        self._tokens = rate_limit or 0.0
+        self._last_refill = time.monotonic()
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def start(self) -> str:
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self._server.daemon_threads = True
+        self.port = self._server.server_port
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self.url
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _throttled(self) -> bool:
+        with self._lock:
+            if self.throttle_rate and self.rnd.random() < self.throttle_rate:
+                return True
+            if not self.rate_limit:
+                return False
+            now = time.monotonic()
+            self._tokens = min(self.rate_limit, self._tokens + (now - self._last_refill) * self.rate_limit)
+            self._last_refill = now
+            if self._tokens < 1:
+                return True
+            self._tokens -= 1
+            return False
+
+    def _failing(self) -> bool:
+        with self._lock:
+            return bool(self.error_rate) and self.rnd.random() < self.error_rate
+
+    def _count(self, endpoint: str):
+        with self._lock:
+            self.requests += 1
+            self.requests_by_endpoint[endpoint] = self.requests_by_endpoint.get(endpoint, 0) + 1
+
+    def _handler(self):
+        server = self
+        fleet = self.fleet
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body are separate writes, with nagle the body waits for the delayed ack of the
+            # client on keep-alive connections (~40 ms per request)
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+            def do_PUT(self):
+                self._dispatch("PUT")
+
+            def _send(self, status: int, body: dict, headers: dict = None):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", f"{len(data)}")
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _body(self) -> dict:
+                length = int(self.headers.get("Content-Length") or 0)
+                if not length:
+                    return {}
+                try:
+                    return json.loads(self.rfile.read(length))
+                except ValueError:
+                    return {}
+
+            def _dispatch(self, method: str):
+                url = urlsplit(self.path)
+                parts = [part for part in url.path.split("/") if part]
+                if parts and parts[0] == "api":
+                    parts = parts[1:]
+                query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                body = self._body()
+
+                if server.latency or server.latency_jitter:
+                    time.sleep(server.latency + server.rnd.random() * server.latency_jitter)
+                if self.headers.get("Authorization") != server.auth:
+                    return self._send(401, {"code": 401, "message": "Unauthorized"})
+                if server._throttled():
+                    return self._send(429, {"code": 429, "message": "TooManyRequests"}, {"Retry-After": "1"})
+                if server._failing():
+                    return self._send(500, {"code": 500, "message": "InternalServerError"})
+
+                with fleet.lock:
+                    status, response = self._route(method, parts, query, body)
+                server._count(f"{method} /{'/'.join(parts[:1])}")
+                return self._send(status, response)
+
+            def _route(self, method: str, parts: [str], query: dict, body: dict) -> (int, dict):
+                not_found = (404, {"code": 404, "message": "NotFound"})
+                if not parts:
+                    return not_found
+                head, rest = parts[0], parts[1:]
+
+                if head == "locations" and method == "GET":
+                    return 200, {"code": 200, "count": len(fleet.locations), "locations": fleet.locations}
+
+                if head == "profiles" and method == "GET":
+                    return 200, {"code": 200, "count": len(fleet.profiles), "profiles": fleet.profiles}
+
+                if head == "devices":
+                    if rest[:1] == ["groups"]:
+                        return self._device_groups(method, rest[1:], body)
+                    if not rest and method == "GET":
+                        devices = self._filter_devices(query)
+                        return 200, {"code": 200, "count": len(devices), "devices": devices}
+                    if len(rest) == 1 and method == "GET":
+                        device = fleet.device(rest[0])
+                        if device is None:
+                            return 404, {"code": 404, "message": "DeviceNotFound"}
+                        return 200, {"code": 200, "device": self._with_apps(device, query)}
+                    if len(rest) == 2 and rest[1] == "owner" and method == "PUT":
+                        device = fleet.device(rest[0])
+                        user = fleet.user(int(body.get("user") or 0))
+                        if device is None:
+                            return 404, {"code": 404, "message": "DeviceNotFound"}
+                        device["owner"] = user and fleet._owner(user)
+                        return 200, {"code": 200, "message": "OwnerChanged"}
+                    if len(rest) == 2 and rest[1] == "migrate" and method == "PUT":
+                        device = fleet.device(rest[0])
+                        location = int(body.get("location", -1))
+                        if device is None:
+                            return 404, {"code": 404, "message": "DeviceNotFound"}
+                        if not any(loc["id"] == location for loc in fleet.locations):
+                            return 404, {"code": 404, "message": "LocationNotFound"}
+                        # the groups belong to the old location, the asset tag gets lost as well
+                        for group in fleet.device_groups:
+                            if group["id"] in device["groupIds"]:
+                                group["members"] -= 1
+                        device.update({"locationId": location, "groupIds": [], "groups": [], "assetTag": ""})
+                        return 200, {"code": 200, "message": "DeviceMigrated"}
+                    if len(rest) == 2 and rest[1] == "details" and method == "POST":
+                        device = fleet.device(rest[0])
+                        if device is None:
+                            return 404, {"code": 404, "message": "DeviceNotFound"}
+                        for key in ("assetTag", "notes"):
+                            if key in body:
+                                device[key] = body[key]
+                        return 200, {"code": 200, "message": "DeviceDetailsUpdated"}
+                    return not_found
+
+                if head == "dep":
+                    # like the real api, without the protocol version 3 header the endpoint is not found
+                    if self.headers.get("X-Server-Protocol-Version") != "3":
+                        return not_found
+                    if not rest and method == "GET":
+                        return 200, {"code": 200, "placeholders": fleet.placeholders}
+                    placeholder = fleet.placeholder(rest[0]) if rest else None
+                    if placeholder is None:
+                        return 404, {"code": 404, "message": "PlaceholderNotFound"}
+                    if method == "GET":
+                        return 200, {"code": 200, "placeholder": placeholder}
+                    if method == "POST":
+                        # only the documented fields, a misspelled key must not pass as an update
+                        unknown = sorted(set(body) - {"deviceName", "userID", "groupIds", "profileId"})
+                        if unknown:
+                            return 400, {"code": 400, "message": f"InvalidFields: {', '.join(unknown)}"}
+                        for key, target in (("deviceName", "deviceName"), ("userID", "userId")):
+                            if key in body:
+                                placeholder[target] = body[key]
+                        if "profileId" in body:
+                            # 0 unassigns the placeholder from its profile
+                            placeholder["profileName"] = f"{body['profileId']}" if body["profileId"] else ""
+                        return 200, {"code": 200, "message": "PlaceholderUpdated"}
+                    return not_found
+
+                if head == "users":
+                    if rest[:1] == ["groups"]:
+                        if method == "GET" and not body:
+                            return 200, {"code": 200, "groups": fleet.user_groups}
+                        group = {"id": 1000 + len(fleet.user_groups) + len(fleet.device_groups) + 1,
+                                 "locationId": int(body.get("locationId") or 0), "name": body.get("name"),
+                                 "description": body.get("description") or "", "userCount": 0, "acl": {},
+                                 "modified": time.strftime("%Y-%m-%d %H:%M:%S")}
+                        fleet.user_groups.append(group)
+                        return 200, {"code": 200, "message": "GroupCreated", "id": group["id"]}
+                    if not rest and method == "GET":
+                        return 200, {"code": 200, "count": len(fleet.users), "users": fleet.users}
+                    if not rest and method == "POST":
+                        if any(u["username"] == body.get("username") for u in fleet.users):
+                            return 400, {"code": 400, "message": "UsernameInUse"}
+                        user = {"id": 100 + len(fleet.users), "locationId": int(body.get("locationId") or 0),
+                                "status": "Active", "deviceCount": 0, "email": body.get("email", ""),
+                                "username": body.get("username"), "domain": "",
+                                "firstName": body.get("firstName"), "lastName": body.get("lastName"),
+                                "name": f"{body.get('firstName')} {body.get('lastName')}", "groupIds": [],
+                                "groups": body.get("memberOf") or [], "vpp": [], "teacherGroups": [],
+                                "children": [], "notes": body.get("notes", ""),
+                                "modified": time.strftime("%Y-%m-%d %H:%M:%S"), "exclude": ""}
+                        fleet.users.append(user)
+                        return 200, {"code": 200, "message": "UserCreated", "id": user["id"]}
+                    return not_found
+
+                return not_found
+
+            def _device_groups(self, method: str, rest: [str], body: dict) -> (int, dict):
+                if not rest and method == "GET":
+                    return 200, {"code": 200, "deviceGroups": fleet.device_groups}
+                if not rest and method == "POST":
+                    group = {"description": body.get("description", ""), "information": body.get("information", ""),
+                             "id": 1000 + len(fleet.user_groups) + len(fleet.device_groups) + 1,
+                             "isSmartGroup": False, "locationId": int(body.get("locationId") or 0), "members": 0,
+                             "name": body.get("name"), "shared": bool(body.get("shared")), "imageUrl": None,
+                             "type": "normal"}
+                    fleet.device_groups.append(group)
+                    return 200, {"code": 200, "message": "DeviceGroupCreated", "id": group["id"]}
+                if rest in (["add"], ["remove"]) and method == "POST":
+                    group = next((g for g in fleet.device_groups if g["id"] == body.get("groupId")), None)
+                    if group is None:
+                        return 404, {"code": 404, "message": "DeviceGroupNotFound"}
+                    udids = set(body.get("udids") or [])
+                    for device in fleet.devices:
+                        if device["UDID"] not in udids:
+                            continue
+                        if rest == ["add"] and group["id"] not in device["groupIds"]:
+                            device["groupIds"].append(group["id"])
+                            device["groups"].append(group["name"])
+                            group["members"] += 1
+                        elif rest == ["remove"] and group["id"] in device["groupIds"]:
+                            device["groupIds"].remove(group["id"])
+                            device["groups"].remove(group["name"])
+                            group["members"] -= 1
+                    return 200, {"code": 200, "message": "DevicesAdded" if rest == ["add"] else "DevicesRemoved"}
+                return 404, {"code": 404, "message": "NotFound"}
+
+            @staticmethod
+            def _with_apps(device: dict, query: dict) -> dict:
+                if query.get("includeApps", "").lower() == "true":
+                    return device
+                return {key: value for key, value in device.items() if key != "apps"}
+
+            def _filter_devices(self, query: dict) -> [dict]:
+                filters = {"serialnumber": lambda d, v: d["serialNumber"] == v,
+                           "location": lambda d, v: f"{d['locationId']}" == v,
+                           "owner": lambda d, v: d["owner"] is not None and f"{d['owner']['id']}" == v,
+                           "inTrash": lambda d, v: d["inTrash"] == (v.lower() == "true"),
+                           "hasOwner": lambda d, v: (d["owner"] is not None) == (v.lower() == "true"),
+                           "groups": lambda d, v: bool(set(d["groupIds"]) & {int(g) for g in v.split(",")}),
+                           "model": lambda d, v: d["model"]["identifier"] == v,
+                           "asserttag": lambda d, v: d["assetTag"] == v,
+                           "enrollType": lambda d, v: d["enrollType"] == v}
+                active = [(filters[key], value) for key, value in query.items() if key in filters]
+                return [self._with_apps(d, query) for d in fleet.devices if all(f(d, v) for f, v in active)]
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="local stand-in for the Jamf School API")
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=None)
+    parser.add_argument('--locations', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--latency_jitter', type=float, default=0.0)
+    parser.add_argument('--rate_limit', type=float, default=None)
+    parser.add_argument('--throttle_rate', type=float, default=0.0)
+    parser.add_argument('--error_rate', type=float, default=0.0)
+    parser.add_argument('--network_id', default="network_id")
+    parser.add_argument('--api_pw', default="api_pw")
+    args = parser.parse_args()
+
+    mock = MockJamfServer(Fleet(devices=args.devices, users=args.users, locations=args.locations, seed=args.seed),
+                          network_id=args.network_id, api_pw=args.api_pw, port=args.port, latency=args.latency,
+                          latency_jitter=args.latency_jitter, rate_limit=args.rate_limit,
+                          throttle_rate=args.throttle_rate, error_rate=args.error_rate)
+    print(f"serving {len(mock.fleet.devices)} devices on {mock.start()}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        mock.stop()
@@ -0,0 +1,241 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from jamf_batching import GroupMembershipBatcher
+from jamf_deadline import current_deadline, use
+from jamf_metrics import logger
+from jamf_scheduler import BULK, priority
+
+"""
+
+move devices to another location, as a pipeline for many devices at once
+
+steps per device:
+    prefetch            one device, device group and dep listing for all devices together:
+                        saves the groups and the asset tag of every device
+    unassign_profile    unassign the dep placeholder from its profile (if the device has a placeholder)
+    migrate             move the device to the new location, it loses the groups of the old location
+    groups              add the device to the groups of the new location (batched, one call per group)
+    asset_tag           set the saved asset tag again
+
+the devices run through the steps concurrently (workers), the group additions of all devices
+are collected by a GroupMembershipBatcher and sent as one call per group.
+
+the groups of the old location are mapped to the new location by name (e.g. "Cart 1" -> "Cart 1"),
+district and shared groups are kept, group_map={old id: new id} overrides the mapping.
+groups without a counterpart are left out and listed in DeviceMove.unmapped.
+
+every device gets a DeviceMove with the state of each step. pass the result of a partially
+failed run as previous= to run only the missing steps (the saved groups and asset tag are
+kept from the first run, after the migration they are not in the api anymore):
+
+    result = j.move_devices_location(udids, locationId=3)
+    failed = {udid: move for udid, move in result.items() if not move.done}
+    j.move_devices_location(list(failed), locationId=3, previous=failed)
+
+"""
+
+UNASSIGN_PROFILE = "unassign_profile"
+MIGRATE = "migrate"
+GROUPS = "groups"
+ASSET_TAG = "asset_tag"
+STEPS = (UNASSIGN_PROFILE, MIGRATE, GROUPS, ASSET_TAG)
+
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+class DeviceMove(object):
+    """
+    progress of one device
+    """
+    __slots__ = ("udid", "serialNumber", "source", "target", "groups", "unmapped", "assetTag", "steps", "error")
+
+    def __init__(self, udid: str, target: int):
+        self.udid = udid
+        self.target = target
+        self.serialNumber = None
+        self.source = None
+        self.groups: [int] = []  # group ids in the new location
+        self.unmapped: [str] = []  # group names without a group in the new location
+        self.assetTag = None
+        self.steps = {}  # step -> DONE | FAILED | SKIPPED
+        self.error = None
+
+    @property
+    def done(self) -> bool:
+        return all(self.steps.get(step) in (DONE, SKIPPED) for step in STEPS)
+
+    @property
+    def failed_steps(self) -> [str]:
+        return [step for step in STEPS if self.steps.get(step) == FAILED]
+
+    def finished(self, step: str) -> bool:
+        return self.steps.get(step) in (DONE, SKIPPED)
+
+    def __repr__(self):
+        return f"{self.udid}: {self.source} -> {self.target} {self.steps}" + (f" {self.error}" if self.error else "")
+
+
+class LocationMove(object):
+    """
+    :param client: JamfSchool instance
+    :param locationId: id of the new location
+    :param group_map: {old group id: new group id}
+    :param workers: devices which get moved at the same time
+    :param batch_window: seconds the group additions get collected
+    """
+
+    def __init__(self, client, locationId: int, group_map: dict = None, workers: int = 4,
+                 batch_window: float = 0.5):
+        self.client = client
+        self.locationId = locationId
+        self.group_map = group_map or {}
+        self.workers = workers
+        self.batch_window = batch_window
+        self._groups_by_id = {}
+        self._groups_by_name = {}  # (locationId, name) -> group
+        self._placeholders = set()
+
+    def prefetch(self, moves: {str: DeviceMove}):
+        """
+        save the state of the devices with one listing per endpoint instead of a detail call per device
+        """
+        wanted = {udid for udid, move in moves.items() if move.serialNumber is None}
+        groups = self.client.device_groups_list() or []
+        self._groups_by_id = {group.id: group for group in groups}
+        self._groups_by_name = {(group.locationId, group.name): group for group in groups}
+        self._placeholders = {placeholder.serialNumber for placeholder in self.client.dep_device_list() or []}
+        if not wanted:
+            return
+        for device in self.client.get_device_list():
+            if device is None or device.UDID not in wanted:
+                continue
+            move = moves[device.UDID]
+            move.serialNumber = device.serialNumber
+            move.source = device.locationId
+            move.assetTag = device.assetTag
+            move.groups, move.unmapped = self._target_groups(device)
+        for udid in wanted:
+            if moves[udid].serialNumber is None:
+                moves[udid].error = "device not found"
+
+    def _target_groups(self, device) -> ([int], [str]):
+        targets, unmapped = [], []
+        if device.groupIds is not None:
+            groups = [(self._groups_by_id.get(group_id), str(group_id)) for group_id in device.groupIds]
+        else:
+            groups = [(self._groups_by_name.get((device.locationId, name))
+                       or next((g for g in self._groups_by_id.values() if g.name == name), None), name)
+                      for name in device.groups or []]
+        for group, name in groups:
+            if group is None:
+                unmapped.append(name)
+                continue
+            name = group.name
+            if group.id in self.group_map:
+                targets.append(self.group_map[group.id])
+            elif group.locationId == 0 or group.shared or group.locationId == self.locationId:
+                targets.append(group.id)
+            elif (self.locationId, name) in self._groups_by_name:
+                targets.append(self._groups_by_name[(self.locationId, name)].id)
+            else:
+                unmapped.append(name)
+        return targets, unmapped
+
+    def _step(self, move: DeviceMove, step: str, call) -> bool:
+        if move.finished(step):
+            return True
+        try:
+            ok = call()
+        except Exception as e:
+            ok, move.error = False, f"{step}: {type(e).__name__}: {e}"
+        if ok is None:
+            move.steps[step] = SKIPPED
+            return True
+        move.steps[step] = DONE if ok else FAILED
+        if not ok and move.error is None:
+            move.error = f"{step} failed"
+        return bool(ok)
+
+    def _unassign_profile(self, move: DeviceMove):
+        if move.serialNumber not in self._placeholders:
+            return None
+        return self.client.update_dep(move.serialNumber, profileId=0)
+
+    def _asset_tag(self, move: DeviceMove):
+        if not move.assetTag:
+            return None
+        r = self.client.device_update_details(move.udid, assetTag=move.assetTag)
+        return r is not None and r.status_code == 200
+
+    def _move(self, move: DeviceMove, batcher: GroupMembershipBatcher) -> list:
+        """
+        the steps of one device, the group additions are returned as futures of the batcher
+        """
+        if move.serialNumber is None:
+            return []
+        with priority(BULK):
+            if move.source == self.locationId and not move.finished(MIGRATE):
+                # already in the location, nothing to do
+                move.steps = {step: SKIPPED for step in STEPS}
+                return []
+            if not self._step(move, UNASSIGN_PROFILE, lambda: self._unassign_profile(move)):
+                return []
+            if not self._step(move, MIGRATE, lambda: self.client.device_migrate(move.udid, self.locationId)):
+                return []
+            self._step(move, ASSET_TAG, lambda: self._asset_tag(move))
+        if move.finished(GROUPS):
+            return []
+        if not move.groups:
+            move.steps[GROUPS] = SKIPPED
+            return []
+        return [batcher.add(group, move.udid) for group in move.groups]
+
+    def run(self, udids: [str], previous: dict = None) -> {str: DeviceMove}:
+        """
+        :param udids: devices to move
+        :param previous: {udid: DeviceMove} of an earlier run, finished steps are skipped
+        :return: {udid: DeviceMove}
+        """
+        moves = {}
+        for udid in udids:
+            move = (previous or {}).get(udid)
+            if move is None or move.target != self.locationId:
+                move = DeviceMove(udid, self.locationId)
+            move.error = None
+            moves[udid] = move
+        with priority(BULK):
+            self.prefetch(moves)
+
+        # the worker threads don't inherit the deadline of the caller
+        caller_deadline = current_deadline()
+
+        def move_device(move: DeviceMove) -> list:
+            with use(caller_deadline):
+                return self._move(move, batcher)
+
+        batcher = GroupMembershipBatcher(self.client, window=self.batch_window, priority=BULK)
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="jamf-move") as executor:
+                additions = dict(zip(moves, executor.map(move_device, moves.values())))
+        finally:
+            batcher.close()
+
+        for udid, futures in additions.items():
+            if not futures:
+                continue
+            move = moves[udid]
+            try:
+                ok = all(future.result() for future in futures)
+            except Exception as e:
+                ok, move.error = False, f"{GROUPS}: {type(e).__name__}: {e}"
+            move.steps[GROUPS] = DONE if ok else FAILED
+            if not ok and move.error is None:
+                move.error = f"{GROUPS} failed"
+
+        failed = [move for move in moves.values() if not move.done]
+        if failed:
+            logger.warning("move to location %s: %d of %d devices not finished", self.locationId, len(failed),
+                           len(moves))
+        return moves
@@ -1,5 +1,5 @@
 from json import JSONEncoder
-from typing import List, Optional, Union
+from typing import List, Optional, Union, get_args, get_origin, get_type_hints
 
 from pydantic import BaseModel
 
@@ -340,7 +340,7 @@ class Device(BaseModel):
     iTunesStoreLoggedIn: bool = None
     iCloudBackupEnabled: bool = None
     iCloudBackupLatest: str = None
-    # groupIds: [int] = None
+    groupIds: List[int] = None
     groups: List[str] = None
 
     WiFiMAC: str = None
@@ -593,3 +593,79 @@ class Placeholder(BaseModel):
     placeholderName: str = ""
     placeholderDeviceName: str = ""
     deviceName: Optional[str] = ""
+
+
+class WebhookEvent(BaseModel):
+    """
+    a webhook call of jamf school, the device or user part gets parsed into the models
+
+            "type": "DeviceOwnerChanged",
+            "eventId": "8f2b0c4e-...",
+            "timestamp": 1505111388,
+            "event": {
+                "device": {
+                    "UDID": "XXXXXXXXXXXX",
+                    "serialNumber": "DMPLXXXXXXX",
+                    "owner": {"id": 1, "username": "John", ...}
+                }
+            }
+    """
+    type: str
+    eventId: str = None
+    timestamp: int = None
+    event: dict = None
+    device: Device = None
+    user: User = None
+    placeholder: Placeholder = None
+
+
+def model_to_dict(model: BaseModel, by_alias: bool = False) -> dict:
+    """
+    field values of a model as (nested) dict, works with pydantic 1 and 2
+
+    :param by_alias: use the json names (class instead of class_)
+    """
+    dump = getattr(model, "model_dump", None)
+    if dump is not None:
+        return dump(by_alias=by_alias)
+    return model.dict(by_alias=by_alias)
+
+
+_type_hints_cache = {}
+
+
+def construct_model(cls, data: dict):
+    """
+    build a model (including the nested models) from already validated data,
+    without running the validation again.
+
+    the counterpart of model_to_dict(), used to get models back from worker processes.
+
+    :param cls: BaseModel subclass, e.g. Device
+    :param data: dict from model_to_dict()
+    :return: instance of cls
+    """
+    hints = _type_hints_cache.get(cls)
+    if hints is None:
+        hints = _type_hints_cache[cls] = get_type_hints(cls)
+    values = {key: _construct_value(hints.get(key), value) for key, value in data.items()}
+    construct = getattr(cls, "model_construct", None) or cls.construct
+    return construct(_fields_set=set(values), **values)
+
+
+def _construct_value(annotation, value):
+    if value is None or annotation is None:
+        return value
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return construct_model(annotation, value) if isinstance(value, dict) else value
+    origin = get_origin(annotation)
+    if origin is list and isinstance(value, list):
+        args = get_args(annotation)
+        return [_construct_value(args[0], v) for v in value] if args else value
+    if origin is Union:
+        for arg in get_args(annotation):
+            if isinstance(value, dict) and isinstance(arg, type) and issubclass(arg, BaseModel):
+                return construct_model(arg, value)
+            if isinstance(value, list) and get_origin(arg) is list:
+                return _construct_value(arg, value)
+    return value
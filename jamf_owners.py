@@ -0,0 +1,141 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from jamf_deadline import current_deadline, use
+from jamf_metrics import logger
+from jamf_scheduler import current_priority, priority
+from jamf_serial import strip_serial_prefix
+
+"""
+
+bulk owner assignment
+
+handout lists are (serial, username) rows. instead of a device lookup and a user lookup per row,
+the OwnerIndex loads the devices and the users once (two listing calls) and resolves
+serial -> Device and username -> User from dicts (serials with the "S" prefix of the barcode
+scanners are found as well). rows where the device already has the requested owner are skipped,
+several rows of the same device collapse into the last one, the remaining PUTs run concurrently:
+
+    results = j.bulk_assign_owners([("DMPLXXXXXXXX", "01AB-AnnaKoch12"), ...])
+    for result in results:
+        print(result.serialNumber, result.username, result.status)
+
+result status per row:
+    assigned        the owner was changed
+    unchanged       the device already had the owner, no call
+    failed          the api call failed
+    unknown_device  no device with the serial
+    unknown_user    no user with the username
+    superseded      a later row of the list is for the same device, no call
+
+"""
+
+ASSIGNED = "assigned"
+UNCHANGED = "unchanged"
+FAILED = "failed"
+UNKNOWN_DEVICE = "unknown_device"
+UNKNOWN_USER = "unknown_user"
+SUPERSEDED = "superseded"
+
+
+class OwnerAssignment(object):
+    __slots__ = ("serialNumber", "username", "udid", "userId", "previousOwner", "status", "error")
+
+    def __init__(self, serialNumber: str, username: str):
+        self.serialNumber = serialNumber
+        self.username = username
+        self.udid = None
+        self.userId = None
+        self.previousOwner = None
+        self.status = None
+        self.error = None
+
+    def __repr__(self):
+        return f"{self.serialNumber} -> {self.username}: {self.status}" + (f" ({self.error})" if self.error else "")
+
+
+class OwnerIndex(object):
+    """
+    devices by serial and users by username, loaded with one listing call each
+
+    usernames are matched exactly first and case insensitive as fallback.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.devices = {}  # serial -> Device
+        self.users = {}  # username -> User
+        self.users_folded = {}  # username.casefold() -> User
+
+    def refresh(self):
+        self.devices = {device.serialNumber: device for device in self.client.get_device_list()
+                        if device is not None and device.serialNumber}
+        users = [user for user in self.client.user_list() or [] if user is not None and user.username]
+        self.users = {user.username: user for user in users}
+        self.users_folded = {user.username.casefold(): user for user in users}
+        return self
+
+    def device(self, serialNumber: str):
+        serialNumber = (serialNumber or "").strip().upper()
+        return self.devices.get(serialNumber) or self.devices.get(strip_serial_prefix(serialNumber))
+
+    def user(self, username: str):
+        username = (username or "").strip()
+        return self.users.get(username) or self.users_folded.get(username.casefold())
+
+
+def assign_owners(client, rows: [(str, str)], workers: int = 8, index: OwnerIndex = None) -> [OwnerAssignment]:
+    """
+    :param client: JamfSchool instance
+    :param rows: (serial, username) pairs
+    :param workers: PUTs which run at the same time
+    :param index: preloaded OwnerIndex (loaded here if not given)
+    :return: one OwnerAssignment per row, in the order of the rows
+    """
+    index = index or OwnerIndex(client).refresh()
+    results = []
+    last = {}  # udid -> last resolved row of the device
+    for serial, username in rows:
+        result = OwnerAssignment(serial, username)
+        results.append(result)
+        device = index.device(serial)
+        if device is None:
+            result.status = UNKNOWN_DEVICE
+            continue
+        user = index.user(username)
+        result.udid = device.UDID
+        if user is None:
+            result.status = UNKNOWN_USER
+            continue
+        result.userId = user.id
+        result.previousOwner = device.owner.id if device.owner is not None else None
+        # several rows for one device: the last row wins, like a sequential run of the list
+        if result.udid in last:
+            last[result.udid].status = SUPERSEDED
+        last[result.udid] = result
+
+    todo = []
+    for result in last.values():
+        if result.previousOwner == result.userId:
+            result.status = UNCHANGED
+        else:
+            todo.append(result)
+
+    # the worker threads don't inherit the priority and the deadline of the caller
+    caller_priority = current_priority()
+    caller_deadline = current_deadline()
+
+    def assign(result: OwnerAssignment):
+        try:
+            with priority(caller_priority), use(caller_deadline):
+                ok = client.device_assign_new_owner(udid=result.udid, user=result.userId)
+        except Exception as e:
+            ok, result.error = False, f"{type(e).__name__}: {e}"
+        result.status = ASSIGNED if ok else FAILED
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="jamf-owners") as executor:
+        list(executor.map(assign, todo))
+
+    failed = sum(result.status == FAILED for result in todo)
+    if failed:
+        logger.warning("owner assignment: %d of %d calls failed", failed, len(todo))
+    return results
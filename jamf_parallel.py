@@ -0,0 +1,133 @@
+import os
+import threading
+
+from pydantic import ValidationError
+
+from jamf_objects import model_to_dict, construct_model
+
+"""
+
+parallel validation of large listing responses
+
+the entries of a listing (e.g. the devices array of /devices?includeApps=true)
+get split into chunks, every chunk is validated in a worker process.
+the workers send back plain dicts of the validated values (or the error text),
+not pickled pydantic objects, the main process rebuilds the models
+without validating them a second time (construct_model).
+
+the result keeps the order of the entries, so the calling code can report
+errors per entry exactly like the serial loop does.
+
+JamfSchool(parse_workers=...) keeps one ParsePool, the worker processes are started on the
+first large listing and reused by the following ones, JamfSchool.close() stops them.
+
+this pays off when the validation is the expensive part (pydantic 1 validates in python).
+pydantic 2 validates in compiled code, rebuilding the objects in the main process
+costs about as much as validating them there, so measure before turning it on.
+
+"""
+
+# below this number of entries the pool startup costs more than it saves
+PARALLEL_THRESHOLD = 2000
+
+
+def _validate_chunk(args):
+    cls, entries = args
+    results = []
+    for entry in entries:
+        try:
+            results.append((model_to_dict(cls(**entry)), None))
+        except (TypeError, ValidationError) as e:
+            results.append((None, f"{e}"))
+    return results
+
+
+def _chunks(entries: list, size: int):
+    for start in range(0, len(entries), size):
+        yield entries[start:start + size]
+
+
+class ParsePool(object):
+    """
+    process pool for parse_entries, started on first use and reused
+
+    :param workers: number of worker processes (defaults to the cpu count)
+    """
+
+    def __init__(self, workers: int = None):
+        self.workers = workers or os.cpu_count() or 1
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                from concurrent.futures import ProcessPoolExecutor
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def map(self, func, items):
+        from concurrent.futures.process import BrokenProcessPool
+        executor = self.executor
+        try:
+            return list(executor.map(func, items))
+        except BrokenProcessPool:
+            # a worker died, the next call starts a new pool
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False)
+            raise
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+
+def parse_entries(cls, entries: [dict], workers: int = None, chunk_size: int = None, pool: ParsePool = None) -> [tuple]:
+    """
+    validate entries of a listing across a process pool.
+
+    :param cls: model class, e.g. Device or User
+    :param entries: decoded entries of the listing
+    :param workers: number of worker processes (defaults to the cpu count, the size of the pool if given)
+    :param chunk_size: entries per worker task, defaults to a size which gives every worker ~4 tasks
+    :param pool: ParsePool to reuse, without one a pool is started and stopped for this call
+    :return: list of (model, None) or (None, error text), in the order of the entries
+    """
+    if workers is None:
+        workers = pool.workers if pool is not None else os.cpu_count() or 1
+    if workers <= 1 or len(entries) < PARALLEL_THRESHOLD:
+        return _serial(cls, entries)
+
+    if chunk_size is None:
+        chunk_size = max(256, -(-len(entries) // (workers * 4)))
+
+    chunks = ((cls, chunk) for chunk in _chunks(entries, chunk_size))
+    if pool is not None:
+        chunk_results = pool.map(_validate_chunk, chunks)
+    else:
+        temporary = ParsePool(workers)
+        try:
+            chunk_results = temporary.map(_validate_chunk, chunks)
+        finally:
+            temporary.close()
+
+    results = []
+    for chunk_result in chunk_results:
+        for data, error in chunk_result:
+            results.append((None, error) if error is not None else (construct_model(cls, data), None))
+    return results
+
+
+def _serial(cls, entries: [dict]) -> [tuple]:
+    results = []
+    for entry in entries:
+        try:
+            results.append((cls(**entry), None))
+        except (TypeError, ValidationError) as e:
+            results.append((None, f"{e}"))
+    return results
@@ -0,0 +1,110 @@
+import argparse
+import contextlib
+import cProfile
+import io
+import os
+import pstats
+
+from jamf_api import JamfSchool
+from jamf_metrics import MetricsHook, RequestMetrics
+from jamf_transport import RecordingTransport, ReplayTransport
+
+"""
+
+offline profiling of the listing parsers on recorded production data
+
+1. record the listings once (credentials from the env variables / keyring, like get_wifimac.py):
+
+    python jamf_profile.py record prod.ndjson
+
+2. profile as often as needed, offline and reproducible, optionally with grown payloads:
+
+    python jamf_profile.py replay prod.ndjson --payload_scale 10
+
+the report shows the time per phase (download, json decode, model validation) per call
+and the hot spots of the profile in json decoding, pydantic and the jamf modules.
+
+"""
+
+CALLS = {"get_device_list": lambda j: j.get_device_list(includeApps=True),
+         "dep_device_list": lambda j: j.dep_device_list(),
+         "user_list": lambda j: j.user_list()}
+
+# modules which count as decoding or model construction in the hot spot list
+HOT_SPOT_MODULES = ("json", "pydantic", "jamf_", "typing")
+
+
+class _PhaseCollector(MetricsHook):
+    def __init__(self):
+        self.metrics: [RequestMetrics] = []
+
+    def on_request(self, metrics: RequestMetrics):
+        self.metrics.append(metrics)
+
+
+def record(cassette: str, network_id: str = None, api_pw: str = None, url: str = None, calls: [str] = None):
+    """
+    run the listing calls against the real api and write them to the cassette
+    """
+    j = JamfSchool(network_id, api_pw, url, hooks=[], transport=RecordingTransport(cassette))
+    for name in calls or CALLS:
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = CALLS[name](j)
+        print(f"recorded {name}: {len(result or [])} entries")
+
+
+def profile_replay(cassette: str, calls: [str] = None, payload_scale: float = 1.0, timing: float = 0.0,
+                   top: int = 25) -> str:
+    """
+    replay the cassette, profile the listing calls
+
+    :param cassette: file written by record()
+    :param calls: names of CALLS to run (default all)
+    :param payload_scale: factor for the number of entries of the listings
+    :param timing: factor for the recorded network timing, 0 profiles only the client side
+    :param top: number of hot spots in the report
+    :return: the report
+    """
+    collector = _PhaseCollector()
+    j = JamfSchool("replay", "replay", "http://replay/api", hooks=[collector],
+                   transport=ReplayTransport(cassette, timing=timing, payload_scale=payload_scale))
+    report = io.StringIO()
+    profiler = cProfile.Profile()
+    for name in calls or CALLS:
+        collector.metrics.clear()
+        with contextlib.redirect_stdout(io.StringIO()):
+            profiler.enable()
+            result = CALLS[name](j)
+            profiler.disable()
+        for metrics in collector.metrics:
+            report.write(f"{name: <16} {metrics.endpoint: <12} {metrics.bytes / 2 ** 20:8.1f} MiB  "
+                         f"download {metrics.download_time:7.3f}s  decode {metrics.decode_time:7.3f}s  "
+                         f"validation {metrics.validation_time:7.3f}s  entities {len(result or [])}\n")
+
+    stats = pstats.Stats(profiler, stream=report)
+    report.write("\nhot spots (own time) in decoding and model construction:\n")
+    stats.sort_stats("tottime").print_stats("|".join(HOT_SPOT_MODULES), top)
+    report.write("\ncumulative:\n")
+    stats.sort_stats("cumulative").print_stats("|".join(HOT_SPOT_MODULES), top)
+    return report.getvalue()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="record and profile the listing calls of JamfSchool")
+    parser.add_argument('mode', choices=("record", "replay"))
+    parser.add_argument('cassette')
+    parser.add_argument('--calls', nargs="*", default=None, choices=list(CALLS))
+    parser.add_argument('--payload_scale', type=float, default=1.0)
+    parser.add_argument('--timing', type=float, default=0.0,
+                        help="factor for the recorded network timing (replay), 0 disables the delays")
+    parser.add_argument('--top', type=int, default=25)
+    parser.add_argument('--location_id', default=os.environ.get('JAMF_LOCATION_ID'))
+    parser.add_argument('--api_key', default=os.environ.get('JAMF_API_KEY'))
+    parser.add_argument('--url', default=os.environ.get('JAMF_URL'))
+    args = parser.parse_args()
+
+    if args.mode == "record":
+        record(args.cassette, args.location_id, args.api_key, args.url, calls=args.calls)
+    else:
+        print(profile_replay(args.cassette, calls=args.calls, payload_scale=args.payload_scale,
+                             timing=args.timing, top=args.top))
@@ -0,0 +1,204 @@
+import threading
+from bisect import bisect_left
+
+"""
+
+id / name registries of locations, device groups, user groups and profiles
+
+resolving a name with the lists of the api means a linear scan with the __eq__ of the objects
+(Location lower-cases and substring matches the name on every comparison). a Registry indexes the
+entities once:
+    by id
+    by exact name
+    by normalized name (stripped, lower case)
+    by prefix (sorted names, bisect)
+    by substring (trigram index, candidates get verified against the name)
+
+names are not unique (e.g. "Cart 1" in every location), the lookups return the first entity
+in the order of the api listing, locationId= restricts them to one location.
+
+    registries = j.registries
+    registries.device_groups.named("Cart 1", locationId=3).id
+    registries.user_groups.resolve(["5a", "5b", "6a"], locationId=3)    # {name: id}
+    registries.locations.search("gymnasium")
+    registries.refresh("profiles")
+
+"""
+
+
+def normalize(name: str) -> str:
+    return (name or "").strip().lower()
+
+
+def _trigrams(text: str) -> {str}:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class Registry(object):
+    """
+    read only index of one entity list, gets replaced as a whole on refresh
+    """
+
+    def __init__(self, entities: list = ()):
+        self.entities = [entity for entity in entities or [] if entity is not None]
+        self._by_id = {}
+        self._by_name = {}  # name -> [position]
+        self._by_normalized = {}  # normalized name -> [position]
+        self._lowered = []  # position -> name.lower(), what the substring search compares with
+        self._trigrams = {}  # trigram of the lowered name -> {position}
+        for position, entity in enumerate(self.entities):
+            self._by_id.setdefault(entity.id, entity)
+            name = entity.name or ""
+            lowered = name.lower()
+            self._lowered.append(lowered)
+            self._by_name.setdefault(name, []).append(position)
+            self._by_normalized.setdefault(normalize(name), []).append(position)
+            for trigram in _trigrams(lowered):
+                self._trigrams.setdefault(trigram, set()).add(position)
+        self._sorted = sorted((normalized, position) for normalized, positions in self._by_normalized.items()
+                              for position in positions)
+
+    def __len__(self):
+        return len(self.entities)
+
+    def __iter__(self):
+        return iter(self.entities)
+
+    def __contains__(self, id):
+        return id in self._by_id
+
+    def get(self, id: int):
+        return self._by_id.get(id)
+
+    def _first(self, positions, locationId: int = None):
+        for position in positions or []:
+            entity = self.entities[position]
+            if locationId is None or entity.locationId == locationId:
+                return entity
+        return None
+
+    def named(self, name: str, locationId: int = None):
+        """
+        entity with the exact name, or with the same normalized name
+
+        :param locationId: only entities of this location
+        :return: first match in listing order or None
+        """
+        entity = self._first(self._by_name.get(name), locationId)
+        if entity is None:
+            entity = self._first(self._by_normalized.get(normalize(name)), locationId)
+        return entity
+
+    def all_named(self, name: str) -> list:
+        return [self.entities[position] for position in self._by_normalized.get(normalize(name), [])]
+
+    def prefix(self, text: str) -> list:
+        """
+        entities whose normalized name starts with the normalized text, in listing order
+        """
+        text = normalize(text)
+        positions = []
+        for normalized, position in self._sorted[bisect_left(self._sorted, (text, -1)):]:
+            if not normalized.startswith(text):
+                break
+            positions.append(position)
+        return [self.entities[position] for position in sorted(positions)]
+
+    def search(self, text: str) -> list:
+        """
+        entities whose name contains the text (case insensitive), in listing order
+        """
+        text = (text or "").lower()
+        if len(text) < 3:
+            positions = range(len(self.entities))
+        else:
+            postings = sorted((self._trigrams.get(trigram, set()) for trigram in _trigrams(text)), key=len)
+            positions = sorted(set.intersection(*postings)) if postings[0] else []
+        return [self.entities[position] for position in positions if text in self._lowered[position]]
+
+    def find(self, value):
+        """
+        the lookup of Location.__eq__: an int is an id, a str the first entity whose name contains it
+        """
+        if isinstance(value, int):
+            return self.get(value)
+        if isinstance(value, str):
+            found = self.search(value)
+            return found[0] if found else None
+        return value if any(value is entity for entity in self.entities) else None
+
+    def resolve(self, names: [str], locationId: int = None) -> {str: int}:
+        """
+        ids of many names at once, names which are not found are left out
+        """
+        resolved = {}
+        for name in names:
+            entity = self.named(name, locationId)
+            if entity is not None:
+                resolved[name] = entity.id
+        return resolved
+
+    def __repr__(self):
+        return f"Registry({len(self.entities)})"
+
+
+class Registries(object):
+    """
+    the registries of a client, every registry gets loaded on first use
+
+    :param client: JamfSchool instance
+    """
+    LOADERS = {
+        "locations": lambda client: client.location_list(),
+        "device_groups": lambda client: client.device_groups_list(),
+        "user_groups": lambda client: client.get_user_group_list(),
+        "profiles": lambda client: client.get_profiles(),
+    }
+
+    def __init__(self, client):
+        self.client = client
+        self._registries = {}
+        self._lock = threading.RLock()
+
+    def _get(self, kind: str) -> Registry:
+        registry = self._registries.get(kind)
+        if registry is None:
+            with self._lock:
+                registry = self._registries.get(kind)
+                if registry is None:
+                    registry = self._registries[kind] = Registry(self.LOADERS[kind](self.client))
+        return registry
+
+    @property
+    def locations(self) -> Registry:
+        return self._get("locations")
+
+    @property
+    def device_groups(self) -> Registry:
+        return self._get("device_groups")
+
+    @property
+    def user_groups(self) -> Registry:
+        return self._get("user_groups")
+
+    @property
+    def profiles(self) -> Registry:
+        return self._get("profiles")
+
+    def refresh(self, *kinds: str):
+        """
+        load the registries again (all if no kind is given)
+        """
+        for kind in kinds or self.LOADERS:
+            if kind == "locations":
+                # the client caches the location list
+                self.client.locations = None
+            registry = Registry(self.LOADERS[kind](self.client))
+            with self._lock:
+                self._registries[kind] = registry
+        return self
+
+    def invalidate(self, *kinds: str):
+        with self._lock:
+            for kind in kinds or list(self._registries):
+                self._registries.pop(kind, None)
@@ -0,0 +1,328 @@
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from jamf_metrics import logger
+from jamf_transport import RequestsTransport, endpoint_path
+
+"""
+
+hedged requests and circuit breaking
+
+ResilientTransport wraps another transport (like the RecordingTransport) and adds per endpoint:
+
+hedging (opt-in, GET only)
+    the transport learns the p95 latency of every endpoint. if a hedged GET has not answered
+    after the p95, the same request is sent a second time and the first response wins.
+    the hedge budget caps the extra requests to a share of all requests (default 10%).
+
+circuit breaker
+    after threshold failures in a row (exceptions or 500/502/503/504) the endpoint is open:
+    calls fail fast with CircuitOpenError instead of waiting for the timeout. after reset_timeout
+    one call is let through (half open), if it succeeds the endpoint is closed again.
+
+    transport = ResilientTransport(hedge=["devices/:id", "dep/:id"])
+    j = JamfSchool(network_id, api_pw, url, transport=transport)
+    exporter.add_collector(transport.gauges)     # hedge win rate, breaker state, p95
+    transport.stats()
+
+endpoints are the path below the api base with the ids replaced by :id, e.g. devices/:id/details.
+
+"""
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+BREAKER_STATES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+FAILURE_STATUS = (500, 502, 503, 504)
+
+_WORD = re.compile(r"[a-z]+")
+
+
+def endpoint_template(url: str) -> str:
+    """
+    https://x.jamfcloud.com/api/devices/00008030-001A2B3C/details?x=1 -> devices/:id/details
+    """
+    path = endpoint_path(url)
+    return "/".join(part if _WORD.fullmatch(part) else ":id" for part in path.split("/"))
+
+
+class CircuitOpenError(ConnectionError):
+    def __init__(self, endpoint: str, retry_in: float):
+        super().__init__(f"circuit of {endpoint} is open, retry in {retry_in:.1f}s")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+class CircuitBreaker(object):
+    """
+    :param threshold: failures in a row which open the circuit
+    :param reset_timeout: seconds until an open circuit lets a probe call through
+    """
+
+    def __init__(self, threshold: int = 5, reset_timeout: float = 30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.rejected = 0
+        self.opened = 0  # how often the circuit opened
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def retry_in(self) -> float:
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == OPEN and self.retry_in() == 0.0:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, ok: bool):
+        with self._lock:
+            if ok:
+                self.state = CLOSED
+                self.failures = 0
+                self._opened_at = None
+                self._probing = False
+                return
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.threshold):
+                if self.state == CLOSED:
+                    self.opened += 1
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+class LatencyTracker(object):
+    """
+    latencies of the last window calls, the quantile gets recomputed every 16 calls
+    """
+
+    def __init__(self, window: int = 200, quantile: float = 0.95, min_samples: int = 20):
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._value = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+            self._pending += 1
+            if self._pending >= 16 or self._value is None:
+                self._pending = 0
+                if len(self._samples) >= self.min_samples:
+                    ordered = sorted(self._samples)
+                    self._value = ordered[min(len(ordered) - 1, int(len(ordered) * self.quantile))]
+
+    @property
+    def value(self):
+        """
+        the learned quantile, None until min_samples calls were measured
+        """
+        return self._value
+
+
+class HedgeBudget(object):
+    """
+    every request earns ratio tokens (up to burst), every hedge costs one
+    """
+
+    def __init__(self, ratio: float = 0.1, burst: float = 10.0):
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+
+    def earn(self):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def take(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+class _EndpointStats(object):
+    __slots__ = ("requests", "hedges", "hedge_wins", "failures", "latency", "breaker")
+
+    def __init__(self, latency: LatencyTracker, breaker: CircuitBreaker):
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failures = 0
+        self.latency = latency
+        self.breaker = breaker
+
+
+class ResilientTransport(object):
+    """
+    :param inner: transport which sends the requests (defaults to a RequestsTransport)
+    :param hedge: endpoint templates whose GETs get hedged, True for every GET
+    :param hedge_budget: hedges per request at most
+    :param hedge_delay: delay of the hedge until the p95 of the endpoint is known (None: no hedge until then)
+    :param quantile: latency quantile after which a hedge is sent
+    :param breaker_threshold: failures in a row which open the circuit of an endpoint (0: no circuit breaker)
+    :param breaker_reset: seconds an open circuit fails fast
+    :param failure_status: http status codes which count as failure for the circuit breaker
+    :param workers: threads which send the hedged requests
+    """
+
+    def __init__(self, inner=None, hedge=(), hedge_budget: float = 0.1, hedge_delay: float = None,
+                 quantile: float = 0.95, breaker_threshold: int = 5, breaker_reset: float = 30.0,
+                 failure_status: [int] = FAILURE_STATUS, workers: int = 16):
+        self.inner = inner if inner is not None else RequestsTransport()
+        self.hedge = hedge if hedge is True else frozenset(hedge or ())
+        self.budget = HedgeBudget(hedge_budget)
+        self.hedge_delay = hedge_delay
+        self.quantile = quantile
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self.failure_status = frozenset(failure_status)
+        self.workers = workers
+        self._endpoints: {str: _EndpointStats} = {}
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _stats(self, endpoint: str) -> _EndpointStats:
+        stats = self._endpoints.get(endpoint)
+        if stats is None:
+            with self._lock:
+                stats = self._endpoints.get(endpoint)
+                if stats is None:
+                    stats = self._endpoints[endpoint] = _EndpointStats(
+                        LatencyTracker(quantile=self.quantile),
+                        CircuitBreaker(self.breaker_threshold, self.breaker_reset))
+        return stats
+
+    def _hedged(self, method: str, endpoint: str) -> bool:
+        return method == "GET" and (self.hedge is True or endpoint in self.hedge)
+
+    def request(self, method: str, url: str, **kwargs):
+        endpoint = endpoint_template(url)
+        stats = self._stats(endpoint)
+        if self.breaker_threshold and not stats.breaker.allow():
+            raise CircuitOpenError(endpoint, stats.breaker.retry_in())
+        self._count(stats, "requests")
+        try:
+            if self._hedged(method, endpoint):
+                r = self._send_hedged(stats, method, url, kwargs)
+            else:
+                r = self._send(stats, method, url, kwargs, read=False)
+        except Exception:
+            self._count(stats, "failures")
+            stats.breaker.record(False)
+            raise
+        failed = r.status_code in self.failure_status
+        if failed:
+            self._count(stats, "failures")
+        stats.breaker.record(not failed)
+        return r
+
+    def _count(self, stats: _EndpointStats, counter: str):
+        with self._lock:
+            setattr(stats, counter, getattr(stats, counter) + 1)
+
+    def _send(self, stats: _EndpointStats, method: str, url: str, kwargs: dict, read: bool = True):
+        start = time.perf_counter()
+        r = self.inner.request(method, url, **kwargs)
+        if read:
+            # the hedge covers the download of the body as well
+            r.content
+        stats.latency.add(time.perf_counter() - start)
+        return r
+
+    def _send_hedged(self, stats: _EndpointStats, method: str, url: str, kwargs: dict):
+        self.budget.earn()
+        delay = stats.latency.value if stats.latency.value is not None else self.hedge_delay
+        if delay is None:
+            return self._send(stats, method, url, kwargs)
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="jamf-hedge")
+        primary = self._executor.submit(self._send, stats, method, url, kwargs)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self.budget.take():
+            return primary.result()
+
+        self._count(stats, "hedges")
+        hedge = self._executor.submit(self._send, stats, method, url, kwargs)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                if future is hedge:
+                    self._count(stats, "hedge_wins")
+                for loser in pending:
+                    loser.add_done_callback(_close)
+                return future.result()
+        raise error
+
+    def stats(self) -> {str: dict}:
+        """
+        per endpoint: requests, failures, hedges, hedge wins and win rate, p95 latency, breaker state
+        """
+        return {endpoint: {"requests": stats.requests,
+                           "failures": stats.failures,
+                           "hedges": stats.hedges,
+                           "hedge_wins": stats.hedge_wins,
+                           "hedge_win_rate": stats.hedge_wins / stats.hedges if stats.hedges else 0.0,
+                           "latency_p95": stats.latency.value,
+                           "breaker": stats.breaker.state,
+                           "breaker_rejected": stats.breaker.rejected,
+                           "breaker_opened": stats.breaker.opened}
+                for endpoint, stats in list(self._endpoints.items())}
+
+    def gauges(self) -> [tuple]:
+        """
+        (name, labels, value) for PrometheusExporter.add_collector
+        """
+        result = []
+        for endpoint, stats in self.stats().items():
+            labels = (("endpoint", endpoint),)
+            result.append(("hedge_requests", labels, stats["hedges"]))
+            result.append(("hedge_wins", labels, stats["hedge_wins"]))
+            result.append(("hedge_win_rate", labels, stats["hedge_win_rate"]))
+            result.append(("circuit_breaker_state", labels, BREAKER_STATES[stats["breaker"]]))
+            result.append(("circuit_breaker_rejected", labels, stats["breaker_rejected"]))
+            if stats["latency_p95"] is not None:
+                result.append(("latency_p95_seconds", labels, stats["latency_p95"]))
+        return result
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+def _close(future):
+    if future.exception() is None:
+        try:
+            future.result().close()
+        except Exception:
+            logger.debug("closing the response of a lost hedge failed", exc_info=True)
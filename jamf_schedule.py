@@ -0,0 +1,242 @@
+from bisect import bisect_right
+from datetime import date, datetime, time, timedelta
+
+from jamf_objects import Profile
+
+"""
+
+weekly time-window index of the profile schedules
+
+a profile with daysOfTheWeek / startTime / endTime is only active in that window:
+    daysOfTheWeek           "1" (monday) .. "7" (sunday), empty: every day
+    startTime, endTime      "HH:MM" or "HH:MM:SS", without times the whole day,
+                            an endTime before the startTime runs past midnight into the next day
+    restrictedWeekendUse    active the whole saturday and sunday as well
+    useHolidays             active the whole day on the holidays passed to the index
+profiles without days and times are always active, profiles with a status other than Active never.
+
+the windows of all profiles get compiled into the elementary segments of one week (the points where
+any profile starts or stops split the week), every segment holds the set of active profile ids.
+"which profiles are active" and "when does a profile change its state" are a bisect over the segments
+or the change points of the profile. times are naive datetimes in the time zone of the school.
+
+    schedule = j.profile_schedule(holidays=[date(2024, 12, 23), (date(2025, 2, 10), date(2025, 2, 14))])
+    schedule.active_at(datetime.now())                      # {profile id}
+    schedule.next_change(2555, datetime.now())              # datetime or None
+    schedule.for_location(3).changes(monday, monday + timedelta(days=5))
+
+"""
+
+WEEK = 7 * 24 * 3600
+DAY = 24 * 3600
+
+
+def _seconds(value: str) -> int:
+    """
+    "08:15" / "08:15:30" -> seconds since midnight
+    """
+    parts = [int(part) for part in str(value).strip().split(":")]
+    parts += [0] * (3 - len(parts))
+    return parts[0] * 3600 + parts[1] * 60 + parts[2]
+
+
+def _week_start(t: datetime) -> datetime:
+    return datetime.combine(t.date() - timedelta(days=t.weekday()), time())
+
+
+def _offset(t: datetime) -> float:
+    return (t - _week_start(t)).total_seconds()
+
+
+def windows(profile: Profile) -> [(int, int)]:
+    """
+    the weekly windows of the profile as [start, end) in seconds since monday 00:00, sorted and merged
+    """
+    if profile.status is not None and profile.status.value not in (None, "Active"):
+        return []
+    days = sorted({int(day) for day in profile.daysOfTheWeek or []})
+    if not days and not profile.startTime and not profile.endTime:
+        return [(0, WEEK)]
+    days = days or list(range(1, 8))
+    start = _seconds(profile.startTime) if profile.startTime else 0
+    end = _seconds(profile.endTime) if profile.endTime else DAY
+    if end <= start:
+        # runs past midnight
+        end += DAY
+    raw = []
+    for day in days:
+        begin = (day - 1) * DAY
+        raw.append((begin + start, begin + end))
+    if profile.restrictedWeekendUse:
+        raw.append((5 * DAY, 7 * DAY))
+    # split the windows which run past the end of the week
+    split = []
+    for begin, end in raw:
+        if end > WEEK:
+            split += [(begin, WEEK), (0, end - WEEK)]
+        else:
+            split.append((begin, end))
+    merged = []
+    for begin, end in sorted(split):
+        if merged and begin <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((begin, end))
+    return merged
+
+
+class ScheduleIndex(object):
+    """
+    :param profiles: profiles of get_profiles
+    :param holidays: dates or (first, last) date ranges, used by the profiles with useHolidays
+    """
+
+    def __init__(self, profiles: [Profile] = (), holidays=()):
+        self.profiles: {int: Profile} = {profile.id: profile for profile in profiles or [] if profile is not None}
+        self.holidays: [date] = sorted(self._expand(holidays or []))
+        self._holiday_set = frozenset(self.holidays)
+        self._holiday_profiles = frozenset(id for id, profile in self.profiles.items() if profile.useHolidays)
+        self._for_location = {}
+
+        # change points of every profile: sorted offsets, the profile is active from an even index
+        # to the following odd index
+        self._points: {int: [int]} = {}
+        # offsets where the state of the profile really changes (not the end of one week and
+        # the start of the next one inside the same window)
+        self._changes: {int: [int]} = {}
+        events = {0}
+        for id, profile in self.profiles.items():
+            self._points[id] = [point for window in windows(profile) for point in window]
+            self._changes[id] = sorted({point % WEEK for point in self._points[id]
+                                        if self._in_windows(id, point % WEEK)
+                                        != self._in_windows(id, (point - 0.5) % WEEK)})
+            events.update(self._changes[id])
+        self._bounds = sorted(events)
+        self._segments = [frozenset(id for id in self.profiles if self._in_windows(id, bound))
+                          for bound in self._bounds]
+
+    @staticmethod
+    def _expand(holidays) -> {date}:
+        days = set()
+        for holiday in holidays:
+            if isinstance(holiday, (tuple, list)):
+                first, last = holiday
+                days.update(first + timedelta(days=i) for i in range((last - first).days + 1))
+            elif isinstance(holiday, datetime):
+                days.add(holiday.date())
+            else:
+                days.add(holiday)
+        return days
+
+    def _in_windows(self, id: int, offset: float) -> bool:
+        return bisect_right(self._points[id], offset) % 2 == 1
+
+    def _weekly(self, offset: float) -> frozenset:
+        return self._segments[bisect_right(self._bounds, offset) - 1]
+
+    def is_holiday(self, day: date) -> bool:
+        return day in self._holiday_set
+
+    def active_at(self, t: datetime) -> {int}:
+        """
+        ids of the profiles which are active at t
+        """
+        active = self._weekly(_offset(t))
+        if self._holiday_profiles and t.date() in self._holiday_set:
+            active = active | self._holiday_profiles
+        return set(active)
+
+    def is_active(self, id: int, t: datetime) -> bool:
+        if id in self._holiday_profiles and t.date() in self._holiday_set:
+            return True
+        return id in self._points and self._in_windows(id, _offset(t))
+
+    def _next_weekly(self, points: [int], t: datetime) -> datetime:
+        offset = _offset(t)
+        index = bisect_right(points, offset)
+        week = _week_start(t)
+        if index < len(points):
+            return week + timedelta(seconds=points[index])
+        return week + timedelta(seconds=WEEK + points[0])
+
+    def _next_holiday_bound(self, t: datetime):
+        """
+        next midnight where a run of holidays starts or ends
+        """
+        day = t.date()
+        if day in self._holiday_set:
+            while day in self._holiday_set:
+                day += timedelta(days=1)
+            return datetime.combine(day, time())
+        index = bisect_right(self.holidays, day)
+        return datetime.combine(self.holidays[index], time()) if index < len(self.holidays) else None
+
+    def next_change(self, id: int, t: datetime):
+        """
+        first point after t where the profile gets activated or deactivated
+
+        :return: datetime, None if the state of the profile never changes
+        """
+        points = self._changes.get(id) or []
+        holidays = id in self._holiday_profiles and self.holidays
+        if not points and not holidays:
+            return None
+        state = self.is_active(id, t)
+        current = t
+        # every candidate is a weekly change point or a holiday bound, without a change for
+        # a week after the last holiday the state is constant
+        horizon = max(t.date(), self.holidays[-1] if holidays else t.date()) + timedelta(days=8)
+        while current.date() <= horizon:
+            candidates = [self._next_weekly(points, current)] if points else []
+            if holidays:
+                bound = self._next_holiday_bound(current)
+                if bound is not None:
+                    candidates.append(bound)
+            if not candidates:
+                return None
+            current = min(candidates)
+            if self.is_active(id, current) != state:
+                return current
+        return None
+
+    def changes(self, start: datetime, end: datetime) -> [(datetime, {int})]:
+        """
+        the active profiles between start and end, as (point, active ids) for start
+        and every point where the set changes
+        """
+        result = [(start, self.active_at(start))]
+        current = start
+        while True:
+            offset = _offset(current)
+            index = bisect_right(self._bounds, offset)
+            week = _week_start(current)
+            following = week + timedelta(seconds=self._bounds[index] if index < len(self._bounds) else WEEK)
+            if self._holiday_profiles and self.holidays:
+                bound = self._next_holiday_bound(current)
+                if bound is not None and bound < following:
+                    following = bound
+            if following >= end:
+                return result
+            current = following
+            active = self.active_at(current)
+            if active != result[-1][1]:
+                result.append((current, active))
+
+    def evaluate(self, times: [datetime]) -> [{int}]:
+        """
+        the active profiles at many points, e.g. every minute of a school week
+        """
+        return [self.active_at(t) for t in times]
+
+    def for_location(self, locationId: int) -> "ScheduleIndex":
+        """
+        index of the profiles of one location (cached)
+        """
+        index = self._for_location.get(locationId)
+        if index is None:
+            profiles = [profile for profile in self.profiles.values() if profile.locationId == locationId]
+            index = self._for_location[locationId] = ScheduleIndex(profiles, self.holidays)
+        return index
+
+    def __repr__(self):
+        return f"ScheduleIndex(profiles={len(self.profiles)}, segments={len(self._bounds)})"
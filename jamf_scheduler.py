@@ -0,0 +1,203 @@
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+"""
+
+priority aware request scheduler
+
+interactive calls (helpdesk ui) and bulk jobs (group reconcile, dep updates, details crawl)
+share the rate budget of one tenant. with JamfSchool(..., scheduler=RequestScheduler()) every
+http request takes a slot of the scheduler first (without a scheduler the requests are not limited):
+
+    - at most max_concurrency requests run at the same time
+    - every priority class has a share of the slots (bulk: 0.5 -> never more than half),
+      the rest stays free for the interactive calls
+    - free slots go to the waiting interactive calls first
+    - interactive calls wait at most their queueing deadline, then SchedulerTimeout is raised
+      (a fast error is better for a ui than a request which hangs behind a bulk job)
+
+the priority is passed to every JamfSchool method as keyword argument, or for a whole block:
+
+    j.get_device_details(udid=udid, priority="interactive")
+    with priority("bulk"):
+        for udid in udids:
+            j.device_update_details(udid, assetTag=...)
+
+without a priority the calls are interactive.
+
+queue depth and wait time are in stats(), the wait time of every request is in
+RequestMetrics.queue_wait, gauges() can be registered at the PrometheusExporter.
+
+"""
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+# highest priority first
+PRIORITIES = (INTERACTIVE, BULK)
+
+_priority = contextvars.ContextVar("jamf_priority", default=None)
+
+
+class SchedulerTimeout(TimeoutError):
+    pass
+
+
+def current_priority(default: str = INTERACTIVE) -> str:
+    value = _priority.get()
+    return default if value is None else value
+
+
+@contextmanager
+def priority(value: str):
+    """
+    run every api call in the block with the given priority
+    """
+    token = _priority.set(value)
+    try:
+        yield value
+    finally:
+        _priority.reset(token)
+
+
+def prioritized(method):
+    """
+    adds the priority keyword argument to a JamfSchool method
+    (not a parameter of the method itself, the methods build their payloads from locals())
+    """
+    @wraps(method)
+    def wrapper(self, *args, priority: str = None, **kwargs):
+        if priority is None:
+            return method(self, *args, **kwargs)
+        token = _priority.set(priority)
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            _priority.reset(token)
+    return wrapper
+
+
+class RequestScheduler(object):
+    """
+    :param max_concurrency: requests which may run at the same time
+    :param shares: share of max_concurrency per priority class (at least one slot each)
+    :param deadlines: seconds a request of the class may wait for a slot (None: no limit)
+    """
+
+    def __init__(self, max_concurrency: int = 8, shares: dict = None, deadlines: dict = None):
+        self.max_concurrency = max_concurrency
+        shares = dict({INTERACTIVE: 1.0, BULK: 0.5}, **(shares or {}))
+        self.limits = {name: max(1, int(max_concurrency * share)) for name, share in shares.items()}
+        self.deadlines = dict({INTERACTIVE: 5.0, BULK: None}, **(deadlines or {}))
+        self.order = list(PRIORITIES) + sorted(set(self.limits) - set(PRIORITIES))
+        self._condition = threading.Condition()
+        self._queues = {name: deque() for name in self.order}
+        self._active = {name: 0 for name in self.order}
+        self._running = 0
+        self._counters = {name: {"requests": 0, "timeouts": 0, "wait_total": 0.0, "wait_max": 0.0}
+                          for name in self.order}
+
+    def _check(self, name: str):
+        if name not in self._queues:
+            raise ValueError(f"unknown priority {name}, use one of {', '.join(self.order)}")
+
+    def _runnable(self, name: str, ticket) -> bool:
+        if self._running >= self.max_concurrency or self._active[name] >= self.limits[name]:
+            return False
+        if self._queues[name][0] is not ticket:
+            return False
+        # a higher class which could use the slot goes first
+        for other in self.order:
+            if other == name:
+                return True
+            if self._queues[other] and self._active[other] < self.limits[other]:
+                return False
+        return True
+
+    def acquire(self, name: str = None, timeout: float = None) -> float:
+        """
+        wait for a slot
+
+        :param name: priority class, defaults to the current priority
+        :param timeout: seconds to wait at most, if shorter than the queueing deadline of the class
+        :return: seconds waited
+        :raises SchedulerTimeout: the queueing deadline of the class (or the timeout) passed
+        """
+        name = current_priority() if name is None else name
+        self._check(name)
+        deadline = self.deadlines.get(name)
+        if timeout is not None:
+            deadline = timeout if deadline is None else min(deadline, timeout)
+        start = time.perf_counter()
+        ticket = object()
+        with self._condition:
+            queue = self._queues[name]
+            queue.append(ticket)
+            try:
+                while not self._runnable(name, ticket):
+                    remaining = None if deadline is None else deadline - (time.perf_counter() - start)
+                    if remaining is not None and remaining <= 0:
+                        self._counters[name]["timeouts"] += 1
+                        raise SchedulerTimeout(f"no free request slot for {name} within {deadline}s "
+                                               f"({self._running} running, {self.queue_depth()} queued)")
+                    self._condition.wait(remaining)
+            finally:
+                queue.remove(ticket)
+                # the next one in the queue may be runnable now
+                self._condition.notify_all()
+            self._active[name] += 1
+            self._running += 1
+            waited = time.perf_counter() - start
+            counters = self._counters[name]
+            counters["requests"] += 1
+            counters["wait_total"] += waited
+            counters["wait_max"] = max(counters["wait_max"], waited)
+        return waited
+
+    def release(self, name: str = None):
+        name = current_priority() if name is None else name
+        with self._condition:
+            self._active[name] -= 1
+            self._running -= 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, name: str = None):
+        name = current_priority() if name is None else name
+        waited = self.acquire(name)
+        try:
+            yield waited
+        finally:
+            self.release(name)
+
+    def queue_depth(self, name: str = None) -> int:
+        if name is not None:
+            return len(self._queues[name])
+        return sum(len(queue) for queue in self._queues.values())
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {name: {"queued": len(self._queues[name]), "active": self._active[name],
+                           "limit": self.limits[name], "deadline": self.deadlines.get(name),
+                           "requests": self._counters[name]["requests"],
+                           "timeouts": self._counters[name]["timeouts"],
+                           "wait_mean": (self._counters[name]["wait_total"] / self._counters[name]["requests"]
+                                         if self._counters[name]["requests"] else 0.0),
+                           "wait_max": self._counters[name]["wait_max"]}
+                    for name in self.order}
+
+    def gauges(self) -> [tuple]:
+        """
+        (name, labels, value) for PrometheusExporter.add_collector
+        """
+        result = []
+        for name, stats in self.stats().items():
+            labels = (("priority", name),)
+            result.append(("scheduler_queue_depth", labels, stats["queued"]))
+            result.append(("scheduler_active_requests", labels, stats["active"]))
+            result.append(("scheduler_timeouts", labels, stats["timeouts"]))
+        return result
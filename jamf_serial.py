@@ -0,0 +1,30 @@
+import re
+
+"""
+
+serial numbers of the devices
+
+the barcode scanners of the handout lists prepend an "S" (Serialnumber) to the serial,
+parse_serialnumber and the OwnerIndex of jamf_owners strip it the same way.
+
+    parse_serialnumber("SDMPLXXXXXXXX")     # "DMPLXXXXXXXX"
+
+"""
+
+
+def strip_serial_prefix(serialnumber: str) -> str:
+    """
+    the barcode scanners prepend an "S" (Serialnumber) to the serial
+    """
+    if serialnumber.startswith("S"):
+        return serialnumber[1:]
+    return serialnumber
+
+
+def parse_serialnumber(serialnumber: str):
+    serialnumber = strip_serial_prefix(serialnumber)  # remove Serialnumber preix if present.
+    regex = re.compile("[A-Z0-9]{12}")
+    if regex.fullmatch(serialnumber):
+        return serialnumber
+    else:
+        raise ValueError(f"given serialnumber: *{serialnumber}* is not a valid serialnumber.")
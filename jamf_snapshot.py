@@ -0,0 +1,344 @@
+import json
+import mmap
+import os
+import struct
+import time
+from typing import get_type_hints
+
+from jamf_codec import dumps, loads
+from jamf_objects import Device, Placeholder, User, construct_model
+
+"""
+
+memory mapped binary snapshot of the devices, users and dep placeholders
+
+short lived processes (cli calls, worker processes) open a snapshot instead of fetching the listings
+or unpickling them. the file is opened with mmap, a lookup reads only the pages of the index entries
+it compares and of the one record, all readers of a snapshot share it through the page cache.
+
+layout:
+    b"JAMFSNAP", version (u32), header length (u32), header (json), padding to 8 bytes
+    per section (devices, users, placeholders):
+        records     fixed size records, one slot per field of the model:
+                        str, nested values (json)   u32 offset into the string table
+                        int                         i64
+                        float                       f64
+                        bool                        i8 (-1: None)
+        indexes     per key field (devices: serialNumber, UDID): (u32 string offset, u32 record)
+                    sorted by the key
+    string table    u32 length + utf-8 bytes per string, every string once
+
+    write_snapshot("fleet.snap", devices=j.get_device_list(), users=j.user_list())
+    capture_snapshot(j, "fleet.snap")
+
+    with SnapshotReader("fleet.snap") as snapshot:
+        snapshot.device(serialNumber="DMPLXXXXXXXX")        # Device
+        snapshot.get("devices", "UDID", udid)
+        snapshot.field("devices", "serialNumber", "DMPLXXXXXXXX", "WiFiMAC")   # one slot only
+        for user in snapshot.iter("users"): ...
+
+the models are rebuilt without validation (they were validated before they were written).
+a new snapshot gets written to a temporary file and renamed, open readers keep the old one.
+
+"""
+
+MAGIC = b"JAMFSNAP"
+VERSION = 1
+
+STR = "str"
+INT = "int"
+FLOAT = "float"
+BOOL = "bool"
+JSON = "json"
+
+_FORMATS = {STR: "I", JSON: "I", INT: "q", FLOAT: "d", BOOL: "b"}
+NO_STRING = 0xFFFFFFFF
+NO_INT = -2 ** 63
+NO_BOOL = -1
+
+# section -> (model, key fields)
+SECTIONS = {
+    "devices": (Device, ("serialNumber", "UDID")),
+    "users": (User, ("username", "id")),
+    "placeholders": (Placeholder, ("serialNumber",)),
+}
+MODELS = {Device.__name__: Device, User.__name__: User, Placeholder.__name__: Placeholder}
+
+
+def _schema(cls) -> [(str, str)]:
+    """
+    (field name, slot type) of every field of the model
+    """
+    hints = get_type_hints(cls)
+    fields = getattr(cls, "model_fields", None) or cls.__fields__
+    schema = []
+    for name in fields:
+        annotation = hints.get(name)
+        if annotation is bool:
+            schema.append((name, BOOL))
+        elif annotation is int:
+            schema.append((name, INT))
+        elif annotation is float:
+            schema.append((name, FLOAT))
+        elif annotation is str:
+            schema.append((name, STR))
+        else:
+            schema.append((name, JSON))
+    return schema
+
+
+class _Strings(object):
+    def __init__(self):
+        self.offsets = {}
+        self.chunks = []
+        self.size = 0
+
+    def add(self, value: str) -> int:
+        offset = self.offsets.get(value)
+        if offset is None:
+            data = value.encode("utf-8")
+            offset = self.offsets[value] = self.size
+            self.chunks.append(struct.pack("<I", len(data)))
+            self.chunks.append(data)
+            self.size += 4 + len(data)
+        return offset
+
+
+def _slot(kind: str, value, strings: _Strings):
+    if kind == STR:
+        return NO_STRING if value is None else strings.add(f"{value}")
+    if kind == JSON:
+        return NO_STRING if value is None else strings.add(dumps(value).decode("utf-8"))
+    if kind == INT:
+        return NO_INT if value is None else int(value)
+    if kind == FLOAT:
+        return float("nan") if value is None else float(value)
+    return NO_BOOL if value is None else int(bool(value))
+
+
+def _key(value) -> str:
+    return None if value is None else f"{value}"
+
+
+def write_snapshot(path: str, devices=None, users=None, placeholders=None) -> dict:
+    """
+    :param devices: Device (or LazyDevice) objects
+    :param users: User (or LazyUser) objects
+    :param placeholders: Placeholder objects
+    :return: the header of the snapshot
+    """
+    entities = {"devices": devices, "users": users, "placeholders": placeholders}
+    strings = _Strings()
+    blobs = []  # (section, part, bytes)
+    header = {"version": VERSION, "created": time.time(), "sections": {}}
+    for section, values in entities.items():
+        if values is None:
+            continue
+        cls, keys = SECTIONS[section]
+        schema = _schema(cls)
+        record = struct.Struct("<" + "".join(_FORMATS[kind] for _, kind in schema))
+        values = list(values)
+        records = bytearray(record.size * len(values))
+        key_values = {key: [] for key in keys}
+        count = 0
+        for entity in values:
+            if entity is None:
+                continue
+            slots = [_slot(kind, getattr(entity, name), strings) for name, kind in schema]
+            record.pack_into(records, count * record.size, *slots)
+            for key in keys:
+                value = _key(getattr(entity, key))
+                if value is not None:
+                    key_values[key].append((value, count))
+            count += 1
+        del records[count * record.size:]
+        blobs.append((section, "records", bytes(records)))
+        for key, pairs in key_values.items():
+            pairs.sort()
+            blobs.append((section, f"index:{key}",
+                          b"".join(struct.pack("<II", strings.add(value), i) for value, i in pairs)))
+        header["sections"][section] = {"model": cls.__name__, "count": count, "schema": schema,
+                                       "format": record.format, "record_size": record.size,
+                                       "keys": {key: len(pairs) for key, pairs in key_values.items()}}
+    blobs.append((None, "strings", b"".join(strings.chunks)))
+
+    # the offsets depend on the header length, two passes
+    offsets = {}
+    for _ in range(2):
+        header["offsets"] = offsets
+        header_bytes = json.dumps(header).encode("utf-8")
+        position = len(MAGIC) + 8 + len(header_bytes)
+        position += -position % 8
+        offsets = {}
+        for section, part, data in blobs:
+            offsets[f"{section}/{part}" if section else part] = position
+            position += len(data)
+            position += -position % 8
+    header["offsets"] = offsets
+    header_bytes = json.dumps(header).encode("utf-8")
+
+    temporary = f"{path}.tmp{os.getpid()}"
+    with open(temporary, "wb") as f:
+        f.write(MAGIC + struct.pack("<II", VERSION, len(header_bytes)) + header_bytes)
+        for section, part, data in blobs:
+            f.write(b"\0" * (offsets[f"{section}/{part}" if section else part] - f.tell()))
+            f.write(data)
+    os.replace(temporary, path)
+    return header
+
+
+def capture_snapshot(client, path: str, sections: [str] = ("devices", "users", "placeholders")) -> dict:
+    """
+    write a snapshot of the listings of the client (one listing call per section)
+    """
+    loaders = {"devices": client.get_device_list, "users": client.user_list, "placeholders": client.dep_device_list}
+    return write_snapshot(path, **{section: loaders[section]() or [] for section in sections})
+
+
+class _Section(object):
+    def __init__(self, name: str, meta: dict, offsets: dict):
+        self.name = name
+        self.model = MODELS[meta["model"]]
+        self.count = meta["count"]
+        self.schema = [tuple(field) for field in meta["schema"]]
+        self.record = struct.Struct(meta["format"])
+        self.records = offsets[f"{name}/records"]
+        self.keys = {key: (offsets[f"{name}/index:{key}"], size) for key, size in meta["keys"].items()}
+        self.slots = {}  # field -> (offset in the record, struct, kind)
+        position = 0
+        for field, kind in self.schema:
+            fmt = _FORMATS[kind]
+            self.slots[field] = (position, struct.Struct("<" + fmt), kind)
+            position += struct.calcsize("<" + fmt)
+
+
+class SnapshotReader(object):
+    """
+    :param path: snapshot file written by write_snapshot
+    """
+    _INDEX_ENTRY = struct.Struct("<II")
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"{path} is empty, not a snapshot")
+        if self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a snapshot")
+        version, length = struct.unpack_from("<II", self._map, len(MAGIC))
+        if version != VERSION:
+            self.close()
+            raise ValueError(f"snapshot version {version} is not supported")
+        start = len(MAGIC) + 8
+        self.header = json.loads(self._map[start:start + length])
+        self.created = self.header["created"]
+        self._strings = self.header["offsets"]["strings"]
+        self.sections = {name: _Section(name, meta, self.header["offsets"])
+                         for name, meta in self.header["sections"].items()}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def count(self, section: str) -> int:
+        return self.sections[section].count if section in self.sections else 0
+
+    def _string(self, offset: int) -> str:
+        position = self._strings + offset
+        length, = struct.unpack_from("<I", self._map, position)
+        return self._map[position + 4:position + 4 + length].decode("utf-8")
+
+    def _value(self, kind: str, slot):
+        if kind == STR:
+            return None if slot == NO_STRING else self._string(slot)
+        if kind == JSON:
+            return None if slot == NO_STRING else loads(self._string(slot))
+        if kind == INT:
+            return None if slot == NO_INT else slot
+        if kind == FLOAT:
+            return None if slot != slot else slot
+        return None if slot == NO_BOOL else bool(slot)
+
+    def find(self, section: str, key: str, value) -> int:
+        """
+        record number of the first entity with the key value (binary search over the index), None if missing
+        """
+        part = self.sections.get(section)
+        if part is None or key not in part.keys:
+            raise KeyError(f"no index {section}.{key}")
+        start, size = part.keys[key]
+        value = f"{value}"
+        low, high = 0, size
+        while low < high:
+            middle = (low + high) // 2
+            offset, _ = self._INDEX_ENTRY.unpack_from(self._map, start + middle * 8)
+            if self._string(offset) < value:
+                low = middle + 1
+            else:
+                high = middle
+        if low < size:
+            offset, record = self._INDEX_ENTRY.unpack_from(self._map, start + low * 8)
+            if self._string(offset) == value:
+                return record
+        return None
+
+    def record(self, section: str, number: int) -> dict:
+        """
+        field values of a record as dict (field names, not the json names)
+        """
+        part = self.sections[section]
+        slots = part.record.unpack_from(self._map, part.records + number * part.record.size)
+        return {field: self._value(kind, slot) for (field, kind), slot in zip(part.schema, slots)}
+
+    def model(self, section: str, number: int):
+        return construct_model(self.sections[section].model, self.record(section, number))
+
+    def get(self, section: str, key: str, value):
+        """
+        the model with the key value, e.g. get("devices", "UDID", udid), None if missing
+        """
+        number = self.find(section, key, value)
+        return None if number is None else self.model(section, number)
+
+    def field(self, section: str, key: str, value, field: str):
+        """
+        one field of the entity with the key value, without decoding the other fields
+        """
+        number = self.find(section, key, value)
+        if number is None:
+            return None
+        part = self.sections[section]
+        position, slot, kind = part.slots[field]
+        return self._value(kind, slot.unpack_from(self._map, part.records + number * part.record.size + position)[0])
+
+    def device(self, serialNumber: str = None, UDID: str = None) -> Device:
+        if serialNumber is not None:
+            return self.get("devices", "serialNumber", serialNumber)
+        return self.get("devices", "UDID", UDID)
+
+    def user(self, username: str = None, id: int = None) -> User:
+        if username is not None:
+            return self.get("users", "username", username)
+        return self.get("users", "id", id)
+
+    def placeholder(self, serialNumber: str) -> Placeholder:
+        return self.get("placeholders", "serialNumber", serialNumber)
+
+    def iter(self, section: str):
+        for number in range(self.count(section)):
+            yield self.model(section, number)
+
+    def __repr__(self):
+        return f"SnapshotReader({self.path}, {', '.join(f'{n}={s.count}' for n, s in self.sections.items())})"
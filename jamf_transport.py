@@ -0,0 +1,262 @@
+import base64
+import json
+import re
+import threading
+import time
+from urllib.parse import urlsplit, parse_qsl
+
+"""
+
+transports for JamfSchool
+
+a transport sends the http requests of the client, request(method, url, **kwargs)
+takes the same arguments as requests.request and returns a response like object.
+
+    RequestsTransport   default, pooled requests.Session
+    RecordingTransport  wraps another transport and writes every exchange to a cassette (ndjson),
+                        credentials are scrubbed
+    ReplayTransport     answers from a cassette, with the recorded or scaled timing and payload sizes
+
+    j = JamfSchool(network_id, api_pw, url, transport=RecordingTransport("prod.ndjson"))
+    ...
+    j = JamfSchool("replay", "replay", "http://replay/api", transport=ReplayTransport("prod.ndjson", payload_scale=10))
+
+"""
+
+# first path segment of the api endpoints, everything before it is the tenant specific base url
+ENDPOINT_ROOTS = ("devices", "dep", "users", "locations", "profiles", "apps", "classes")
+
+# request fields which never get written to a cassette
+SCRUBBED_FIELDS = ("password", "api_pw", "network_id", "token")
+_PW_IN_NOTES = re.compile(r"PW: \S+")
+
+
+def endpoint_path(url: str) -> str:
+    """
+    path of the url relative to the api base, e.g. https://x.jamfcloud.com/api/devices/123 -> devices/123
+    """
+    parts = [part for part in urlsplit(url).path.split("/") if part]
+    for index, part in enumerate(parts):
+        if part in ENDPOINT_ROOTS:
+            return "/".join(parts[index:])
+    return "/".join(parts)
+
+
+def _canonical(params) -> str:
+    if not params:
+        return ""
+    if isinstance(params, dict):
+        params = params.items()
+    return "&".join(f"{key}={value}" for key, value in sorted((f"{k}", f"{v}") for k, v in params))
+
+
+def _scrub(value):
+    if isinstance(value, dict):
+        return {key: "***" if key in SCRUBBED_FIELDS else _scrub(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_scrub(item) for item in value]
+    if isinstance(value, str):
+        return _PW_IN_NOTES.sub("PW: ***", value)
+    return value
+
+
+def _scrub_body(body: str) -> str:
+    """
+    response bodies hold credentials too, e.g. the "PW: ..." notes of create_user in the user listings
+    """
+    try:
+        decoded = json.loads(body)
+    except ValueError:
+        return _PW_IN_NOTES.sub("PW: ***", body)
+    return json.dumps(_scrub(decoded), ensure_ascii=False, separators=(",", ":"))
+
+
+class RequestsTransport(object):
+    def __init__(self, session=None):
+        self._session = session
+
+    @property
+    def session(self):
+        """
+        requests.Session, created (and requests imported) on first use
+        """
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+        return self._session
+
+    def request(self, method: str, url: str, **kwargs):
+        return self.session.request(method, url, **kwargs)
+
+
+class RecordingTransport(object):
+    """
+    records every exchange as one json line:
+        method, path (relative to the api base), params, json (scrubbed), status, headers,
+        time_to_headers, download_time, body (text (scrubbed, json re-encoded) or base64)
+
+    the Authorization header and the base url are never written.
+    """
+
+    def __init__(self, path: str, inner=None):
+        self.path = path
+        self.inner = inner if inner is not None else RequestsTransport()
+        self._lock = threading.Lock()
+
+    def request(self, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        r = self.inner.request(method, url, **kwargs)
+        headers_received = time.perf_counter()
+        content = r.content
+        download_time = time.perf_counter() - headers_received
+        try:
+            body, encoding = _scrub_body(content.decode("utf-8")), "text"
+        except UnicodeDecodeError:
+            body, encoding = base64.b64encode(content).decode(), "base64"
+        query = dict(parse_qsl(urlsplit(url).query))
+        query.update(kwargs.get("params") or {})
+        record = {"method": method,
+                  "path": endpoint_path(url),
+                  "params": _scrub({f"{key}": f"{value}" for key, value in query.items()}),
+                  "json": _scrub(kwargs.get("json")),
+                  "status": r.status_code,
+                  "reason": getattr(r, "reason", ""),
+                  "headers": {key: value for key, value in r.headers.items()
+                              if key.lower() in ("content-type", "retry-after")},
+                  "time_to_headers": headers_received - start,
+                  "download_time": download_time,
+                  "encoding": encoding,
+                  "body": body}
+        line = json.dumps(record)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        return r
+
+
+class ReplayResponse(object):
+    """
+    the parts of requests.Response which JamfSchool uses.
+    the body delay is spent on the first access of content, like a streamed download.
+    """
+
+    def __init__(self, status_code: int, content: bytes, headers: dict = None, reason: str = "",
+                 download_time: float = 0.0):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.reason = reason
+        self._content = content
+        self._download_time = download_time
+
+    @property
+    def content(self) -> bytes:
+        if self._download_time:
+            time.sleep(self._download_time)
+            self._download_time = 0.0
+        return self._content
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    def json(self, **kwargs):
+        return json.loads(self.content, **kwargs)
+
+
+def scale_payload(body: bytes, factor: float) -> bytes:
+    """
+    grow (or shrink) the listings of a json response by the factor, e.g. {"devices": [...]}.
+    entries get repeated, the other fields stay the same.
+    """
+    if factor == 1:
+        return body
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return body
+    if not isinstance(data, dict):
+        return body
+    for key, value in data.items():
+        if isinstance(value, list) and value:
+            count = max(0, round(len(value) * factor))
+            data[key] = [value[i % len(value)] for i in range(count)]
+            if "count" in data:
+                data["count"] = count
+    return json.dumps(data).encode()
+
+
+class ReplayTransport(object):
+    """
+    answers requests from a cassette written by RecordingTransport.
+
+    requests are matched by method, endpoint path and parameters,
+    if there are no recorded parameters that match, by method and path only.
+    repeated requests cycle through the recorded answers.
+
+    :param path: cassette file
+    :param timing: factor for the recorded time to headers and download time,
+                   1.0 is the original timing, 0 or None answers without delay
+    :param payload_scale: factor for the number of entries of the listings,
+                          the download time grows with it
+    """
+
+    def __init__(self, path: str, timing: float = 1.0, payload_scale: float = 1.0):
+        self.timing = timing or 0.0
+        self.payload_scale = payload_scale
+        self._exact = {}
+        self._by_path = {}
+        self._position = {}
+        self._lock = threading.Lock()
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                key = (record["method"], record["path"])
+                self._exact.setdefault(key + (_canonical(record.get("params")),), []).append(record)
+                self._by_path.setdefault(key, []).append(record)
+                # scaling means decoding and encoding the whole listing, do it up front
+                # and not inside the timed / profiled calls
+                record["content"] = self._body(record)
+                del record["body"]
+
+    def __len__(self):
+        return sum(len(records) for records in self._by_path.values())
+
+    def _next(self, key: tuple, records: list) -> dict:
+        with self._lock:
+            position = self._position.get(key, 0)
+            self._position[key] = position + 1
+        return records[position % len(records)]
+
+    def _body(self, record: dict) -> bytes:
+        if record.get("encoding") == "base64":
+            body = base64.b64decode(record["body"])
+        else:
+            body = record["body"].encode("utf-8")
+        return scale_payload(body, self.payload_scale)
+
+    def request(self, method: str, url: str, **kwargs):
+        query = dict(parse_qsl(urlsplit(url).query))
+        query.update(kwargs.get("params") or {})
+        path = endpoint_path(url)
+        exact_key = (method, path, _canonical(query))
+        records = self._exact.get(exact_key)
+        key = exact_key
+        if records is None:
+            key = (method, path)
+            records = self._by_path.get(key)
+        if records is None:
+            body = json.dumps({"code": 404, "message": f"not recorded: {method} {path}"}).encode()
+            return ReplayResponse(404, body, reason="Not Found")
+
+        record = self._next(key, records)
+        if self.timing:
+            time.sleep(record.get("time_to_headers", 0.0) * self.timing)
+        return ReplayResponse(record["status"], record["content"], headers=record.get("headers"),
+                              reason=record.get("reason", ""),
+                              download_time=record.get("download_time", 0.0) * self.timing * self.payload_scale)
@@ -0,0 +1,352 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from jamf_diff import Kind, Snapshot, as_dict, diff
+from jamf_metrics import StatusRecorder, logger
+from jamf_scheduler import BULK, priority
+
+"""
+
+watch mode: keeps selected listings of a JamfSchool client fresh in the background
+
+every watched listing has its own interval, the next refresh gets a random jitter,
+so the listings don't all hit the api at the same moment. while the api throttles
+(429) or fails, the interval of the listing backs off exponentially.
+
+get() returns the last good result immediately (stale-while-revalidate): if the
+result is older than the interval a refresh is started in the background and the
+caller gets the old value. only the very first get() has to wait for the api.
+
+    watcher = Watcher(j)  # devices every 5 min, dep every 15 min, profiles hourly
+    watcher.subscribe("devices", lambda name, old, new, events: print(events))
+    watcher.start()
+    devices = watcher.get("devices")
+
+subscribers get the change events of jamf_diff for devices, users, dep and the groups,
+for the other listings events is None and the callback is called if anything changed.
+
+"""
+
+# name -> (method of JamfSchool, interval in seconds)
+DEFAULT_WATCHES = {"devices": ("get_device_list", 300), "dep": ("dep_device_list", 900),
+                   "profiles": ("get_profiles", 3600)}
+
+# listings with a snapshot kind get typed change events
+KINDS = {"get_device_list": Kind.DEVICE, "user_list": Kind.USER, "dep_device_list": Kind.PLACEHOLDER,
+         "device_groups_list": Kind.DEVICE_GROUP, "get_user_group_list": Kind.USER_GROUP}
+
+THROTTLE_STATUS = (429, 503)
+
+
+class Watch(object):
+    """
+    state of one watched listing
+    """
+
+    def __init__(self, name: str, loader, interval: float, kind: str = None, jitter: float = 0.1,
+                 max_backoff: float = 3600):
+        """
+        :param name: name for get() and subscribe()
+        :param loader: callable without arguments which returns the listing
+        :param interval: seconds between two refreshes
+        :param kind: jamf_diff Kind of the entries, for typed change events
+        :param jitter: random part of the interval (0.1: +-10%)
+        :param max_backoff: upper limit of the interval while the api throttles or fails
+        """
+        self.name = name
+        self.loader = loader
+        self.interval = interval
+        self.kind = kind
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+        self.value = None
+        self.snapshot: Snapshot = None
+        self.loaded = 0.0
+        self.due = 0.0
+        self.failures = 0
+        self.throttled = 0
+        self.refreshes = 0
+        self.error = None
+        self.refreshing = False
+        self.subscribers = []
+        self.ready = threading.Event()
+        self.lock = threading.Lock()
+        # (key function, value, {key: index in value}), see positions()
+        self._positions = None
+
+    @property
+    def stale(self) -> bool:
+        return not self.ready.is_set() or time.time() - self.loaded >= self.interval
+
+    def positions(self, key) -> dict:
+        """
+        {key(entity): index} of the current value, built once per value and key function
+        (call with the lock held)
+        """
+        cached = self._positions
+        if cached is None or cached[0] is not key or cached[1] is not self.value:
+            cached = self._positions = (key, self.value, {key(entity): index
+                                                         for index, entity in enumerate(self.value or [])})
+        return cached[2]
+
+    def schedule(self, now: float = None):
+        now = time.time() if now is None else now
+        delay = self.interval
+        if self.failures:
+            delay = min(max(self.interval, 1.0) * 2 ** self.failures, self.max_backoff)
+        self.due = now + delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+
+class Watcher(object):
+    """
+    :param client: JamfSchool instance
+    :param watches: {name: (method name of the client, interval)}, defaults to DEFAULT_WATCHES
+    :param workers: refreshes which may run at the same time
+    :param jitter: default jitter of the watches
+    """
+
+    def __init__(self, client, watches: dict = None, workers: int = 2, jitter: float = 0.1):
+        self.client = client
+        self.jitter = jitter
+        self.watches: {str: Watch} = {}
+        self._statuses = StatusRecorder()
+        client.hooks.append(self._statuses)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="jamf-watch")
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        for name, (method, interval) in (DEFAULT_WATCHES if watches is None else watches).items():
+            self.watch(name, method, interval)
+
+    def watch(self, name: str, method, interval: float, kind: str = None, **kwargs) -> Watch:
+        """
+        add a listing
+
+        :param name: name for get() and subscribe()
+        :param method: method name of the client (e.g. "user_list") or a callable
+        :param interval: seconds between two refreshes
+        :param kind: jamf_diff Kind, derived from the method name if not given
+        :param kwargs: arguments of the client method, e.g. location
+        """
+        if isinstance(method, str):
+            kind = kind or KINDS.get(method)
+            bound = getattr(self.client, method)
+            loader = (lambda: bound(**kwargs)) if kwargs else bound
+        else:
+            loader = method
+        watch = Watch(name, loader, interval, kind=kind, jitter=self.jitter)
+        self.watches[name] = watch
+        self._wakeup.set()
+        return watch
+
+    def subscribe(self, name: str, callback):
+        """
+        callback(name, old, new, events) after every refresh which changed the listing.
+        events is the list of jamf_diff ChangeEvents or None for listings without a kind.
+        """
+        self.watches[name].subscribers.append(callback)
+
+    def get(self, name: str, wait: bool = True, timeout: float = None):
+        """
+        the last good result, a stale result triggers a background refresh
+
+        :param wait: wait for the first result if there is none yet (otherwise return None)
+        :param timeout: seconds to wait for the first result
+        """
+        watch = self.watches[name]
+        if watch.stale:
+            self._submit(watch)
+        if not watch.ready.is_set() and wait:
+            watch.ready.wait(timeout)
+        return watch.value
+
+    def refresh(self, name: str):
+        """
+        refresh now, in the calling thread
+
+        :return: True if a new result was loaded
+        """
+        return self._refresh(self.watches[name])
+
+    def invalidate(self, name: str):
+        """
+        refresh the listing as soon as possible, get() still returns the old result until then
+        """
+        watch = self.watches[name]
+        watch.due = 0.0
+        watch.loaded = 0.0
+        self._wakeup.set()
+
+    def patch(self, name: str, key, upserts: list = (), removals: list = ()) -> bool:
+        """
+        apply single entity changes (e.g. from a webhook) to the current result without a refresh,
+        subscribers get notified like after a refresh (with the events of the patched entities only).
+
+        :param key: key(entity) -> identity, e.g. lambda device: device.UDID, pass the same function
+                    every time, the index of the result is kept per key function
+        :param upserts: entities which replace the entity with the same key or get appended
+        :param removals: keys of entities to drop
+        :return: False if there is no result yet to patch
+        """
+        watch = self.watches[name]
+        with watch.lock:
+            if not watch.ready.is_set():
+                return False
+            old, old_snapshot = watch.value, watch.snapshot
+            positions = dict(watch.positions(key))
+            value = list(old)
+            for entity in upserts:
+                identity = key(entity)
+                index = positions.get(identity)
+                if index is None:
+                    positions[identity] = len(value)
+                    value.append(entity)
+                else:
+                    value[index] = entity
+            removed = [positions[identity] for identity in set(removals) if identity in positions]
+            if removed:
+                for index in sorted(removed, reverse=True):
+                    del value[index]
+                positions = None
+            snapshot = old_snapshot.patched(upserts, removals) if old_snapshot is not None else None
+            watch.value, watch.snapshot = value, snapshot
+            watch._positions = None if positions is None else (key, value, positions)
+        keys = None
+        if snapshot is not None:
+            keys = [snapshot.key_of(entity) for entity in upserts] + list(removals)
+        self._notify(watch, old, old_snapshot, value, snapshot, keys=keys)
+        return True
+
+    def entity(self, name: str, key, identity):
+        """
+        the entity of the current result with key(entity) == identity, None if there is none
+        """
+        watch = self.watches.get(name)
+        if watch is None:
+            return None
+        with watch.lock:
+            if watch.value is None:
+                return None
+            index = watch.positions(key).get(identity)
+            return None if index is None else watch.value[index]
+
+    def _submit(self, watch: Watch):
+        with watch.lock:
+            if watch.refreshing:
+                return
+            watch.refreshing = True
+        self._executor.submit(self._refresh, watch, True)
+
+    def _refresh(self, watch: Watch, submitted: bool = False) -> bool:
+        if not submitted:
+            with watch.lock:
+                if watch.refreshing:
+                    return False
+                watch.refreshing = True
+        self._statuses.begin()
+        try:
+            try:
+                # background refreshes must not delay interactive calls on the same client
+                with priority(BULK):
+                    value = watch.loader()
+                error = None
+            except Exception as e:
+                value, error = None, e
+            statuses = self._statuses.end()
+            throttled = any(status in THROTTLE_STATUS for status in statuses)
+            failed = any(status is None or status >= 400 for status in statuses)
+            # the client signals some errors with None or [None]
+            if error is None and (value is None or (value and all(entry is None for entry in value))):
+                error = ValueError(f"{watch.name} could not be loaded")
+            if error is not None or throttled or failed:
+                watch.failures += 1
+                watch.throttled += throttled
+                watch.error = f"{error}" if error is not None else f"http status {statuses}"
+                logger.warning("watch %s failed (%s), next try in %.0fs", watch.name, watch.error,
+                               min(max(watch.interval, 1.0) * 2 ** watch.failures, watch.max_backoff))
+                watch.schedule()
+                return False
+
+            old, old_snapshot = watch.value, watch.snapshot
+            snapshot = Snapshot(watch.kind, value) if watch.kind else None
+            watch.value, watch.snapshot = value, snapshot
+            watch.loaded = time.time()
+            watch.failures = 0
+            watch.error = None
+            watch.refreshes += 1
+            watch.schedule(watch.loaded)
+            first = not watch.ready.is_set()
+            watch.ready.set()
+            if not first:
+                self._notify(watch, old, old_snapshot, value, snapshot)
+            return True
+        finally:
+            with watch.lock:
+                watch.refreshing = False
+            self._wakeup.set()
+
+    def _notify(self, watch: Watch, old, old_snapshot: Snapshot, new, snapshot: Snapshot, keys: list = None):
+        if not watch.subscribers:
+            return
+        if snapshot is not None:
+            events = diff(old_snapshot, snapshot, keys=keys)
+            if not events:
+                return
+        else:
+            events = None
+            if [as_dict(entry) for entry in old or []] == [as_dict(entry) for entry in new or []]:
+                return
+        for callback in watch.subscribers:
+            try:
+                callback(watch.name, old, new, events)
+            except Exception:
+                logger.exception("watch subscriber %r failed", callback)
+
+    def run(self):
+        """
+        the scheduler loop, blocks until stop() is called
+        """
+        while not self._stop.is_set():
+            now = time.time()
+            for watch in list(self.watches.values()):
+                if watch.due <= now and not watch.refreshing:
+                    self._submit(watch)
+            due = [watch.due for watch in self.watches.values() if not watch.refreshing]
+            self._wakeup.clear()
+            self._wakeup.wait(max(0.0, min(due) - time.time()) if due else None)
+
+    def start(self) -> threading.Thread:
+        """
+        run the scheduler in a background thread, the first refresh of every listing starts immediately
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="jamf-watch-scheduler", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self, wait: bool = True):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None and wait:
+            self._thread.join()
+        self._executor.shutdown(wait=wait)
+        if self._statuses in self.client.hooks:
+            self.client.hooks.remove(self._statuses)
+
+    def stats(self) -> dict:
+        now = time.time()
+        return {name: {"entries": None if watch.value is None else len(watch.value),
+                       "age": now - watch.loaded if watch.ready.is_set() else None,
+                       "next_refresh_in": watch.due - now, "refreshes": watch.refreshes,
+                       "failures": watch.failures, "throttled": watch.throttled, "error": watch.error}
+                for name, watch in self.watches.items()}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
@@ -0,0 +1,364 @@
+import argparse
+import hashlib
+import hmac
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from pydantic import ValidationError
+
+from jamf_metrics import entry_label, logger
+from jamf_objects import Device, Placeholder, User, WebhookEvent, model_to_dict
+
+"""
+
+webhook receiver for jamf school events
+
+jamf school pushes events (device enrolled, checked in, owner changed, ...) as json posts.
+the receiver checks the signature (hmac sha256 of the body with the shared secret in the
+X-Jamf-Signature header), parses the event into a WebhookEvent with the Device / User /
+Placeholder models and applies it to the sinks:
+
+    ClientSink      users cache and app_index of a JamfSchool client
+    WatcherSink     results of a jamf_watch.Watcher (patched in place, subscribers get the change events)
+
+events which can't be applied as a targeted update invalidate the affected listings instead.
+
+    receiver = WebhookReceiver("secret", sinks=[ClientSink(j), WatcherSink(watcher)], port=8089)
+    receiver.start()
+
+for tests and local development send_event() is a stand-in for the jamf school sender:
+
+    send_event(receiver.url, "secret", "DeviceOwnerChanged", device={"UDID": "...", "owner": {...}})
+
+handle(body, headers) can be used to embed the receiver into an existing web app.
+
+"""
+
+SIGNATURE_HEADER = "X-Jamf-Signature"
+
+DEVICE_ENROLLED = "DeviceEnrolled"
+DEVICE_UNENROLLED = "DeviceUnenrolled"
+DEVICE_CHECKIN = "DeviceCheckIn"
+DEVICE_INFORMATION_UPDATED = "DeviceInformationUpdated"
+DEVICE_OWNER_CHANGED = "DeviceOwnerChanged"
+DEVICE_GROUPS_CHANGED = "DeviceGroupMembershipChanged"
+DEVICE_MOVED_TO_TRASH = "DeviceMovedToTrash"
+DEVICE_APPS_UPDATED = "DeviceAppsUpdated"
+USER_CREATED = "UserCreated"
+USER_UPDATED = "UserUpdated"
+USER_DELETED = "UserDeleted"
+DEP_DEVICE_ADDED = "DEPDeviceAdded"
+DEP_DEVICE_UPDATED = "DEPDeviceUpdated"
+
+DEVICE_EVENTS = (DEVICE_ENROLLED, DEVICE_CHECKIN, DEVICE_INFORMATION_UPDATED, DEVICE_OWNER_CHANGED,
+                 DEVICE_GROUPS_CHANGED, DEVICE_APPS_UPDATED)
+DEVICE_REMOVAL_EVENTS = (DEVICE_UNENROLLED, DEVICE_MOVED_TO_TRASH)
+USER_EVENTS = (USER_CREATED, USER_UPDATED)
+DEP_EVENTS = (DEP_DEVICE_ADDED, DEP_DEVICE_UPDATED)
+
+
+class WebhookError(ValueError):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def sign(secret: str, body: bytes) -> str:
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def verify(secret: str, body: bytes, signature: str) -> bool:
+    return signature is not None and hmac.compare_digest(sign(secret, body), signature.strip())
+
+
+def merge(model, changes: dict, cls):
+    """
+    model with the changed fields of a partial event payload
+
+    :param model: the cached model or None
+    :param changes: api shaped dict with the fields of the event
+    :param cls: model class
+    """
+    data = model_to_dict(model, by_alias=True) if model is not None else {}
+    data.update(changes)
+    return cls(**data)
+
+
+def parse_event(body: bytes) -> WebhookEvent:
+    """
+    :raises WebhookError: the body is no valid event
+    """
+    try:
+        payload = json.loads(body)
+    except ValueError as e:
+        raise WebhookError(400, f"no json: {e}")
+    if not isinstance(payload, dict):
+        raise WebhookError(400, "event is no json object")
+    event = payload.get("event") or payload.get("data") or {}
+    try:
+        return WebhookEvent(type=payload.get("type"), eventId=payload.get("eventId"),
+                            timestamp=payload.get("timestamp"), event=event,
+                            device=event.get("device"), user=event.get("user"),
+                            placeholder=event.get("placeholder"))
+    except (TypeError, ValidationError) as e:
+        raise WebhookError(422, f"invalid event {entry_label(event.get('device') or event.get('user') or event)}: "
+                                f"{' '.join(f'{e}'.splitlines()[:3])}")
+
+
+class WebhookSink(object):
+    def apply(self, event: WebhookEvent):
+        pass
+
+
+class ClientSink(WebhookSink):
+    """
+    keeps the caches of a JamfSchool client up to date: users (find_similar_users) and the app_index
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def apply(self, event: WebhookEvent):
+        changes = event.event or {}
+        if event.type in DEVICE_EVENTS and event.device is not None and event.device.UDID:
+            index = self.client.app_index
+            if event.device.apps is not None and "locationId" in changes["device"]:
+                index.add_device(event.device)
+            elif event.device.UDID in index:
+                # partial update, keep what the event doesn't contain
+                index.update_device(event.device.UDID, locationId=event.device.locationId,
+                                    groups=event.device.groups, apps=event.device.apps)
+        elif event.type in DEVICE_REMOVAL_EVENTS and event.device is not None:
+            self.client.app_index.remove_device(event.device.UDID)
+        elif event.type in USER_EVENTS + (USER_DELETED,) and event.user is not None:
+            users = self.client.users
+            if users is None:
+                return
+            others = [user for user in users if user.id != event.user.id]
+            if event.type != USER_DELETED:
+                old = next((user for user in users if user.id == event.user.id), None)
+                others.append(merge(old, changes["user"], User))
+            self.client.users = others
+
+
+def _device_key(device) -> str:
+    return device.UDID
+
+
+def _user_key(user) -> int:
+    return user.id
+
+
+def _placeholder_key(placeholder) -> str:
+    return placeholder.serialNumber
+
+
+class WatcherSink(WebhookSink):
+    """
+    patches the results of a Watcher, unknown events invalidate the listings
+
+    :param names: watch names of the listings {"devices": ..., "users": ..., "dep": ...}
+    """
+
+    def __init__(self, watcher, names: dict = None):
+        self.watcher = watcher
+        self.names = dict({"devices": "devices", "users": "users", "dep": "dep"}, **(names or {}))
+
+    def _current(self, name: str, key, value):
+        # keyed index of the watch, kept up to date by patch()
+        return self.watcher.entity(name, key, value)
+
+    def apply(self, event: WebhookEvent):
+        changes = event.event or {}
+        devices, users, dep = self.names["devices"], self.names["users"], self.names["dep"]
+        if event.type in DEVICE_EVENTS + DEVICE_REMOVAL_EVENTS and event.device is not None and event.device.UDID:
+            if devices not in self.watcher.watches:
+                return
+            key = _device_key
+            if event.type in DEVICE_REMOVAL_EVENTS and event.type != DEVICE_MOVED_TO_TRASH:
+                self.watcher.patch(devices, key, removals=[event.device.UDID])
+                return
+            device = merge(self._current(devices, key, event.device.UDID), changes["device"], Device)
+            if event.type == DEVICE_MOVED_TO_TRASH:
+                device = merge(device, {"inTrash": True}, Device)
+            if not self.watcher.patch(devices, key, upserts=[device]):
+                self.watcher.invalidate(devices)
+        elif event.type in USER_EVENTS + (USER_DELETED,) and event.user is not None:
+            if users not in self.watcher.watches:
+                return
+            key = _user_key
+            if event.type == USER_DELETED:
+                self.watcher.patch(users, key, removals=[event.user.id])
+                return
+            user = merge(self._current(users, key, event.user.id), changes["user"], User)
+            if not self.watcher.patch(users, key, upserts=[user]):
+                self.watcher.invalidate(users)
+        elif event.type in DEP_EVENTS and event.placeholder is not None:
+            if dep not in self.watcher.watches:
+                return
+            key = _placeholder_key
+            placeholder = merge(self._current(dep, key, event.placeholder.serialNumber), changes["placeholder"],
+                                Placeholder)
+            if not self.watcher.patch(dep, key, upserts=[placeholder]):
+                self.watcher.invalidate(dep)
+        else:
+            # no targeted update possible, refresh what could be affected
+            for name in (devices, users, dep):
+                if name in self.watcher.watches:
+                    self.watcher.invalidate(name)
+
+
+class WebhookReceiver(object):
+    """
+    an event is remembered (and retries of the sender are dropped) only after every sink applied it,
+    if a sink fails the receiver answers 500 and the sender retries (sinks which succeeded before get
+    the event again, their updates are idempotent)
+
+    :param secret: shared secret of the webhook
+    :param insecure: allow secret=None (no signature check), only for local tests
+    :param sinks: WebhookSink objects which get the events
+    :param host:
+    :param port: 0 picks a free port
+    :param path: url path of the webhook
+    :param max_body: larger posts are rejected
+    :param remember: event ids to remember, retries of the sender are applied only once
+    """
+
+    def __init__(self, secret: str = None, sinks: [WebhookSink] = None, host: str = "127.0.0.1", port: int = 0,
+                 path: str = "/webhook", max_body: int = 1 << 20, remember: int = 10000, insecure: bool = False):
+        if secret is None and not insecure:
+            raise ValueError("a webhook secret is needed, pass insecure=True to accept unsigned events")
+        self.secret = secret
+        self.sinks: [WebhookSink] = list(sinks or [])
+        self.host = host
+        self.port = port
+        self.path = path
+        self.max_body = max_body
+        self.remember = remember
+        self.counters = {"received": 0, "applied": 0, "duplicates": 0, "rejected": 0, "failed": 0}
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+        self._server = None
+
+    def handle(self, body: bytes, headers) -> (int, str):
+        """
+        check, parse and apply one webhook post
+
+        :param body: raw request body
+        :param headers: request headers (mapping)
+        :return: (http status, message)
+        """
+        self.counters["received"] += 1
+        try:
+            if self.secret is not None and not verify(self.secret, body, headers.get(SIGNATURE_HEADER)):
+                raise WebhookError(401, "invalid signature")
+            event = parse_event(body)
+        except WebhookError as e:
+            self.counters["rejected"] += 1
+            logger.warning("webhook rejected: %s", e)
+            return e.status, f"{e}"
+
+        with self._lock:
+            if event.eventId is not None and event.eventId in self._seen:
+                self.counters["duplicates"] += 1
+                return 200, "duplicate"
+            for sink in self.sinks:
+                try:
+                    sink.apply(event)
+                except Exception:
+                    logger.exception("webhook sink %r failed for %s", sink, event.type)
+                    self.counters["failed"] += 1
+                    # not remembered, the retry of the sender applies it again
+                    return 500, f"sink {type(sink).__name__} failed"
+            if event.eventId is not None:
+                self._seen[event.eventId] = True
+                if len(self._seen) > self.remember:
+                    self._seen.popitem(last=False)
+            self.counters["applied"] += 1
+        return 200, "ok"
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}{self.path}"
+
+    def start(self):
+        """
+        serve in a background thread
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path.split("?")[0] != receiver.path:
+                    self.send_error(404)
+                    return
+                length = int(self.headers.get("Content-Length") or 0)
+                if length > receiver.max_body:
+                    self.send_error(413)
+                    return
+                status, message = receiver.handle(self.rfile.read(length), self.headers)
+                body = json.dumps({"message": message}).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", f"{len(body)}")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+
+def send_event(url: str, secret: str, type: str, eventId: str = None, timeout: float = 10.0, **event) -> int:
+    """
+    stand-in for the jamf school sender: post a signed event
+
+        send_event(url, "secret", "DeviceCheckIn", device={"UDID": "...", "lastCheckin": "..."})
+
+    :return: http status of the receiver
+    """
+    from urllib.error import HTTPError
+    from urllib.request import Request, urlopen
+
+    body = json.dumps({"type": type, "eventId": eventId, "timestamp": int(time.time()), "event": event}).encode()
+    headers = {"Content-Type": "application/json"}
+    if secret is not None:
+        headers[SIGNATURE_HEADER] = sign(secret, body)
+    try:
+        with urlopen(Request(url, data=body, headers=headers, method="POST"), timeout=timeout) as response:
+            return response.status
+    except HTTPError as e:
+        return e.code
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="send a signed test event to a webhook receiver")
+    parser.add_argument('url')
+    parser.add_argument('type')
+    parser.add_argument('--secret', default=None)
+    parser.add_argument('--device', default=None, help="device fields as json")
+    parser.add_argument('--user', default=None, help="user fields as json")
+    args = parser.parse_args()
+
+    fields = {name: json.loads(getattr(args, name)) for name in ("device", "user") if getattr(args, name)}
+    print(send_event(args.url, args.secret, args.type, **fields))